@@ -0,0 +1,269 @@
+"""
+Lookup of stored analyses (see analysis_store.py) by canonical reference.
+
+Analyses are stored under the formatted reference ("John 3:16", "요한복음 3:16-18"), so matching the
+raw text missed "Jn 3:16", "john 3 16" and "John 3:16-16". Lookups here go by the cache key
+(book number, chapter, start verse, end verse, language) instead:
+
+    exact        the same passage, however it was written
+    containment  the smallest stored range or whole chapter that covers the requested verses;
+                 the response is narrowed to the requested verses and names the stored passage
+                 in covering_reference
+
+Both are index seeks in the analysis store, into which queries.csv is imported on first use.
+The verses of a stored analysis are read from the translation's verse store (passage_verses).
+find_in_languages looks a passage up in other languages, for analyses translated on a miss.
+"""
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import canon
+import pipeline_metrics
+import verse_store
+from analysis_store import MIGRATION_SOURCES, AnalysisStore, Passage
+from book_resolver import resolve_book
+from reference_parser import parse_reference
+
+# (book number, chapter, start verse, end verse, language); a whole chapter has no verses
+CacheKey = Tuple[int, int, Optional[int], Optional[int], str]
+
+# Stored references are always "<book> <chapter>[:<start>[-<end>]]" (see format_reference)
+_STORED_RE = re.compile(r'(.+?)\s+(\d+)(?::(\d+)(?:-(\d+))?)?')
+
+# Key of the verse number in the verses each translation's query module returns
+_VERSE_NUMBER_KEYS = {'mal1910': 'verse'}
+
+
+def cache_key(book, chapter: int, start_verse: Optional[int], end_verse: Optional[int],
+              language: str) -> Optional[CacheKey]:
+    """
+    Builds the key for a passage. book is a canonical number or any name the book resolver knows.
+    A single verse is keyed as a one-verse range, so "John 3:16" and "John 3:16-16" are the same.
+    """
+    if not isinstance(book, int):
+        book = resolve_book(str(book))
+        if book is None:
+            return None
+    if start_verse is None:
+        end_verse = None
+    elif end_verse is None:
+        end_verse = start_verse
+    if start_verse is not None:
+        start_verse, end_verse = int(start_verse), int(end_verse)
+    return (book, int(chapter), start_verse, end_verse, language)
+
+
+def stored_key(reference: str, language: str) -> Optional[CacheKey]:
+    """
+    Key of a reference as written in the CSV.
+    """
+    match = _STORED_RE.fullmatch(reference.strip())
+    if match is None:
+        return None
+    book, chapter, start_verse, end_verse = match.groups()
+    return cache_key(book, int(chapter), int(start_verse) if start_verse else None,
+                     int(end_verse) if end_verse else None, language)
+
+
+def input_key(user_input: str, language: str) -> Optional[CacheKey]:
+    """
+    Key of a well-formed reference typed by the user, or None if the local parser can't read it.
+    """
+    translation = canon.LANGUAGE_TRANSLATIONS.get(language)
+    if translation is None:
+        return None
+    parsed = parse_reference(user_input, translation)
+    if parsed is None:
+        return None
+    return cache_key(parsed.book, parsed.chapter, parsed.start_verse, parsed.end_verse, language)
+
+
+def format_key(key: CacheKey) -> str:
+    """
+    Formats a key the way references are stored, in the book names of the language's translation.
+    """
+    book, chapter, start_verse, end_verse, language = key
+    translation = canon.LANGUAGE_TRANSLATIONS.get(language, 'kjv')
+    reference = f"{canon.book_name(book, translation)} {chapter}"
+    if start_verse is not None:
+        reference += f":{start_verse}"
+        if end_verse != start_verse:
+            reference += f"-{end_verse}"
+    return reference
+
+
+def key_in_language(key: CacheKey, language: str) -> Optional[CacheKey]:
+    """
+    Key of the same passage in another language, in that language's verse numbering, or None
+    when the verses of the chapter are not known to line up (see canon.is_aligned).
+    """
+    book, chapter, start_verse, end_verse, source = key
+    if start_verse is not None:
+        source_translation = canon.LANGUAGE_TRANSLATIONS[source]
+        if not canon.is_aligned(source_translation, book, chapter):
+            return None
+        _, chapter, start_verse = canon.split_verse_id(canon.to_canonical(source_translation, book, chapter, start_verse))
+        end_verse = canon.split_verse_id(canon.to_canonical(source_translation, book, key[1], end_verse))[2]
+        if not canon.is_aligned(canon.LANGUAGE_TRANSLATIONS[language], book, chapter):
+            return None
+        chapter, start_verse, end_verse = canon.to_translation(canon.LANGUAGE_TRANSLATIONS[language], book, chapter,
+                                                               start_verse, end_verse)
+    return (book, chapter, start_verse, end_verse, language)
+
+
+def _narrow(response: Dict[str, Any], key: CacheKey) -> Optional[Dict[str, Any]]:
+    """
+    Copies a stored response for a passage that covers key, keeping only the requested verses.
+    """
+    passages = [passage for passage in response["retrieved_passages"]
+                if key[2] <= int(passage.get("verse_num", passage.get("verse", 0))) <= key[3]]
+    if not passages:
+        return None
+    narrowed = dict(response)
+    narrowed["covering_reference"] = response["requested_reference"]
+    narrowed["requested_reference"] = format_key(key)
+    narrowed["retrieved_passages"] = passages
+    return narrowed
+
+
+def stored_passage(reference: str, language: str) -> Optional[Passage]:
+    """
+    Canonical passage of a stored reference, as kept in the analysis store.
+    """
+    key = stored_key(reference, language)
+    return key[:4] if key is not None else None
+
+
+def passage_verses(passage: Passage, language: str) -> List[Dict]:
+    """
+    The verses of a stored passage, as the language's pipeline fetches them.
+    """
+    translation = canon.LANGUAGE_TRANSLATIONS.get(language)
+    if translation is None:
+        return []
+    book, chapter, start_verse, end_verse = passage
+    number_key = _VERSE_NUMBER_KEYS.get(translation, 'verse_num')
+    try:
+        verses = verse_store.get_store(translation).get_verses(canon.book_name(book, translation), chapter,
+                                                               start_verse, end_verse)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error reading verses for {passage} ({language}): {e}")
+        return []
+    return [{number_key: verse_num, 'text': text} for verse_num, text in verses]
+
+
+_store = None
+_store_lock = threading.Lock()
+_stats = {'exact_hits': 0, 'contained_hits': 0, 'text_hits': 0, 'misses': 0}
+
+
+def get_store() -> AnalysisStore:
+    """
+    Returns the shared analysis store, importing the CSV files it has not imported yet.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = AnalysisStore(verses_of=passage_verses)
+                # Another process may import the same file meanwhile; its rows are then skipped
+                for source in store.pending_migrations(MIGRATION_SOURCES):
+                    added, skipped = store.import_csv(source, stored_passage)
+                    print(f"Imported {source}: {added} analyses added, {skipped} skipped")
+                _store = store
+    return _store
+
+
+def _count(name: str):
+    with _store_lock:
+        _stats[name] += 1
+
+
+def find_key(key: CacheKey, contained: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Returns the stored analysis for key, or one narrowed from a stored passage covering it.
+    """
+    store = get_store()
+    response = store.find_passage(key[:4], key[4])
+    if response is not None:
+        _count('exact_hits')
+        return response
+    if contained and key[2] is not None:
+        for _, covering in store.find_covering(key[:4], key[4]):
+            narrowed = _narrow(covering, key)
+            if narrowed is not None:
+                _count('contained_hits')
+                return narrowed
+    _count('misses')
+    return None
+
+
+def find_in_languages(key: CacheKey, languages) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Returns (language, analysis) for the first of languages with an analysis of exactly key's
+    passage that was not itself translated, or None.
+    """
+    store = get_store()
+    for language in languages:
+        if language == key[4] or language not in canon.LANGUAGE_TRANSLATIONS:
+            continue
+        other = key_in_language(key, language)
+        if other is None:
+            continue
+        with pipeline_metrics.span('cache_lookup'):
+            response = store.find_passage(other[:4], language)
+        if response is not None and "translated_from" not in response:
+            return language, response
+    return None
+
+
+def find_text(reference: str, language: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the analysis stored under exactly this text, for inputs that have no key.
+    """
+    response = get_store().find_text(reference, language)
+    _count('text_hits' if response is not None else 'misses')
+    return response
+
+
+def find_reference(reference, language: str) -> Optional[Dict[str, Any]]:
+    """
+    Looks up a parsed BibleReference (any language module's) in the analysis store.
+    """
+    print(f"Searching analyses for reference: {reference.book} {reference.chapter}:{reference.start_verse}-{reference.end_verse}")  # Debugging statement
+    key = cache_key(reference.book, reference.chapter, reference.start_verse, reference.end_verse, language)
+    with pipeline_metrics.span('cache_lookup'):
+        return find_key(key) if key is not None else None
+
+
+def find_input(user_input: str, language: str) -> Optional[Dict[str, Any]]:
+    """
+    Looks up what the user typed: by key when it is a well-formed reference, else by the stored text.
+    """
+    print(f"Searching analyses for user input: {user_input}, language: {language}")  # Debugging statement
+    with pipeline_metrics.span('cache_lookup'):
+        key = input_key(user_input, language)
+        if key is not None:
+            return find_key(key)
+        return find_text(user_input, language)
+
+
+def store_analysis(reference: str, language: str, verses: List[Dict], analysis: str, explanation: str,
+                   related_verses: str, source: str = 'app') -> bool:
+    """
+    Stores a new analysis under its formatted reference and canonical passage, and waits until it
+    is committed. Raises WriterBusy or TimeoutError if the writer is overloaded.
+    """
+    return get_store().add(reference, language, stored_passage(reference, language), verses,
+                           analysis, explanation, related_verses, source)
+
+
+def get_stats() -> Dict[str, int]:
+    with _store_lock:
+        stats = dict(_stats)
+    lookups = sum(stats.values())
+    stats['hit_rate'] = (lookups - stats['misses']) / lookups if lookups else 0.0
+    stats['analyses'] = get_store().count()
+    stats['writer'] = get_store().get_stats()
+    return stats
@@ -0,0 +1,432 @@
+"""
+Analysis pipeline shared by every language, with three ways of calling the LLM:
+
+    classic     parse the reference (locally, else with the parser chain), fetch the verses, then one
+                free-text explanation call that the language module splits into sections
+    structured  one JSON call returning every section at once; when the input is not a well-formed
+                reference the same call also returns the reference, so no separate parse call is made
+    sections    parse and fetch as in classic, then one small call per section, run concurrently
+
+The mode is set per language with PIPELINE_MODE_<LANG> (e.g. PIPELINE_MODE_KO=sections), falling
+back to PIPELINE_MODE and then to classic. bench_pipeline.py compares latency and tokens per mode.
+
+Before any of them, a passage with no stored analysis in the requested language but one in a
+TRANSLATE_FROM language (English by default) gets that analysis translated, which takes three
+translation calls instead of an analysis. The result is stored with its provenance (translated_from).
+"""
+import json
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import analysis_cache
+import canon
+import llm_clients
+import pipeline_metrics
+import recent_queries
+import singleflight
+from analysis_store import TRANSLATED_PREFIX, WriterBusy
+from book_resolver import resolve_book
+from reference_parser import parse_reference
+
+PIPELINE_MODES = ('classic', 'structured', 'sections')
+
+# Sections of an analysis. English pages also show background and a map of the locations.
+ALL_SECTIONS = ('themes', 'explanation', 'related_verses', 'background', 'locations')
+CORE_SECTIONS = ('themes', 'explanation', 'related_verses')
+
+# Languages whose stored analyses are translated on a miss, in order of preference; empty turns it off.
+# Only English by default: its analyses come from the largest model, and the English page expects their layout.
+TRANSLATE_FROM = [language.strip() for language in os.getenv("TRANSLATE_FROM", "en").split(',') if language.strip()]
+SOURCE_LANGUAGE_NAMES = {'en': 'English', 'ko': 'Korean', 'ne': 'Nepali', 'mal': 'Malayalam'}
+TRANSLATION_MODEL = "llama-3.3-70b-versatile"
+
+# Concurrent requests for the same input or passage share one parse or one analysis
+PARSES = singleflight.Group('parse')
+ANALYSES = singleflight.Group('analysis')
+
+
+@dataclass
+class LanguagePipeline:
+    language: str         # session and cache language code ('en', 'ko', 'ne', 'mal')
+    translation: str      # verse store translation
+    language_name: str    # output language, as written in prompts
+    model: str
+    reference_cls: type   # the language module's BibleReference
+    parse: Callable[[str], Any]                           # step 2, raises ValueError
+    fetch: Callable[[Any, str], List[Dict[str, str]]]    # step 3: (reference, api key) -> verses
+    explain: Callable[[str, str], Tuple[str, str, str]]  # classic step 4: -> (analysis, explanation, related verses)
+    sections: Tuple[str, ...] = CORE_SECTIONS
+
+
+def get_pipeline_mode(language: str) -> str:
+    mode = os.getenv(f"PIPELINE_MODE_{language.upper()}") or os.getenv("PIPELINE_MODE") or 'classic'
+    if mode not in PIPELINE_MODES:
+        print(f"Unknown pipeline mode {mode!r} for {language}, using classic")
+        return 'classic'
+    return mode
+
+
+def format_reference(reference) -> str:
+    """
+    Formats a reference the way it is stored in the analysis cache, e.g. "John 3:16-18".
+    """
+    requested_reference = f"{reference.book} {reference.chapter}"
+    if reference.start_verse is not None:
+        requested_reference += f":{reference.start_verse}"
+        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
+            requested_reference += f"-{reference.end_verse}"
+    return requested_reference
+
+
+def save_analysis(requested_reference: str, language: str, verses: List[Dict[str, str]], analysis: str,
+                  explanation: str, related_verses: str, source: str = 'app'):
+    """
+    Stores an analysis in the analysis store (see analysis_store.py).
+    """
+    try:
+        with pipeline_metrics.span('cache_write'):
+            added = analysis_cache.store_analysis(requested_reference, language, verses, analysis, explanation,
+                                                  related_verses, source)
+    except (WriterBusy, TimeoutError, sqlite3.Error) as e:
+        # The user still gets the analysis; it is generated again next time
+        print(f"Error storing analysis {requested_reference}: {e}")
+        return
+    if added:
+        recent_queries.record_analysis(requested_reference, language)
+    print(f"Stored analysis: {requested_reference}")  # Debugging statement
+
+
+def passage_text(verses: List[Dict[str, str]]) -> str:
+    """
+    Joins the verse texts (without verse numbers) into the text given to the analysis calls.
+    """
+    all_text = ""
+    for verse in verses:
+        all_text += f"{verse['text']}\n"  # Only append the verse text, not the verse number
+    return all_text
+
+
+TRANSLATION_TEMPLATE = """
+Translate the following text from {source_language} to {target_language} in the actual target script,
+so if the target language is Korean, provide the text in Hangul script.
+If a biblical verse including book name, chapter AND verse or verses is found, keep it unchanged in the translated text.
+
+Text: {text}
+
+Translated Text: [translated text with Bible verses unchanged]"""
+
+# Bible verses (e.g. "John 3:16", "Genesis 1:1-5") are kept out of translations
+_VERSE_RE = re.compile(r'\b([1-3]?[A-Za-z]+) (\d+):(\d+(-\d+)?)\b')
+
+
+def translate_excluding_verses(text: str, source_language: str, target_language: str) -> str:
+    """
+    Translates text between two languages (as named in prompts), excluding Bible verses: they are
+    replaced with placeholders for the translation and put back afterwards.
+    """
+    verses = [f"{book} {chapter}:{verse}" for book, chapter, verse, _ in _VERSE_RE.findall(text)]
+    placeholder_text = text
+    for i, verse in enumerate(verses):
+        placeholder_text = placeholder_text.replace(verse, f"__VERSE_{i}__")
+
+    chain = llm_clients.get_chain(
+        'analysis.translation',
+        input_variables=["text", "source_language", "target_language"],
+        template=TRANSLATION_TEMPLATE,
+        model=TRANSLATION_MODEL
+    )
+    translated_text = _content(chain.invoke({"text": placeholder_text, "source_language": source_language,
+                                             "target_language": target_language}))
+
+    for i, verse in enumerate(verses):
+        translated_text = translated_text.replace(f"__VERSE_{i}__", verse)
+    return translated_text
+
+
+def _content(message) -> str:
+    return message.content if hasattr(message, 'content') else str(message)
+
+
+EXPLANATION_INSTRUCTION = ("the meaning of the passage in its original historical and cultural context, focusing on how "
+                           "its audience (Israel/Judah/Roman-era Christians) would have understood it. Highlight any "
+                           "political, religious, or social tensions at play, and connect it to broader biblical themes "
+                           "like covenant, exile, or Messiah. Keep it concise but insightful")
+
+STRUCTURED_TEMPLATE = """Request: {user_input}
+Reference: {verse_reference}
+Text: {verse_text}
+
+If Reference is empty, work out which Bible passage the request refers to; the book name may be misspelled or abbreviated.
+Analyze the passage and respond with only a JSON object with these keys:
+"book": the book name in English, e.g. "1 Corinthians",
+"chapter": the chapter number,
+"start_verse": the first verse number, or null for a whole chapter,
+"end_verse": the last verse number, or null,
+"themes": a list of key themes as short tags of 1-3 words,
+"explanation": """ + EXPLANATION_INSTRUCTION + """,
+"related_verses": a list of 2-3 related Bible verses that share similar themes or messages, each a string with the reference and a brief explanation of why it is related,
+"background": year, location and cultural context of the event, including the modern names of places,
+"locations": a list of the full names of the places mentioned in the passage.
+Write themes, explanation, related_verses and background in {language_name}."""
+
+SECTION_TEMPLATE = """Bible passage:
+Reference: {verse_reference}
+Text: {verse_text}
+
+{instruction}
+Write it in {language_name}."""
+
+SECTION_INSTRUCTIONS = {
+    'themes': 'List the key themes of this passage as short tags of 1-3 words. '
+              'Respond with only the tags, comma separated, e.g. "Injustice, Loss of Inheritance, Destruction".',
+    'explanation': f'Explain {EXPLANATION_INSTRUCTION}. Respond with only the explanation.',
+    'related_verses': "List 2-3 related Bible verses that share similar themes or messages, one per line, each with "
+                      "a brief explanation of why it is related. Respond with only the list.",
+    'background': 'Give the year, location and cultural context of the event, including the modern names of places, '
+                  'in one short paragraph. Respond with only the paragraph.',
+    'locations': 'Name the specific place(s) mentioned in the passage with their full names. '
+                 'Respond with only the names, comma separated, or None if no place is mentioned.',
+}
+
+
+def _as_list(value, separator: str) -> List[str]:
+    if value is None:
+        return []
+    items = value if isinstance(value, list) else str(value).split(separator)
+    return [str(item).strip() for item in items if str(item).strip() and str(item).strip().lower() != 'none']
+
+
+def _normalize_sections(values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Brings sections from either the JSON call or the per-section calls to one schema.
+    """
+    return {
+        'themes': _as_list(values.get('themes'), ','),
+        'explanation': str(values.get('explanation') or '').strip(),
+        'related_verses': _as_list(values.get('related_verses'), '\n'),
+        'background': ' '.join(str(values.get('background') or '').split()),
+        'locations': _as_list(values.get('locations'), ','),
+    }
+
+
+def compose_sections(pipeline: LanguagePipeline, sections: Dict[str, Any]) -> Tuple[str, str, str]:
+    """
+    Lays sections out as the (analysis, explanation, related verses) texts the pages and the cache expect:
+    the English page reads a numbered 1-5 list from the analysis, the other pages show the three parts as they are.
+    """
+    themes = ', '.join(sections['themes'])
+    related = '\n'.join(sections['related_verses'])
+    if 'background' in pipeline.sections:
+        analysis = '\n'.join([
+            f"1. Key themes: {themes}",
+            f"2. Explanation: {sections['explanation']}",
+            f"3. Related Bible verses include:\n{related}",
+            f"4. Background: {sections['background']}",
+            f"5. {', '.join(sections['locations'])}",
+        ])
+        return analysis, sections['explanation'], f"Related Bible verses include:\n{related}"
+    explanation = f"2. {sections['explanation']}" if sections['explanation'] else ""
+    return f"1. {themes}", explanation, f"3. {related}" if related else ""
+
+
+def _invoke_structured(pipeline: LanguagePipeline, user_input: str, verse_reference: str, verse_text: str) -> Dict:
+    chain = llm_clients.get_chain(
+        f'{pipeline.language}.structured_analysis',
+        input_variables=["user_input", "verse_reference", "verse_text", "language_name"],
+        template=STRUCTURED_TEMPLATE,
+        model=pipeline.model,
+        json_mode=True
+    )
+    text = _content(chain.invoke({"user_input": user_input, "verse_reference": verse_reference,
+                                  "verse_text": verse_text, "language_name": pipeline.language_name}))
+    start, end = text.find('{'), text.rfind('}')
+    try:
+        data = json.loads(text[start:end + 1]) if start != -1 else None
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        raise ValueError("The analysis could not be read, please try again.")
+    return data
+
+
+def _reference_from_json(pipeline: LanguagePipeline, data: Dict):
+    book = resolve_book(str(data.get('book') or ''))
+    if book is None:
+        raise ValueError(f"Could not find the book {data.get('book')!r}.")
+    try:
+        chapter = int(data['chapter'])
+        start_verse = int(data['start_verse']) if data.get('start_verse') is not None else None
+        end_verse = int(data['end_verse']) if data.get('end_verse') is not None else None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Chapter not specified in the reference.")
+    return pipeline.reference_cls(book=canon.book_name(book, pipeline.translation), chapter=chapter,
+                                  start_verse=start_verse, end_verse=end_verse)
+
+
+def _section_calls(pipeline: LanguagePipeline, verse_reference: str,
+                   verse_text: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Runs one call per section concurrently. Returns (sections, errors); a failed section is blank.
+    """
+    chain = llm_clients.get_chain(
+        f'{pipeline.language}.analysis_section',
+        input_variables=["verse_reference", "verse_text", "instruction", "language_name"],
+        template=SECTION_TEMPLATE,
+        model=pipeline.model
+    )
+
+    def call(section):
+        with pipeline_metrics.span(f'explain.{section}'):
+            return _content(chain.invoke({"verse_reference": verse_reference, "verse_text": verse_text,
+                                          "instruction": SECTION_INSTRUCTIONS[section],
+                                          "language_name": pipeline.language_name}))
+
+    return llm_clients.run_concurrently(
+        {section: (lambda section=section: call(section)) for section in pipeline.sections})
+
+
+def analysis_key(reference, language: str):
+    """
+    Key under which an analysis is computed: the canonical reference, else the formatted one.
+    """
+    return (analysis_cache.cache_key(reference.book, reference.chapter, reference.start_verse,
+                                     reference.end_verse, language)
+            or (format_reference(reference), language))
+
+
+def process_reference(pipeline: LanguagePipeline, user_input: str, bible_api_key: str,
+                      mode: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Parses the input, fetches the verses and analyzes them in the language's pipeline mode.
+    Stored analyses are returned when use_cache is set; new ones are stored if they have an explanation.
+    Freshly generated responses carry the pipeline_mode that produced them.
+    Concurrent requests for the same passage share one analysis (see singleflight.py).
+    """
+    mode = mode or get_pipeline_mode(pipeline.language)
+    normalized_input = ' '.join(user_input.casefold().split())
+    structured = None
+    try:
+        if mode == 'structured' and parse_reference(user_input, pipeline.translation) is None:
+            if use_cache:
+                # An input stored as typed needs no call at all
+                response = analysis_cache.find_input(user_input, pipeline.language)
+                if response:
+                    return response
+            # One call parses and analyzes; the model works from its own knowledge of the passage
+            with pipeline_metrics.span('parse'):
+                structured = PARSES.do((pipeline.translation, 'structured', normalized_input),
+                                       lambda: _invoke_structured(pipeline, user_input, '', ''))
+            reference = _reference_from_json(pipeline, structured)
+        else:
+            with pipeline_metrics.span('parse'):
+                reference = PARSES.do((pipeline.translation, normalized_input),
+                                      lambda: pipeline.parse(user_input))
+    except ValueError as e:
+        return {"error": str(e)}
+
+    if use_cache:
+        response = analysis_cache.find_reference(reference, pipeline.language)
+        if response:
+            return response
+
+    response = ANALYSES.do(analysis_key(reference, pipeline.language),
+                           lambda: _analyze(pipeline, reference, bible_api_key, mode, structured, use_cache))
+    if "pipeline_mode" in response:
+        response["interpretation"] = f"You searched for: {user_input}"
+    return response
+
+
+def _analyze(pipeline: LanguagePipeline, reference, bible_api_key: str, mode: str,
+             structured: Optional[Dict], use_cache: bool) -> Dict[str, Any]:
+    requested_reference = format_reference(reference)
+    if use_cache:
+        # A request for the same passage may have stored it since the lookup
+        response = analysis_cache.find_reference(reference, pipeline.language)
+        if response:
+            return response
+
+    with pipeline_metrics.span('fetch'):
+        verses = pipeline.fetch(reference, bible_api_key)
+    if not verses:
+        return {"error": f"Failed to fetch chapter {reference.chapter} of {reference.book}. It may not exist."}
+
+    if use_cache and structured is None:
+        # A structured call that parsed the input has already analyzed the passage
+        response = _translate_stored(pipeline, reference, verses)
+        if response:
+            return response
+    verse_text = passage_text(verses)
+
+    if mode == 'structured':
+        try:
+            if structured is None:
+                with pipeline_metrics.span('explain'):
+                    structured = _invoke_structured(pipeline, requested_reference, requested_reference, verse_text)
+            analysis, explanation, related_verses = compose_sections(pipeline, _normalize_sections(structured))
+        except ValueError as e:
+            print(f"Structured analysis failed, using the classic call: {e}")
+            mode = 'classic'
+    elif mode == 'sections':
+        sections, errors = _section_calls(pipeline, requested_reference, verse_text)
+        if errors:
+            # An analysis with blank sections would be stored and served from the cache for good
+            print(f"Sections that failed: {errors}, using the classic call")
+            mode = 'classic'
+        else:
+            analysis, explanation, related_verses = compose_sections(pipeline, _normalize_sections(sections))
+    if mode == 'classic':
+        with pipeline_metrics.span('explain'):
+            analysis, explanation, related_verses = pipeline.explain(requested_reference, verse_text)
+
+    # Store the query and results
+    if explanation and use_cache:
+        save_analysis(requested_reference, pipeline.language, verses, analysis, explanation, related_verses)
+
+    return {
+        "requested_reference": requested_reference,
+        "retrieved_passages": verses,
+        "analysis": analysis,
+        "related_verses": related_verses.strip(),
+        "explanation": explanation,
+        "pipeline_mode": mode,
+    }
+
+
+def _translate_stored(pipeline: LanguagePipeline, reference, verses: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    """
+    Translates an analysis of the passage stored in a TRANSLATE_FROM language and stores it for this one.
+    Returns None when there is none or a translation fails, so the passage is analyzed instead.
+    """
+    key = analysis_cache.cache_key(reference.book, reference.chapter, reference.start_verse, reference.end_verse,
+                                   pipeline.language)
+    found = analysis_cache.find_in_languages(key, TRANSLATE_FROM) if key is not None and TRANSLATE_FROM else None
+    if found is None:
+        return None
+    source_language, stored = found
+    source_name = SOURCE_LANGUAGE_NAMES.get(source_language, source_language)
+
+    def translate(field):
+        with pipeline_metrics.span(f'translate.{field}'):
+            return translate_excluding_verses(stored[field].strip(), source_name, pipeline.language_name)
+
+    fields = ('analysis', 'explanation', 'related_verses')
+    results, errors = llm_clients.run_concurrently(
+        {field: (lambda field=field: translate(field)) for field in fields if stored[field].strip()})
+    if errors or not results.get('explanation'):
+        print(f"Could not translate the {source_language} analysis of {stored['requested_reference']}: {errors}")
+        return None
+    analysis, explanation, related_verses = (results.get(field, '') for field in fields)
+
+    requested_reference = format_reference(reference)
+    save_analysis(requested_reference, pipeline.language, verses, analysis, explanation, related_verses,
+                  source=TRANSLATED_PREFIX + source_language)
+    return {
+        "requested_reference": requested_reference,
+        "retrieved_passages": verses,
+        "analysis": analysis,
+        "related_verses": related_verses.strip(),
+        "explanation": explanation,
+        "translated_from": source_language,
+    }
@@ -0,0 +1,517 @@
+"""
+SQLite store of generated analyses (database/analyses.db), replacing the linear scan of
+database/queries.csv.
+
+Each analysis is stored once per (reference, language), together with its canonical passage
+(book number, chapter, start verse, end verse; see analysis_cache.py), and every lookup is an
+index seek:
+
+    by text       UNIQUE (reference, language)
+    by passage    (language, book, chapter, start_verse, end_verse)
+    covering      the same index, reading only the rows of the requested chapter
+
+As with the CSV, the first analysis stored for a reference is the one that is kept. source
+records where a row came from: 'app', the CSV file it was imported from, or TRANSLATED_PREFIX
+and the language of the analysis it was translated from (returned as translated_from).
+
+Passages are stored as their verse range only: when the verses of an analysis are the ones the
+verse store holds for its passage, passages is NULL and the verses are read back from the verse
+store (the verses_of function given to the store) on every hit. Verses that differ, or belong to
+a reference without a canonical passage, are kept as JSON. The analysis text fields, and any
+JSON passages, of at least ANALYSIS_COMPRESS_MIN bytes are stored zlib-compressed as BLOBs
+when ANALYSIS_COMPRESS=1 (a smaller file for a few microseconds per hit); both forms are always read.
+
+Writes go through one writer thread per process. Callers queue their row and wait for it to be
+committed; the writer commits whatever has queued up (at most ANALYSIS_WRITE_BATCH rows) in one
+transaction, so concurrent requests share one fsync. Each row is written whole or not at all.
+The queue holds at most ANALYSIS_WRITE_QUEUE rows; when it is full, writers wait up to
+ANALYSIS_WRITE_TIMEOUT seconds for room and then get WriterBusy. The database runs in WAL mode
+with synchronous=FULL: readers never wait for the writer, a committed row survives a crash, and
+the writers of several worker processes take turns through SQLite's file lock.
+
+The store is created on first use; analysis_cache.py then imports queries.csv and
+queries_location.csv into it. Each completed import is recorded in the migrations table in the
+same transaction, so an import that failed or was interrupted is run again on the next start.
+To import CSV files by hand (rows already stored are skipped):
+
+    python analysis_store.py migrate [file.csv ...]
+    python analysis_store.py compact     # drop verse text and compress rows stored before
+    python analysis_store.py stats
+"""
+import csv
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ANALYSIS_DB = 'database/analyses.db'
+MIGRATION_SOURCES = ('database/queries.csv', 'database/queries_location.csv')
+BUSY_TIMEOUT_MS = 5000
+ANALYSIS_WRITE_QUEUE = int(os.getenv("ANALYSIS_WRITE_QUEUE", "1000"))
+ANALYSIS_WRITE_BATCH = int(os.getenv("ANALYSIS_WRITE_BATCH", "64"))
+ANALYSIS_WRITE_TIMEOUT = float(os.getenv("ANALYSIS_WRITE_TIMEOUT", "10"))
+ANALYSIS_COMPRESS = os.getenv("ANALYSIS_COMPRESS", "0") == "1"
+ANALYSIS_COMPRESS_MIN = int(os.getenv("ANALYSIS_COMPRESS_MIN", "256"))
+COMPACT_BATCH = 500
+TRANSLATED_PREFIX = 'translated:'
+
+# (book number, chapter, start verse, end verse); verses are None for a whole chapter
+Passage = Tuple[int, int, Optional[int], Optional[int]]
+
+# passages is NULL when the verses are read from the verse store; the text columns hold TEXT or
+# zlib-compressed UTF-8 BLOBs
+_ANALYSES_TABLE = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    reference TEXT NOT NULL,
+    language TEXT NOT NULL,
+    book INTEGER,
+    chapter INTEGER,
+    start_verse INTEGER,
+    end_verse INTEGER,
+    passages,
+    analysis NOT NULL,
+    explanation NOT NULL,
+    related_verses NOT NULL,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL
+)"""
+
+_SCHEMA = _ANALYSES_TABLE + """;
+CREATE UNIQUE INDEX IF NOT EXISTS analyses_reference ON analyses (reference, language);
+CREATE INDEX IF NOT EXISTS analyses_passage ON analyses (language, book, chapter, start_verse, end_verse);
+CREATE INDEX IF NOT EXISTS analyses_language ON analyses (language, id);
+CREATE TABLE IF NOT EXISTS user_queries (
+    user_id TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    queried_at REAL NOT NULL,
+    PRIMARY KEY (user_id, reference)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_queries_recent ON user_queries (user_id, queried_at);
+CREATE TABLE IF NOT EXISTS migrations (
+    source TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL
+);
+"""
+
+_COLUMNS = ("reference, language, book, chapter, start_verse, end_verse, passages, analysis, explanation, "
+            "related_verses, source")
+_INSERT = ("INSERT OR IGNORE INTO analyses (reference, language, book, chapter, start_verse, end_verse, "
+           "passages, analysis, explanation, related_verses, source, created_at) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+class WriterBusy(Exception):
+    """
+    Raised when the write queue stays full for ANALYSIS_WRITE_TIMEOUT seconds.
+    """
+
+
+class PendingWrite:
+    """
+    Statements waiting in the write queue, committed together. wait() returns whether the first
+    one changed a row (for an analysis: whether it was added) once they are committed.
+    """
+
+    def __init__(self, statements: List[Tuple[str, tuple]]):
+        self.statements = statements  # empty for a flush
+        self.committed = threading.Event()
+        self.added = False
+        self.error: Optional[Exception] = None
+
+    def wait(self, timeout: float = ANALYSIS_WRITE_TIMEOUT) -> bool:
+        if not self.committed.wait(timeout):
+            raise TimeoutError(f"analysis not committed after {timeout:g}s")
+        if self.error is not None:
+            raise self.error
+        return self.added
+
+
+def _encode(text: str):
+    """
+    Returns text as stored: compressed when that is enabled and makes it smaller.
+    """
+    if not ANALYSIS_COMPRESS:
+        return text
+    data = text.encode('utf-8')
+    if len(data) < ANALYSIS_COMPRESS_MIN:
+        return text
+    compressed = zlib.compress(data, 6)
+    return compressed if len(compressed) < len(data) else text
+
+
+def _decode(value) -> str:
+    return zlib.decompress(value).decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _same_verses(verses: List[Dict], stored: List[Dict]) -> bool:
+    # Verse numbers captured from HTML were strings; compare the values as text
+    return bool(stored) and ([{key: str(value) for key, value in verse.items()} for verse in verses]
+                             == [{key: str(value) for key, value in verse.items()} for verse in stored])
+
+
+class AnalysisStore:
+    """
+    The analyses table, with one reading connection per thread and one writer thread.
+    """
+
+    def __init__(self, path: str = ANALYSIS_DB,
+                 verses_of: Optional[Callable[[Passage, str], List[Dict]]] = None):
+        """
+        verses_of(passage, language) returns the verse store's verses for a passage ([] if it
+        has none); without it every passage is stored as JSON.
+        """
+        self.path = path
+        self.verses_of = verses_of
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')  # stored in the file, so every process uses it
+        conn.executescript(_SCHEMA)
+        self._upgrade(conn)
+        self._writer_lock = threading.Lock()
+        self._writer_pid = None
+        self._queue: queue.Queue = None
+        self._stats = {'writes': 0, 'added': 0, 'batches': 0, 'largest_batch': 0, 'failed': 0, 'rejected': 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # SQLite connections must not be used in a forked child
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _upgrade(self, conn: sqlite3.Connection):
+        """
+        Rebuilds an analyses table created before passages could be NULL.
+        """
+        def passages_required():
+            columns = conn.execute("PRAGMA table_info(analyses)").fetchall()
+            return any(column[1] == 'passages' and column[3] for column in columns)  # NOT NULL
+
+        if not passages_required():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if passages_required():  # another process may have rebuilt it meanwhile
+                conn.execute("ALTER TABLE analyses RENAME TO analyses_old")
+                conn.execute(_ANALYSES_TABLE)
+                conn.execute("INSERT INTO analyses SELECT * FROM analyses_old")
+                conn.execute("DROP TABLE analyses_old")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.executescript(_SCHEMA)  # the indexes went with the old table
+
+    def _stored_passages(self, language: str, passage: Optional[Passage], verses: List[Dict]):
+        """
+        Returns the passages column for verses: NULL if the verse store has exactly these verses.
+        """
+        if (passage is not None and self.verses_of is not None
+                and _same_verses(verses, self.verses_of(passage, language))):
+            return None
+        return _encode(json.dumps(verses))
+
+    def _row_params(self, reference: str, language: str, passage: Optional[Passage], verses: List[Dict],
+                    analysis: str, explanation: str, related_verses: str, source: str) -> tuple:
+        book, chapter, start_verse, end_verse = passage or (None, None, None, None)
+        return (reference, language, book, chapter, start_verse, end_verse,
+                self._stored_passages(language, passage, verses), _encode(analysis), _encode(explanation),
+                _encode(related_verses), source, time.time())
+
+    def _response(self, row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        reference, language, book, chapter, start_verse, end_verse, passages = row[:7]
+        if passages is not None:
+            try:
+                retrieved_passages = json.loads(_decode(passages))
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON: {e}")
+                return None
+        else:
+            retrieved_passages = self.verses_of((book, chapter, start_verse, end_verse), language) if self.verses_of else []
+            if not retrieved_passages:
+                print(f"No verses in the verse store for {reference} ({language})")
+                return None
+        response = {
+            "requested_reference": reference,
+            "language": language,
+            "retrieved_passages": retrieved_passages,
+            "analysis": _decode(row[7]),
+            "explanation": _decode(row[8]),
+            "related_verses": _decode(row[9])
+        }
+        if row[10].startswith(TRANSLATED_PREFIX):
+            response["translated_from"] = row[10][len(TRANSLATED_PREFIX):]
+        return response
+
+    def _write_queue(self) -> queue.Queue:
+        """
+        Returns the write queue, starting the writer thread on first use (again after a fork).
+        """
+        with self._writer_lock:
+            if self._writer_pid != os.getpid():
+                self._queue = queue.Queue(maxsize=ANALYSIS_WRITE_QUEUE)
+                threading.Thread(target=self._write_loop, args=(self._queue,), name='analysis-writer',
+                                 daemon=True).start()
+                self._writer_pid = os.getpid()
+            return self._queue
+
+    def _write_loop(self, pending: queue.Queue):
+        conn = self._connection()
+        while True:
+            batch = [pending.get()]
+            while len(batch) < ANALYSIS_WRITE_BATCH:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [write for write in batch if write.statements]
+            try:
+                if rows:
+                    self._commit(conn, rows)
+            except sqlite3.Error as e:
+                # Write the rows one by one, so one bad row does not fail the others
+                print(f"Error committing {len(rows)} analyses: {e}")
+                for write in rows:
+                    try:
+                        self._commit(conn, [write])
+                    except sqlite3.Error as row_error:
+                        write.error = row_error
+                        with self._writer_lock:
+                            self._stats['failed'] += 1
+            with self._writer_lock:
+                self._stats['batches'] += 1
+                self._stats['largest_batch'] = max(self._stats['largest_batch'], len(rows))
+            for write in batch:
+                write.committed.set()
+
+    def _commit(self, conn: sqlite3.Connection, rows: List[PendingWrite]):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = [[conn.execute(sql, params).rowcount for sql, params in write.statements][0] == 1
+                     for write in rows]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        for write, was_added in zip(rows, added):
+            write.added = was_added
+        with self._writer_lock:
+            self._stats['writes'] += len(rows)
+            self._stats['added'] += sum(added)
+
+    def _enqueue(self, write: PendingWrite, timeout: float = ANALYSIS_WRITE_TIMEOUT) -> PendingWrite:
+        try:
+            self._write_queue().put(write, timeout=timeout)
+        except queue.Full:
+            with self._writer_lock:
+                self._stats['rejected'] += 1
+            raise WriterBusy(f"{ANALYSIS_WRITE_QUEUE} analyses are already waiting to be written")
+        return write
+
+    def add(self, reference: str, language: str, passage: Optional[Passage], verses: List[Dict],
+            analysis: str, explanation: str, related_verses: str, source: str = 'app', wait: bool = True):
+        """
+        Stores an analysis unless one is already stored for the reference.
+        With wait, blocks until it is committed and returns whether it was added; otherwise returns
+        its PendingWrite. Raises WriterBusy if the write queue stays full.
+        """
+        write = self._enqueue(PendingWrite([(_INSERT, self._row_params(reference, language, passage, verses, analysis,
+                                                                       explanation, related_verses, source))]))
+        return write.wait() if wait else write
+
+    def flush(self, timeout: float = ANALYSIS_WRITE_TIMEOUT):
+        """
+        Waits until every write queued so far is committed.
+        """
+        self._enqueue(PendingWrite([])).wait(timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._writer_lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    def find_text(self, reference: str, language: str) -> Optional[Dict[str, Any]]:
+        return self._response(self._connection().execute(
+            f"SELECT {_COLUMNS} FROM analyses WHERE reference = ? AND language = ?",
+            (reference, language)).fetchone())
+
+    def find_passage(self, passage: Passage, language: str) -> Optional[Dict[str, Any]]:
+        book, chapter, start_verse, end_verse = passage
+        return self._response(self._connection().execute(
+            f"SELECT {_COLUMNS} FROM analyses WHERE language = ? AND book = ? AND chapter = ? "
+            "AND start_verse IS ? AND end_verse IS ? ORDER BY id LIMIT 1",
+            (language, book, chapter, start_verse, end_verse)).fetchone())
+
+    def find_covering(self, passage: Passage, language: str) -> List[Tuple[Passage, Dict[str, Any]]]:
+        """
+        Stored ranges and whole chapters that contain the passage's verses, smallest first.
+        """
+        book, chapter, start_verse, end_verse = passage
+        rows = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM analyses "
+            "WHERE language = ? AND book = ? AND chapter = ? "
+            "AND (start_verse IS NULL OR (start_verse <= ? AND end_verse >= ?)) "
+            "ORDER BY start_verse IS NULL, end_verse - start_verse, id",
+            (language, book, chapter, start_verse, end_verse)).fetchall()
+        covering = []
+        for row in rows:
+            response = self._response(row)
+            if response is not None:
+                covering.append((tuple(row[2:6]), response))
+        return covering
+
+    def recent(self, language: str, limit: int) -> List[str]:
+        """
+        References of the last analyses stored for a language, newest first.
+        """
+        rows = self._connection().execute(
+            "SELECT reference FROM analyses WHERE language = ? ORDER BY id DESC LIMIT ?",
+            (language, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def user_recent(self, user_id: str, limit: int) -> List[str]:
+        """
+        References a user looked up last, newest first.
+        """
+        rows = self._connection().execute(
+            "SELECT reference FROM user_queries WHERE user_id = ? ORDER BY queried_at DESC LIMIT ?",
+            (user_id, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def add_user_query(self, user_id: str, reference: str, limit: int) -> PendingWrite:
+        """
+        Queues a user's lookup, keeping only their last limit references. Does not wait for room in
+        the queue or for the commit.
+        """
+        return self._enqueue(PendingWrite([
+            ("INSERT OR REPLACE INTO user_queries (user_id, reference, queried_at) VALUES (?, ?, ?)",
+             (user_id, reference, time.time())),
+            ("DELETE FROM user_queries WHERE user_id = ? AND reference NOT IN "
+             "(SELECT reference FROM user_queries WHERE user_id = ? ORDER BY queried_at DESC LIMIT ?)",
+             (user_id, user_id, limit)),
+        ]), timeout=0)
+
+    def passage_counts(self, limit: int) -> List[Passage]:
+        """
+        The passages stored in the most languages.
+        """
+        rows = self._connection().execute(
+            "SELECT book, chapter, start_verse, end_verse FROM analyses WHERE book IS NOT NULL "
+            "GROUP BY book, chapter, start_verse, end_verse ORDER BY COUNT(*) DESC, MIN(id) LIMIT ?",
+            (limit,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def pending_migrations(self, paths) -> List[str]:
+        """
+        The CSV files among paths that exist and have not been imported yet.
+        """
+        imported = {row[0] for row in self._connection().execute("SELECT source FROM migrations")}
+        return [path for path in paths if os.path.exists(path) and os.path.basename(path) not in imported]
+
+    def import_csv(self, path: str, passage_of: Callable[[str, str], Optional[Passage]]) -> Tuple[int, int]:
+        """
+        Imports a queries.csv-style file in one transaction, bypassing the write queue, and records
+        it in the migrations table in the same transaction. passage_of(reference, language) gives
+        each row's canonical passage. Returns (rows added, rows skipped).
+        """
+        added = skipped = 0
+        conn = self._connection()
+        with open(path, mode='r', newline='') as file:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in csv.reader(file):
+                    if len(row) < 6:
+                        skipped += 1
+                        continue
+                    try:
+                        verses = json.loads(row[2])
+                    except json.JSONDecodeError as e:
+                        print(f"Error decoding JSON for {row[0]}: {e}")
+                        skipped += 1
+                        continue
+                    params = self._row_params(row[0], row[1], passage_of(row[0], row[1]), verses,
+                                         row[3], row[4], row[5], os.path.basename(path))
+                    if conn.execute(_INSERT, params).rowcount == 1:
+                        added += 1
+                    else:
+                        skipped += 1
+                conn.execute("INSERT OR REPLACE INTO migrations (source, imported_at) VALUES (?, ?)",
+                             (os.path.basename(path), time.time()))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return added, skipped
+
+    def compact(self) -> Tuple[int, int]:
+        """
+        Rewrites rows stored with a copy of their verses or uncompressed text the way add() stores
+        them now, COMPACT_BATCH rows per transaction, bypassing the write queue.
+        Returns (rows rewritten, rows checked).
+        """
+        rewritten = checked = 0
+        conn = self._connection()
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT id, {_COLUMNS} FROM analyses WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, COMPACT_BATCH)).fetchall()
+            if not rows:
+                return rewritten, checked
+            last_id = rows[-1][0]
+            updates = []
+            for row in rows:
+                checked += 1
+                language, book, passages = row[2], row[3], row[7]
+                if passages is not None:
+                    try:
+                        verses = json.loads(_decode(passages))
+                    except json.JSONDecodeError:
+                        continue
+                    passages = self._stored_passages(language, tuple(row[3:7]) if book is not None else None, verses)
+                stored = (passages, *(_encode(_decode(value)) for value in row[8:11]))
+                if stored != tuple(row[7:11]):
+                    updates.append(stored + (row[0],))
+            if updates:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany("UPDATE analyses SET passages = ?, analysis = ?, explanation = ?, "
+                                     "related_verses = ? WHERE id = ?", updates)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                rewritten += len(updates)
+
+
+if __name__ == "__main__":
+    import analysis_cache
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        for source in sys.argv[2:] or MIGRATION_SOURCES:
+            added, skipped = analysis_cache.get_store().import_csv(source, analysis_cache.stored_passage)
+            print(f"{source}: {added} analyses added, {skipped} skipped")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'compact':
+        store = analysis_cache.get_store()
+        size = os.path.getsize(store.path)
+        rewritten, checked = store.compact()
+        store._connection().execute("VACUUM")
+        print(f"{rewritten} of {checked} analyses rewritten, {ANALYSIS_DB} {size / 1e6:.1f} MB -> "
+              f"{os.path.getsize(store.path) / 1e6:.1f} MB")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        print(f"{analysis_cache.get_store().count()} analyses in {ANALYSIS_DB}")
+    else:
+        print("Usage: python analysis_store.py migrate [file.csv ...] | compact | stats")
@@ -1,13 +1,17 @@
 import requests
 import os
 import re
-import csv
-import json
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from typing import Optional, List, Dict
+import llm_clients
+from typing import Optional, List, Dict, Iterator, Tuple
 from dataclasses import dataclass
 from query_kjv import query_kjv_db  # Import the query_kjv_db function
+from reference_parser import parse_reference
+import analysis_cache
+import analysis_pipeline
+import pipeline_metrics
+import singleflight
+from analysis_pipeline import format_reference, save_analysis, passage_text
+import canon
 from flask import session  # Add this import at the top of the file if using Flask
 from dotenv import load_dotenv
 
@@ -24,7 +28,8 @@ def step1_create_reference_parser_chain():
     """
     1. Creates the first chain that takes natural language input and returns structured Bible references.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'kjv.reference_parser',
         input_variables=["user_input"],
         template="""Parse the following Bible reference into a structured format.
 If a chapter is mentioned without verses, assume the entire chapter is requested.
@@ -56,18 +61,24 @@ BOOK: [only the book name]
 CHAPTER: [number or 'None' if not specified]
 START_VERSE: [number or 'None' if entire chapter]
 END_VERSE: [number or 'None' if single verse or entire chapter]
-EXPLANATION: [explain in natural language what was requested]"""
+EXPLANATION: [explain in natural language what was requested]""",
+        model="llama-3.3-70b-versatile"
     )
-    
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile")
-    chain = prompt_template | llm
-    return chain
 
 def step2_parse_bible_reference(user_input: str) -> BibleReference:
     """
-    2. Uses LLM to parse natural language input into structured format.
-    This is where we first use Groq to interpret the user's request.
+    2. Parses natural language input into structured format.
+    Well-formed references are parsed locally; Groq is only used for anything else.
     """
+    parsed = parse_reference(user_input, 'kjv')
+    if parsed is not None:
+        return BibleReference(
+            book=canon.book_name(parsed.book, 'kjv'),
+            chapter=parsed.chapter,
+            start_verse=parsed.start_verse,
+            end_verse=parsed.end_verse
+        )
+
     chain = step1_create_reference_parser_chain()
     response = chain.invoke({"user_input": user_input})
     
@@ -135,7 +146,8 @@ def step4_create_explanation_chain():
     """
     4. Creates the second chain that explains verses and suggests related passages.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'kjv.explanation',
         input_variables=["verse_reference", "verse_text"],
         template="""Analyze this Bible passage:
 Reference: {verse_reference}
@@ -147,161 +159,183 @@ Please provide in this format:
 3. Related Bible verses include: 2-3 related Bible verses that share similar themes or messages (include brief explanations of why they're related).
 4. Background: Year, location and cultural context of the event, include the modern names too. 
 5. Locations: Identify the specific place(s) mentioned in the passage, and provide the full name(s) of the place in a comma separated format without any extra text.
-Response:"""
+Response:""",
+        model="llama-3.3-70b-versatile"
     )
-    
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile")
-    chain = prompt_template | llm
-    return chain
 
-def step5_process_bible_reference(user_input: str, bible_api_key: str) -> Dict[str, str]:
+def split_explanation(explanation_text: str):
     """
-    5. Main function that orchestrates the entire process:
-       - First uses Groq to interpret the reference
-       - Then fetches the verses
-       - Finally uses Groq again to analyze and explain
+    Splits the explanation chain output into (analysis, explanation, related verses).
     """
-    try:
-        # Step 1: Parse the natural language reference
-        reference = step2_parse_bible_reference(user_input)
-    except ValueError as e:
-        return {"error": str(e)}
-    
-    def search_csv(reference, language):
-        print(f"Searching CSV for reference whtin app py : {reference}")  # Debugging statement
-        with open('database/queries.csv', mode='r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row[0] == reference and row[1] == language:
-                    try:
-                        retrieved_passages = json.loads(row[2])
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON: {e}")
-                        continue
-                    print(f"Found reference in CSV: {row[0]}")  # Debugging statement
-                    return {
-                        "requested_reference": row[0],
-                        "language": row[1],
-                        "retrieved_passages": retrieved_passages,
-                        "analysis": row[3],
-                        "explanation": row[4],
-                        "related_verses": row[5]
-                    }
-        print("Reference not found in CSV")  # Debugging statement
-        return None
-
-    requested_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        requested_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            requested_reference += f"-{reference.end_verse}"
-
-    # Search the CSV file for the reference
-    response = search_csv(requested_reference, 'en')
-    if response:
-        return response
-
-    # Step 2: Fetch the verse(s)
-    verses = step3_fetch_bible_verses(reference, bible_api_key)
-    if not verses:
-        return {"error": f"Failed to fetch chapter {reference.chapter} of {reference.book}. It may not exist."}
-    
-    # Step 3: Display verses and get explanation
-    all_text = ""
-    for verse in verses:
-        all_text += f"{verse['text']}\n"  # Only append the verse text, not the verse number
-    print(all_text)
-    
-    # Determine the verse reference for the explanation
-    verse_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        verse_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            verse_reference += f"-{reference.end_verse}"
-    
-    # Step 4: Get the explanation and related verses
-    chain = step4_create_explanation_chain()
-    explanation = chain.invoke({
-        "verse_reference": verse_reference,
-        "verse_text": all_text
-    })
-    
-    # Extract the related Bible verses section
-    explanation_text = explanation.content if hasattr(explanation, 'content') else explanation
     related_verses_start = explanation_text.find("Related Bible verses include:")
     related_verses = explanation_text[related_verses_start:] if related_verses_start != -1 else ""
 
     explanation_start = explanation_text.find("explanation")
     explanation = explanation_text[explanation_start:related_verses_start].strip() if explanation_start != -1 and related_verses_start != -1 else ""
+    analysis = explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text
+    return analysis, explanation, related_verses
+
+# Session languages whose users also get the analysis translated: language -> (field suffix, target language)
+TRANSLATED_LANGUAGES = {'ko': ('_ko', 'Korean'), 'ml': ('_ml', 'Malayalam'), 'mal': ('_ml', 'Malayalam')}
+TRANSLATIONS = singleflight.Group('translation')
 
-    requested_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        requested_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            requested_reference += f"-{reference.end_verse}"
-
-    print(f"Requested reference: {requested_reference}")
-    # Write the query and results to a CSV file
-    if explanation:
-        with open('database/queries.csv', mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([requested_reference, "en", json.dumps(verses), explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text, explanation, related_verses])
-            # print(f"Wrote to CSV: {requested_reference}")  # Debugging statement
-
-    # Translate analysis, explanation, and related verses to Korean and Malayalam if the session language is set to Korean or Malayalam
-    analysis_ko = ""
-    explanation_ko = ""
-    related_verses_ko = ""
-    analysis_ml = ""
-    explanation_ml = ""
-    related_verses_ml = ""
-
-    if session.get('lang') == 'ko':
-        analysis_ko = translate_text_excluding_verses(explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text, "Korean")
-        print(f"Analysis (Korean): {analysis_ko}")
-
-        explanation_ko = translate_text_excluding_verses(explanation, "Korean")
-        print(f"Explanation (Korean): {explanation_ko}")
-        related_verses_ko = translate_text_excluding_verses(related_verses.strip(), "Korean")
-    elif session.get('lang') == 'ml':
-        analysis_ml = translate_text_excluding_verses(explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text, "Malayalam")
-        explanation_ml = translate_text_excluding_verses(explanation[:related_verses_start].strip() if related_verses_start != -1 else explanation, "Malayalam")
-        related_verses_ml = translate_text_excluding_verses(related_verses.strip(), "Malayalam")
-
-    return {
-        "interpretation": f"You searched for: {user_input}",
-        "requested_reference": requested_reference,
-        "retrieved_passages": verses,
-        "analysis": explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text,
-        "related_verses": related_verses.strip(),
-        "explanation": explanation,
-        "analysis_ko": analysis_ko,
-        "explanation_ko": explanation_ko,
-        "related_verses_ko": related_verses_ko,
-        "analysis_ml": analysis_ml,
-        "explanation_ml": explanation_ml,
-        "related_verses_ml": related_verses_ml
-    }
-
-def create_translation_chain():
+def translate_sections(analysis: str, explanation: str, related_verses: str, language: Optional[str]) -> Dict[str, object]:
     """
-    Creates a chain to translate text from English to Korean or Malayalam, excluding Bible verses.
+    Translates analysis, explanation, and related verses to Korean or Malayalam if the session language is set to Korean or Malayalam.
+    The three translations are independent, so they run concurrently and the user waits for the slowest one.
+    Returns the *_ko and *_ml response fields, plus translation_errors if a translation failed or missed the deadline.
     """
-    prompt_template = PromptTemplate(
-        input_variables=["text", "target_language"],
-        template="""
-Translate the following text from English to {target_language} in the actual target script,
-so if the target language is Korean, provide the text in Hangul script.
-If a biblical verse including book name, chapter AND verse or verses is found, keep it unchanged in the translated text.
+    sections = {f"{field}{suffix}": "" for suffix in ("_ko", "_ml")
+                for field in ("analysis", "explanation", "related_verses")}
+    if language not in TRANSLATED_LANGUAGES:
+        return sections
+    suffix, target_language = TRANSLATED_LANGUAGES[language]
+
+    def translate(field, text):
+        with pipeline_metrics.span(f"translate.{field}"):
+            return translate_text_excluding_verses(text, target_language)
+
+    # Users reading the same passage at the same time share one set of translations
+    results, errors = TRANSLATIONS.do((target_language, analysis, explanation, related_verses), lambda: llm_clients.run_concurrently({
+        f"analysis{suffix}": lambda: translate("analysis", analysis),
+        f"explanation{suffix}": lambda: translate("explanation", explanation),
+        f"related_verses{suffix}": lambda: translate("related_verses", related_verses.strip()),
+    }))
+    sections.update(results)
+    if errors:
+        sections["translation_errors"] = errors
+    return sections
+
+def explain_passage(verse_reference: str, verse_text: str):
+    """
+    4. Runs the explanation chain (classic pipeline mode) and splits its output into sections.
+    """
+    chain = step4_create_explanation_chain()
+    explanation = chain.invoke({
+        "verse_reference": verse_reference,
+        "verse_text": verse_text
+    })
+    explanation_text = explanation.content if hasattr(explanation, 'content') else explanation
+    return split_explanation(explanation_text)
+
+PIPELINE = analysis_pipeline.LanguagePipeline(
+    language='en',
+    translation='kjv',
+    language_name='English',
+    model="llama-3.3-70b-versatile",
+    reference_cls=BibleReference,
+    parse=step2_parse_bible_reference,
+    fetch=step3_fetch_bible_verses,
+    explain=explain_passage,
+    sections=analysis_pipeline.ALL_SECTIONS
+)
+
+def step5_process_bible_reference(user_input: str, bible_api_key: str, language: Optional[str] = None,
+                                  mode: Optional[str] = None, use_cache: bool = True) -> Dict[str, str]:
+    """
+    5. Main function that orchestrates the entire process:
+       - First uses Groq to interpret the reference
+       - Then fetches the verses
+       - Finally uses Groq again to analyze and explain, in the pipeline mode configured for English
+    language selects the translations; it defaults to the session language and must be
+    given when this runs outside a request (e.g. as a background job).
+    """
+    response = analysis_pipeline.process_reference(PIPELINE, user_input, bible_api_key, mode, use_cache)
+    if "pipeline_mode" not in response:
+        # Errors and stored analyses are returned as they are
+        return response
 
-Text: {text}
+    if language is None:
+        language = session.get('lang')  # Read here, before the translations are handed to worker threads
+    response.update(translate_sections(response["analysis"], response["explanation"], response["related_verses"], language))
+    return response
 
-Translated Text: [translated text with Bible verses unchanged]"""
-    )
-    
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile")
-    chain = prompt_template | llm
-    return chain
+def step5_stream_bible_reference(user_input: str, reference: BibleReference, bible_api_key: str,
+                                 language: Optional[str]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streaming version of step 5 for an already parsed reference. Yields (event, data) pairs:
+       - ("passages", ...) as soon as the verses are read from the database or the stored analysis is found
+       - ("token", {"text": ...}) for each chunk of the explanation as Groq generates it
+       - ("done", response) with the same response step5_process_bible_reference returns,
+         after the result has been stored
+       - ("error", {"error": ...}) instead, if the verses or the explanation could not be fetched
+    language is passed in because the generator runs after the request that started it has returned.
+    A request for a passage that is already being analyzed waits for that analysis and gets no tokens.
+    """
+    requested_reference = format_reference(reference)
+    response = analysis_cache.find_reference(reference, 'en')
+    if response:
+        yield "passages", {"requested_reference": requested_reference,
+                           "retrieved_passages": response["retrieved_passages"]}
+        yield "done", dict(response, cached=True)
+        return
+
+    # Share the analysis with concurrent requests for the same passage, streamed or not
+    key = analysis_pipeline.analysis_key(reference, 'en')
+    flight, leader = analysis_pipeline.ANALYSES.start(key)
+    if not leader:
+        try:
+            response = analysis_pipeline.ANALYSES.wait(flight)
+        except Exception as e:
+            yield "error", {"error": str(e)}
+            return
+        if "error" in response:
+            yield "error", response
+            return
+        yield "passages", {"requested_reference": response["requested_reference"],
+                           "retrieved_passages": response["retrieved_passages"]}
+        if "pipeline_mode" not in response:
+            yield "done", dict(response, cached=True)
+            return
+        response.update(interpretation=f"You searched for: {user_input}", cached=bool(response["explanation"]),
+                        **translate_sections(response["analysis"], response["explanation"], response["related_verses"], language))
+        yield "done", response
+        return
+
+    result = None
+    try:
+        with pipeline_metrics.span('fetch'):
+            verses = step3_fetch_bible_verses(reference, bible_api_key)
+        if not verses:
+            result = {"error": f"Failed to fetch chapter {reference.chapter} of {reference.book}. It may not exist."}
+            yield "error", result
+            return
+        yield "passages", {"requested_reference": requested_reference, "retrieved_passages": verses}
+
+        chain = step4_create_explanation_chain()
+        chunks = []
+        with pipeline_metrics.span('explain'):
+            try:
+                for chunk in chain.stream({"verse_reference": requested_reference, "verse_text": passage_text(verses)}):
+                    text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    if text:
+                        chunks.append(text)
+                        yield "token", {"text": text}
+            except Exception as e:
+                print(f"Error streaming explanation: {e}")
+                result = {"error": str(e)}
+                yield "error", result
+                return
+        explanation_text = ''.join(chunks)
+        analysis, explanation, related_verses = split_explanation(explanation_text)
+
+        if explanation:
+            save_analysis(requested_reference, "en", verses, analysis, explanation, related_verses)
+
+        result = {
+            "requested_reference": requested_reference,
+            "retrieved_passages": verses,
+            "analysis": analysis,
+            "related_verses": related_verses.strip(),
+            "explanation": explanation,
+            "pipeline_mode": "classic",
+        }
+    finally:
+        # Also runs when the browser disconnects mid-stream; waiters then get an error
+        analysis_pipeline.ANALYSES.finish(key, flight, result or {"error": "The analysis was interrupted, please try again."})
+
+    yield "done", dict(result, interpretation=f"You searched for: {user_input}", cached=bool(result["explanation"]),
+                       **translate_sections(result["analysis"], result["explanation"], result["related_verses"], language))
 
 def translate_text_excluding_verses(text: str, target_language: str) -> str:
     """
@@ -314,30 +348,7 @@ def translate_text_excluding_verses(text: str, target_language: str) -> str:
     Returns:
         str: The translated text with Bible verses excluded from translation.
     """
-    # Regular expression to match Bible verses (e.g., "John 3:16", "Genesis 1:1-5")
-    verse_pattern = re.compile(r'\b([1-3]?[A-Za-z]+) (\d+):(\d+(-\d+)?)\b')
-    
-    # Find all Bible verses in the text
-    verses = verse_pattern.findall(text)
-    
-    # Replace Bible verses with placeholders
-    placeholder_text = text
-    for i, verse in enumerate(verses):
-        placeholder = f"__VERSE_{i}__"
-        placeholder_text = placeholder_text.replace(f"{verse[0]} {verse[1]}:{verse[2]}", placeholder)
-    
-    # Translate the text with placeholders using Groq
-    chain = create_translation_chain()
-    response = chain.invoke({"text": placeholder_text, "target_language": target_language})
-    translated_text = response.content if hasattr(response, 'content') else response
-    
-    # Replace placeholders with original Bible verses
-    for i, verse in enumerate(verses):
-        placeholder = f"__VERSE_{i}__"
-        original_verse = f"{verse[0]} {verse[1]}:{verse[2]}"
-        translated_text = translated_text.replace(placeholder, original_verse)
-    
-    return translated_text
+    return analysis_pipeline.translate_excluding_verses(text, "English", target_language)
 
 
 def translate_biblical_text(text: str, target_language: str) -> str:
@@ -351,7 +362,8 @@ def translate_biblical_text(text: str, target_language: str) -> str:
     Returns:
         str: The translated text.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'kjv.biblical_translation',
         input_variables=["text", "target_language"],
         template="""
 Translate the given biblical text to {target_language} in the actual target script, considering that book names from the Bible will be used often
@@ -360,12 +372,9 @@ Return only the translated text, with no additional explanations or formatting.
 
 Text: {text}
 
-Translated Text: [translated text with no additional information]"""
+Translated Text: [translated text with no additional information]""",
+        model="llama-3.3-70b-versatile"
     )
-    
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile")
-    translated_text = prompt_template | llm
-    return translated_text
 
 
 # This is the entry point of the script when run directly
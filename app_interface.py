@@ -1,6 +1,8 @@
-from flask import Flask, request, render_template, redirect, url_for, session, jsonify, send_from_directory, flash
+from flask import Flask, request, render_template, redirect, url_for, session, jsonify, send_from_directory, flash, stream_with_context, g
 from flask_session import Session
-from app import step5_process_bible_reference, translate_biblical_text
+from app import step5_process_bible_reference, step5_stream_bible_reference, translate_biblical_text
+from analysis_pipeline import format_reference
+from app import step2_parse_bible_reference as step2_parse_bible_reference_en
 from app_ko import step5_process_bible_reference_ko
 from app_ne import step5_process_bible_reference_ne, step3_fetch_bible_verses, BibleReference
 from app_mal import step3_fetch_bible_verses_mal, step5_process_bible_reference_mal, step2_parse_bible_reference
@@ -10,12 +12,24 @@ import requests
 import json
 import csv
 import fcntl
-from query_kjv import query_kjv_db, get_books, get_chapters  # Import get_chapters
-from query_korrv import query_korrv_db, get_books as get_books_ko, get_chapters as get_chapters_ko  # Import Korean functions
-from query_NE_bible import query_ne_bible_json, get_books as get_books_ne, get_chapters as get_chapters_ne  # Import Nepali functions
-from query_mal1920 import query_mal_bible_json, get_books as get_books_mal, get_chapters as get_chapters_mal # Import Malayalam functions
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import sqlite3
+import bible_db
+import canon
+import chapter_cache
+from verse_store import get_store
+from book_resolver import complete_books, resolve_book, resolve_book_name
+from search_index import search_verses
+from chapter_payloads import get_chapter_payload
+from query_kjv import query_kjv_db, query_kjv_batch, get_books, get_chapter, get_chapter_numbers
+from query_korrv import query_korrv_db, query_korrv_batch, get_books as get_books_ko, get_chapter as get_chapter_ko, get_chapter_numbers as get_chapter_numbers_ko  # Import Korean functions
+from query_NE_bible import query_ne_bible_json, query_ne_bible_batch, get_books as get_books_ne, get_chapter as get_chapter_ne, get_chapter_numbers as get_chapter_numbers_ne  # Import Nepali functions
+from query_mal1920 import query_mal_bible_json, query_mal_bible_batch, get_books as get_books_mal, get_chapter as get_chapter_mal, get_chapter_numbers as get_chapter_numbers_mal # Import Malayalam functions
+import llm_clients
+import job_queue
+import analysis_cache
+import singleflight
+import pipeline_metrics
+import recent_queries
 from KoBART import mbart
 from groq_devotionals import get_bible_verse
 from groq_devotionals_ko import get_bible_verse_ko
@@ -28,10 +42,28 @@ app.secret_key = os.getenv("SECRET_KEY", "supersecretkey")  # Set a secret key f
 app.config['SESSION_TYPE'] = 'filesystem'
 Session(app)
 
+@app.before_request
+def start_pipeline_trace():
+    # Pipeline steps run during the request are recorded against its endpoint (see pipeline_metrics.py)
+    g.pipeline_trace = pipeline_metrics.begin(request.endpoint or 'unknown')
+
+@app.after_request
+def add_server_timing(response):
+    if pipeline_metrics.PIPELINE_DEBUG_HEADER and 'pipeline_trace' in g:
+        response.headers['Server-Timing'] = g.pipeline_trace[0].server_timing()
+    return response
+
+@app.teardown_request
+def end_pipeline_trace(error=None):
+    # Runs after a streamed body has been sent, so stream steps are included
+    pipeline_trace = g.pop('pipeline_trace', None)
+    if pipeline_trace:
+        pipeline_metrics.end(*pipeline_trace)
+
 @app.route('/query/<reference>')
 def query(reference):
     language = session.get('lang', 'en')  # Get the language from the session, default to 'en'
-    response = search_csv(reference, language)
+    response = search_analyses(reference, language)
     if not response:
         flash('Query not found in the database.', 'error')
         return redirect(url_for('home'))
@@ -47,18 +79,19 @@ def query(reference):
 def home():
     bible_api_key = os.getenv("BIBLE_API_KEY")
     language = session.get('lang', 'en')  # Get the language from the session, default to 'en'
-    recent_queries = get_recent_queries_from_session()
+    user_queries = get_recent_queries_from_session()
     if request.method == 'POST':
         user_input = request.form['reference']
         print(f"Received user input: {user_input}")  # Debugging statement
         
-        # Search the CSV file for the response
-        response = search_csv(user_input, language)
-        print(f"CSV search response from app_interface: {response}")  # Debugging statement
+        # Search the stored analyses for the response
+        response = search_analyses(user_input, language)
+        print(f"Stored analysis from app_interface: {response}")  # Debugging statement
         if not response:
-            # Process the Bible reference if not found in CSV
+            # Process the Bible reference if no analysis is stored
             response = step5_process_bible_reference(user_input, bible_api_key)
             print(f"Processed response: {response}")  # Debugging statement
+            add_search_fallback(response, user_input, language)
 
             # # Write the query and results to a CSV file
             # if response['analysis'] and response['explanation'] and response['related_verses']:
@@ -95,22 +128,23 @@ def home():
         elif session['lang'] == 'mal':
             return redirect(url_for('home_mal'))
 
-    return render_template('home.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=recent_queries)
+    return render_template('home.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=user_queries)
 
 @app.route('/home_ko', methods=['GET', 'POST'])
 def home_ko():
     bible_api_key = os.getenv("BIBLE_API_KEY")
     language = session.get('lang', 'ko')  # Get the language from the session, default to 'en'
-    recent_queries = get_recent_queries_from_session()
+    user_queries = get_recent_queries_from_session()
     if request.method == 'POST':
         user_input = request.form['reference']
         print(f"Received user input: {user_input}")  # Debugging statement
 
-        # Search the CSV file for the response
-        response = search_csv(user_input, language)
+        # Search the stored analyses for the response
+        response = search_analyses(user_input, language)
         if not response:
-            # Process the Bible reference if not found in CSV
+            # Process the Bible reference if no analysis is stored
             response = step5_process_bible_reference_ko(user_input, bible_api_key)
+            add_search_fallback(response, user_input, language)
 
             # # Write the query and results to a CSV file
             # if response['analysis'] and response['explanation'] and response['related_verses']:
@@ -142,22 +176,23 @@ def home_ko():
         elif session['lang'] == 'mal':
             return redirect(url_for('home_mal'))
 
-    return render_template('home_ko.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=recent_queries)
+    return render_template('home_ko.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=user_queries)
 
 @app.route('/home_ne', methods=['GET', 'POST'])
 def home_ne():
     bible_api_key = os.getenv("BIBLE_API_KEY")
     language = session.get('lang', 'ne')  # Get the language from the session, default to 'en'
-    recent_queries = get_recent_queries_from_session()
+    user_queries = get_recent_queries_from_session()
     if request.method == 'POST':
         user_input = request.form['reference']
         print(f"Received user input: {user_input}")  # Debugging statement
 
-        # Search the CSV file for the response
-        response = search_csv(user_input, language)
+        # Search the stored analyses for the response
+        response = search_analyses(user_input, language)
         if not response:
-            # Process the Bible reference if not found in CSV
+            # Process the Bible reference if no analysis is stored
             response = step5_process_bible_reference_ne(user_input, bible_api_key)
+            add_search_fallback(response, user_input, language)
 
             # # Write the query and results to a CSV file
             # if response and response.get('analysis') and response.get('explanation') and response.get('related_verses'):
@@ -191,24 +226,25 @@ def home_ne():
         elif session['lang'] == 'mal':
             return redirect(url_for('home_mal'))
 
-    return render_template('home_ne.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=recent_queries)
+    return render_template('home_ne.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=user_queries)
 
 @app.route('/home_mal', methods=['GET', 'POST'])
 def home_mal():
     bible_api_key = os.getenv("BIBLE_API_KEY")
     language = session.get('lang', 'mal')  # Get the language from the session, default to 'en'
-    recent_queries = get_recent_queries_from_session()
+    user_queries = get_recent_queries_from_session()
     # user input from the home input form.
     if request.method == 'POST':
         user_input = request.form['reference']
         language = 'mal'
         print(f"Received user input: {user_input}")  # Debugging statement
 
-        # Search the CSV file for the response
-        response = search_csv(user_input, language)
+        # Search the stored analyses for the response
+        response = search_analyses(user_input, language)
         if not response:
-            # Process the Bible reference if not found in CSV
+            # Process the Bible reference if no analysis is stored
             response = step5_process_bible_reference_mal(user_input, bible_api_key)
+            add_search_fallback(response, user_input, language)
 
             # # Write the query and results to a CSV file
             # if response['analysis'] and response['explanation'] and response['related_verses']:
@@ -246,9 +282,151 @@ def home_mal():
         elif session['lang'] == 'ne':
             return redirect(url_for('home_ne'))
 
-    return render_template('home_mal.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=recent_queries)
+    return render_template('home_mal.html', response=response, bible_api_key=bible_api_key, user_input=user_input, recent_queries=user_queries)
+
+
+
+# Analysis pipeline and home page for each session language
+ANALYSIS_PIPELINES = {
+    'en': step5_process_bible_reference,
+    'ko': step5_process_bible_reference_ko,
+    'ne': step5_process_bible_reference_ne,
+    'mal': step5_process_bible_reference_mal,
+}
+HOME_ENDPOINTS = {'en': 'home', 'ko': 'home_ko', 'ne': 'home_ne', 'mal': 'home_mal'}
+
+def run_analysis_job(user_input, language, bible_api_key):
+    """
+    Runs the analysis pipeline for a language on a job_queue worker (outside any request).
+    """
+    with pipeline_metrics.trace('analysis_job'):
+        if language == 'en':
+            response = step5_process_bible_reference(user_input, bible_api_key, language=language)
+        else:
+            response = ANALYSIS_PIPELINES[language](user_input, bible_api_key)
+    add_search_fallback(response, user_input, language)
+    return response
+
+@app.route('/jobs/analysis', methods=['POST'])
+def submit_analysis_job():
+    """
+    Queues an analysis and returns immediately, e.g. POST {"reference": "John 3:16", "lang": "ko", "priority": "interactive"}
+    Stored analyses are returned at once; otherwise the response has a job id and a status URL to poll.
+    """
+    data = request.get_json(silent=True) or request.form
+    user_input = (data.get('reference') or '').strip()
+    language = data.get('lang') or session.get('lang', 'en')
+    priority = job_queue.PRIORITIES.get(data.get('priority') or 'interactive')
+    if not user_input:
+        return jsonify({'error': 'reference is required'}), 400
+    if language not in ANALYSIS_PIPELINES:
+        return jsonify({'error': f'unknown language: {language}'}), 400
+    if priority is None:
+        return jsonify({'error': f"priority must be one of {', '.join(job_queue.PRIORITIES)}"}), 400
+
+    session['user_input'] = user_input  # Store user input in session for retry
+    response = search_analyses(user_input, language)
+    if response:
+        session['response'] = response
+        add_query_to_session(response.get('requested_reference') or user_input)
+        return jsonify({'status': 'done', 'redirect': url_for(HOME_ENDPOINTS[language])})
+
+    try:
+        job = job_queue.submit(run_analysis_job, user_input, language, os.getenv("BIBLE_API_KEY"),
+                               priority=priority, meta={'user_input': user_input, 'language': language})
+    except job_queue.QueueFull:
+        return jsonify({'error': 'Our servers are loaded, please try again shortly.'}), 503, {'Retry-After': '10'}
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('analysis_job_status', job_id=job.id),
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def analysis_job_status(job_id):
+    """
+    Polling endpoint for a queued analysis. Finished jobs include the result and a URL that opens it.
+    """
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown or expired job'}), 404
+    status = job.to_dict()
+    if job.status == 'queued':
+        status['queued_ahead'] = job_queue.queued_ahead(job)
+    if job.finished:
+        status['result'] = job.result
+        status['redirect'] = url_for('open_analysis_job', job_id=job.id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/open')
+def open_analysis_job(job_id):
+    """
+    Stores a finished job's result in the session and shows it on the language's home page.
+    """
+    job = job_queue.get_job(job_id)
+    if job is None or not job.finished:
+        flash('Query not found in the database.', 'error')
+        return redirect(url_for('home'))
+    response = job.result if job.status == 'done' else {'error': job.error}
+    session['response'] = response
+    session['user_input'] = job.meta['user_input']
+    if response.get('requested_reference'):
+        add_query_to_session(response['requested_reference'])
+    return redirect(url_for(HOME_ENDPOINTS[job.meta['language']]))
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
+@app.route('/stream_analysis')
+def stream_analysis():
+    """
+    Server-sent events version of the home search, e.g. /stream_analysis?reference=John+3:16
+    The passages are sent as soon as they are read from the database, then the explanation
+    tokens as Groq generates them (see step5_stream_bible_reference).
+    """
+    user_input = request.args.get('reference', '').strip()
+    bible_api_key = os.getenv("BIBLE_API_KEY")
+    language = session.get('lang', 'en')
+    session['user_input'] = user_input  # Store user input in session for retry
+    try:
+        reference = step2_parse_bible_reference_en(user_input)
+    except ValueError as e:
+        # Keep the error in the session so the page can render it with the search fallback
+        response = {"error": str(e)}
+        add_search_fallback(response, user_input, language)
+        session['response'] = response
+        return app.response_class(sse_event('error', dict(response, reload=True)), mimetype='text/event-stream')
+    # The session is saved before the body is streamed, so it is updated here rather than in the generator
+    add_query_to_session(format_reference(reference))
+
+    def generate():
+        for event, data in step5_stream_bible_reference(user_input, reference, bible_api_key, language):
+            yield sse_event(event, data)
+
+    return app.response_class(stream_with_context(generate()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/search')
+def search():
+    """
+    Full-text search over the session language's translation, e.g. /search?q=living+water&page=2
+    """
+    query_text = request.args.get('q', '').strip()
+    language = request.args.get('lang') or session.get('lang', 'en')
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', 20, type=int)
+    if not query_text:
+        return jsonify({'query': '', 'page': page, 'page_size': page_size, 'total': 0, 'results': []})
+    return jsonify(search_verses(query_text, language, page, page_size))
 
+SEARCH_FALLBACK_RESULTS = 10
+
+def add_search_fallback(response, user_input, language):
+    """
+    When the input could not be processed as a reference, attach full-text matches for it instead.
+    """
+    if response and response.get('error'):
+        response['search_results'] = search_verses(user_input, language)['results'][:SEARCH_FALLBACK_RESULTS]
 
 @app.route('/set_language')
 def set_language():
@@ -268,10 +446,23 @@ def books_ko():
     print(f"Fetched Korean books: {books}")  # Debugging statement
     return render_template('books_ko.html', books=books, selected_book=None, chapters={}, total_chapters=0)
 
+def book_page_chapters(book_name, get_chapter_fn, get_chapter_numbers_fn):
+    """
+    Returns ({chapter: verses or None}, total chapters) for a book page.
+    Only the chapter being opened (?chapter=N, default the first) is rendered on the server;
+    the others are None and are fetched by the page as they are needed.
+    """
+    chapter_numbers = get_chapter_numbers_fn(book_name)
+    selected = request.args.get('chapter', type=int)
+    if selected not in chapter_numbers:
+        selected = chapter_numbers[0] if chapter_numbers else None
+    chapters = {chapter: (get_chapter_fn(book_name, chapter) if chapter == selected else None)
+                for chapter in chapter_numbers}
+    return chapters, len(chapter_numbers)
+
 @app.route('/books/<book_name>')
 def book_chapters(book_name):
-    chapters = get_chapters(book_name)
-    total_chapters = len(chapters) if chapters else 0
+    chapters, total_chapters = book_page_chapters(book_name, get_chapter, get_chapter_numbers)
     if 'visited' not in session:
         session['visited'] = True
         first_visit = True
@@ -283,8 +474,7 @@ def book_chapters(book_name):
 
 @app.route('/books_ko/<book_name>')
 def book_chapters_ko(book_name):
-    chapters = get_chapters_ko(book_name)
-    total_chapters = len(chapters) if chapters else 0
+    chapters, total_chapters = book_page_chapters(book_name, get_chapter_ko, get_chapter_numbers_ko)
     if 'visited' not in session:
         session['visited'] = True
         first_visit = True
@@ -306,8 +496,7 @@ def books_mal():
 
 @app.route('/books_mal/<book_name>')
 def book_chapters_mal(book_name):
-    chapters = get_chapters_mal(book_name)
-    total_chapters = len(chapters) if chapters else 0
+    chapters, total_chapters = book_page_chapters(book_name, get_chapter_mal, get_chapter_numbers_mal)
     if 'visited' not in session:
         session['visited'] = True
         first_visit = True
@@ -319,8 +508,7 @@ def book_chapters_mal(book_name):
 
 @app.route('/books_ne/<book_name>')
 def book_chapters_ne(book_name):
-    chapters = get_chapters_ne(book_name)
-    total_chapters = len(chapters) if chapters else 0
+    chapters, total_chapters = book_page_chapters(book_name, get_chapter_ne, get_chapter_numbers_ne)
     if 'visited' not in session:
         session['visited'] = True
         first_visit = True
@@ -569,10 +757,6 @@ def fetch_verse():
     else:
         start_verse = end_verse = int(verse)
 
-    # Check if the book is Revelation and change the name
-    if book.lower() == 'revelation':
-        book = 'Revelation of John'
-
     verses = query_kjv_db(book, chapter, start_verse, end_verse)
     if verses:
         return jsonify({'text': ' '.join([v['text'] for v in verses])})
@@ -591,16 +775,133 @@ def fetch_verse_ko():
     else:
         start_verse = end_verse = int(verse)
 
-    # Check if the book is Revelation and change the name
-    if book.lower() == 'revelation':
-        book = 'Revelation of John'
-
     verses = query_korrv_db(book, chapter, start_verse, end_verse)
     if verses:
         return jsonify({'text': ' '.join([v['text'] for v in verses])})
     else:
         return jsonify({'text': 'Verse not found.'})
 
+# Batch verse lookup per session language, and the most references accepted in one request
+BATCH_QUERIES = {
+    'en': query_kjv_batch,
+    'ko': query_korrv_batch,
+    'ne': query_ne_bible_batch,
+    'mal': query_mal_bible_batch,
+}
+MAX_BATCH_REFERENCES = 50
+
+@app.route('/fetch_verses_batch', methods=['POST'])
+def fetch_verses_batch():
+    """
+    Resolves every {book, chapter, verse} reference in the posted JSON in one pass.
+    The verse may be a single number or a range such as "16-18".
+    """
+    data = request.get_json(silent=True) or {}
+    language = data.get('lang') or session.get('lang', 'en')
+    batch_query = BATCH_QUERIES.get(language, query_kjv_batch)
+    references = data.get('references', [])[:MAX_BATCH_REFERENCES]
+
+    lookups = []
+    positions = []
+    for i, ref in enumerate(references):
+        try:
+            book = str(ref['book'])
+            chapter = int(ref['chapter'])
+            verse = str(ref['verse'])
+            if '-' in verse:
+                start_verse, end_verse = map(int, verse.split('-'))
+            else:
+                start_verse = end_verse = int(verse)
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        lookups.append((book, chapter, start_verse, end_verse))
+        positions.append(i)
+
+    texts = ['Verse not found.'] * len(references)
+    for i, verses in zip(positions, batch_query(lookups)):
+        if verses:
+            texts[i] = ' '.join([v['text'] for v in verses])
+
+    results = []
+    for ref, text in zip(references, texts):
+        ref = ref if isinstance(ref, dict) else {}
+        results.append({'book': ref.get('book'), 'chapter': ref.get('chapter'), 'verse': ref.get('verse'), 'text': text})
+    return jsonify({'results': results})
+
+@app.route('/complete_books')
+def complete_book_names():
+    """
+    Book-name autocomplete in the session language, e.g. /complete_books?q=1 jo
+    """
+    prefix = request.args.get('q', '')
+    language = request.args.get('lang') or session.get('lang', 'en')
+    translation = canon.LANGUAGE_TRANSLATIONS.get(language, 'kjv')
+    return jsonify({'books': complete_books(prefix, translation)})
+
+@app.route('/parallel')
+def parallel():
+    """
+    Returns one passage in several translations, e.g.
+    /parallel?book=요한복음&chapter=3&verse=16-18&translations=kjv,korrv
+    /parallel?id=43003016&translations=en,ko
+    The book may be named in any supported language; verses use KJV numbering.
+    translations accepts translation keys or session languages and defaults to every translation.
+    """
+    if request.args.get('id'):
+        try:
+            book, chapter, start_verse = canon.split_verse_id(int(request.args['id']))
+        except ValueError:
+            return jsonify({'error': 'Invalid verse id.'}), 400
+        end_verse = start_verse
+    else:
+        book = resolve_book(request.args.get('book', ''))
+        chapter = request.args.get('chapter', type=int)
+        verse = request.args.get('verse', '')
+        try:
+            if '-' in verse:
+                start_verse, end_verse = map(int, verse.split('-'))
+            else:
+                start_verse = end_verse = int(verse) if verse else None
+        except ValueError:
+            return jsonify({'error': 'Invalid verse.'}), 400
+    if not book or not 1 <= book <= len(canon.BOOKS) or not chapter:
+        return jsonify({'error': 'Unknown book or chapter.'}), 400
+
+    requested = request.args.get('translations')
+    translations = []
+    for name in (requested.split(',') if requested else canon.TRANSLATION_NAME_COLUMNS):
+        name = canon.LANGUAGE_TRANSLATIONS.get(name.strip(), name.strip())
+        if name in canon.TRANSLATION_NAME_COLUMNS and name not in translations:
+            translations.append(name)
+
+    passages = []
+    for translation in translations:
+        book_name = canon.book_name(book, translation)
+        target_chapter, first, last = canon.to_translation(translation, book, chapter, start_verse, end_verse)
+        try:
+            verses = get_store(translation).get_verses(book_name, target_chapter, first, last)
+        except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+            print(f"Error: {e}")
+            verses = []
+        passages.append({
+            'translation': translation,
+            'book': book_name,
+            'chapter': target_chapter,
+            'aligned': canon.is_aligned(translation, book, target_chapter),  # verse numbers may differ from KJV if not
+            'verses': [{'id': canon.to_canonical(translation, book, target_chapter, verse_num),
+                        'verse': verse_num, 'text': text} for verse_num, text in verses],
+        })
+
+    return jsonify({
+        'book': book,
+        'osis': canon.osis_id(book),
+        'chapter': chapter,
+        'start_verse': start_verse,
+        'end_verse': end_verse,
+        'translations': passages,
+    })
+
 
 @app.route('/enhance_ko', methods=['POST'])
 def enhance_ko():
@@ -621,13 +922,60 @@ def enhance_ne():
         return jsonify({ 'translated_text': translated_text })
     return jsonify({ 'translated_text': text }), 400
 
+def chapter_payload_response(translation, book, chapter):
+    """
+    Serves a pre-rendered chapter payload, compressed if the client accepts it.
+    """
+    accepted = [encoding for encoding in ('br', 'gzip') if encoding in request.accept_encodings]
+    book = resolve_book_name(book, translation) or book
+    body, encoding = get_chapter_payload(translation, book, chapter, accepted)
+    response = app.response_class(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
 @app.route('/fetch_chapter')
 def fetch_chapter():
     book = request.args.get('book')
     chapter = int(request.args.get('chapter'))
-    chapters = get_chapters(book)
-    verses = chapters.get(chapter, [])
-    return jsonify({'verses': verses})
+    return chapter_payload_response('kjv', book, chapter)
+
+@app.route('/fetch_chapter_ko')
+def fetch_chapter_ko():
+    book = request.args.get('book')
+    chapter = int(request.args.get('chapter'))
+    return chapter_payload_response('korrv', book, chapter)
+
+@app.route('/fetch_chapter_ne')
+def fetch_chapter_ne():
+    book = request.args.get('book')
+    chapter = int(request.args.get('chapter'))
+    return chapter_payload_response('ne', book, chapter)
+
+@app.route('/fetch_chapter_mal')
+def fetch_chapter_mal():
+    book = request.args.get('book')
+    chapter = int(request.args.get('chapter'))
+    return chapter_payload_response('mal1910', book, chapter)
+
+@app.route('/db_stats')
+def db_stats():
+    stats = bible_db.get_stats()
+    stats['chapter_cache'] = chapter_cache.get_stats()
+    stats['llm'] = llm_clients.get_stats()
+    stats['analysis_jobs'] = job_queue.get_stats()
+    stats['analysis_cache'] = analysis_cache.get_stats()
+    stats['singleflight'] = singleflight.get_stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    """
+    Per-route step latency histograms and LLM token and cost counters, for Prometheus.
+    """
+    return app.response_class(pipeline_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/support_en')
 def support_en():
@@ -794,48 +1142,33 @@ def send_sms_ko():
 
     return redirect(url_for('support_ko'))
 
-def search_csv(user_input, language):
-    print(f"Searching CSV for user input: {user_input}, language: {language}")  # Debugging statement
-    with open('database/queries.csv', mode='r') as file:
-        reader = csv.reader(file)
-        for row in reader:
-            if row[0] == user_input and row[1] == language:
-                try:
-                    retrieved_passages = json.loads(row[2])
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON: {e}")
-                    continue
-                print(f"Found in CSV: {row[0]}")  # Debugging statement
-                return {
-                    "requested_reference": row[0],
-                    "retrieved_passages": retrieved_passages,
-                    "analysis": row[3],
-                    "explanation": row[4],
-                    "related_verses": row[5]
-                }
-    print("Not found in CSV")  # Debugging statement
-    return None
+def search_analyses(user_input, language):
+    # Matches by canonical reference, so "Jn 3:16" finds the stored "John 3:16"
+    response = analysis_cache.find_input(user_input, language)
+    print(f"Found stored analysis: {response['requested_reference']}" if response else "No stored analysis")  # Debugging statement
+    return response
 
 def get_recent_queries(language):
-    recent_queries = []
-    with open('database/queries.csv', mode='r') as file:
-        reader = csv.reader(file)
-        for row in reader:
-            if row[1] == language:
-                recent_queries.append(row)
-    return recent_queries[-8:]  # Return the last 5 items
+    return recent_queries.recent(language)  # The last analyses stored for the language, newest first
+
+def get_user_id():
+    """
+    Returns the visitor's id, which keys their recent queries (see recent_queries.py).
+    Lists kept in the session by earlier versions are moved to the store.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        user_id = session['user_id'] = uuid.uuid4().hex
+    for reference in session.pop('recent_queries', []):
+        recent_queries.add_for_user(user_id, reference)
+    return user_id
 
 def get_recent_queries_from_session():
-    return session.get('recent_queries', [])
+    return recent_queries.for_user(get_user_id())[::-1]  # The visitor's own queries, oldest first
 
 def add_query_to_session(requested_reference):
-    recent_queries = session.get('recent_queries', [])
-    if requested_reference not in recent_queries:
-        recent_queries.append(requested_reference)
-        print(f"Added query to session: {requested_reference}")  # Debugging statement
-        if len(recent_queries) > 5:
-            recent_queries.pop(0)  # Keep only the last 5 queries
-        session['recent_queries'] = recent_queries
+    recent_queries.add_for_user(get_user_id(), requested_reference)
+    print(f"Added query to recent queries: {requested_reference}")  # Debugging statement
 
 
 def is_english(text: str) -> bool:
@@ -1,13 +1,13 @@
 import requests
 import os
 import re
-import csv
-import json
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import llm_clients
+import analysis_pipeline
 from typing import Optional, List, Dict
 from dataclasses import dataclass
 from query_mal1920 import query_mal_bible_json  # Import the query_mal_bible_json function
+from reference_parser import parse_reference
+import canon
 from flask import Flask, session, request, redirect, url_for, render_template, jsonify
 from dotenv import load_dotenv
 
@@ -28,7 +28,8 @@ def step1_create_reference_parser_chain():
     """
     1. Creates the first chain that takes natural language input and returns structured Bible references.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'mal1910.reference_parser',
         input_variables=["user_input"],
         template="""Parse the following Bible reference into a structured format.
 If a chapter is mentioned without verses, assume the entire chapter is requested.
@@ -53,18 +54,25 @@ BOOK: [only the book name in the English version]
 CHAPTER: [number or 'None' if not specified]
 START_VERSE: [number or 'None' if entire chapter]
 END_VERSE: [number or 'None' if single verse or entire chapter]
-"""
+""",
+        model="mixtral-8x7b-32768"
     )
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="mixtral-8x7b-32768")
-    chain = prompt_template | llm
-    return chain
 
 def step2_parse_bible_reference(user_input: str) -> BibleReference:
     print("STEP 2")
     """
-    2. Uses LLM to parse natural language input into structured format.
-    This is where we first use Groq to interpret the user's request.
+    2. Parses natural language input into structured format.
+    Well-formed references are parsed locally; Groq is only used for anything else.
     """
+    parsed = parse_reference(user_input, 'mal1910')
+    if parsed is not None:
+        return BibleReference(
+            book=canon.book_name(parsed.book, 'mal1910'),
+            chapter=parsed.chapter,
+            start_verse=parsed.start_verse,
+            end_verse=parsed.end_verse
+        )
+
     chain = step1_create_reference_parser_chain()
     response = chain.invoke({"user_input": user_input})
 
@@ -136,7 +144,8 @@ def step4_create_explanation_chain():
     """
     4. Creates the second chain that explains verses and suggests related passages.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'mal1910.explanation',
         input_variables=["verse_reference", "verse_text"],
         template="""Analyze this Bible passage in Malayalam:
 Reference: {verse_reference}
@@ -157,134 +166,62 @@ If you are going to reference any specific verses from the bible, use these exac
         "I Timothy", "II Timothy", "Titus", "Philemon", "Hebrews", "James", "I Peter", "II Peter",
         "I John", "II John", "III John", "Jude", "Revelation of John"
 
-Response:"""
+Response:""",
+        model="mixtral-8x7b-32768"
     )
 
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="mixtral-8x7b-32768")
-    chain = prompt_template | llm
-    return chain
-
-def step5_process_bible_reference_mal(user_input: str, bible_api_key: str) -> Dict[str, str]:
-    print("STEP 5")
+def split_explanation(explanation_text: str):
     """
-    5. Main function that orchestrates the entire process:
-       - First uses Groq to interpret the reference
-       - Then fetches the verses
-       - Finally uses Groq again to analyze and explain
+    Splits the explanation chain output into (analysis, explanation, related verses) at its numbered sections.
     """
-    try:
-        # Step 1: Parse the natural language reference
-        print("STEP 1")
-        reference = step2_parse_bible_reference(user_input)
-    except ValueError as e:
-        return {"error": str(e)}
-    
-    def search_csv(reference, language):
-        print(f"Searching CSV for reference whtin app py : {reference}")  # Debugging statement
-        with open('database/queries.csv', mode='r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row[0] == reference and row[1] == language:
-                    try:
-                        retrieved_passages = json.loads(row[2])
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON: {e}")
-                        continue
-                    print(f"Found reference in CSV: {row[0]}")  # Debugging statement
-                    return {
-                        "requested_reference": row[0],
-                        "language": row[1],
-                        "retrieved_passages": retrieved_passages,
-                        "analysis": row[3],
-                        "explanation": row[4],
-                        "related_verses": row[5]
-                    }
-        print("Reference not found in CSV")  # Debugging statement
-        return None
-
-    requested_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        requested_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            requested_reference += f"-{reference.end_verse}"
-
-    # Search the CSV file for the reference
-    response = search_csv(requested_reference, 'mal')
-    if response:
-        return response
-
-    # Step 2: Fetch the verse(s)
-    print("STEP 2")
-    verses = step3_fetch_bible_verses_mal(reference, bible_api_key)
-    if not verses:
-        return {"error": f"Failed to fetch chapter {reference.chapter} of {reference.book}. It may not exist."}
-
-    # Print fetched verses for debugging
-    print(f"Fetched verses: {verses}")
+    related_verses_start = explanation_text.find("3.")
+    related_verses = explanation_text[related_verses_start:] if related_verses_start != -1 else ""
 
-    # Step 3: Display verses and get explanation
-    print("STEP 3")
-    all_text = ""
-    for verse in verses:
-        all_text += f"{verse['text']}\n"  # Only append the verse text, not the verse number
-    print(all_text)
+    explanation_start = explanation_text.find("2.")
+    explanation = explanation_text[explanation_start:related_verses_start].strip() if explanation_start != -1 and related_verses_start != -1 else ""
+    analysis = explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text
 
-    # Determine the verse reference for the explanation
-    verse_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        verse_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            verse_reference += f"-{reference.end_verse}"
+    print(f"Explanation: {explanation}")  # Debugging statement
+    print(f"Related verses: {related_verses}")  # Debugging statement
+    return analysis, explanation, related_verses
 
-    # Step 4: Get the explanation and related verses
-    print("STEP 4 started")
+def explain_passage(verse_reference: str, verse_text: str):
+    """
+    4. Runs the explanation chain (classic pipeline mode) and splits its output into sections.
+    """
     chain = step4_create_explanation_chain()
     explanation = chain.invoke({
         "verse_reference": verse_reference,
-        "verse_text": all_text
+        "verse_text": verse_text
     })
-
-    # Extract the related Bible verses section
     explanation_text = explanation.content if hasattr(explanation, 'content') else explanation
     print(f"\nExplanation text after step 4 has processed: {explanation_text}")  # Debugging statement
-    related_verses_start_1 = explanation_text.find("3.")
-    related_verses_start_2 = explanation_text.find("3.")
-    related_verses_start = max(related_verses_start_1, related_verses_start_2)    
-    related_verses = explanation_text[related_verses_start:] if related_verses_start != -1 else ""
-
-
-    explanation_start_1 = explanation_text.find("2.")
-    explanation_start_2 = explanation_text.find("2.")
-    explanation_start = max(explanation_start_1, explanation_start_2)
-    explanation = explanation_text[explanation_start:related_verses_start].strip() if explanation_start != -1 and related_verses_start != -1 else ""
-
-    print(f"Explanation: {explanation}")  # Debugging statement
-    print(f"Related verses: {related_verses}")  # Debugging statement
-
-    requested_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        requested_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            requested_reference += f"-{reference.end_verse}"
-
-
-    # Write the query and results to a CSV file
-    if explanation:
-        with open('database/queries.csv', mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([requested_reference, "mal", json.dumps(verses), explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text, explanation, related_verses])
-            print(f"Wrote to CSV: {requested_reference}")  # Debugging statement
- 
-
-    return {
-        "interpretation": f"You searched for: {user_input}",
-        "requested_reference": requested_reference,
-        "retrieved_passages": verses,
-        "analysis": explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text,
-        "related_verses": related_verses.strip(),
-        "explanation": explanation,
-        "all_text": all_text,
-    }
+    return split_explanation(explanation_text)
+
+PIPELINE = analysis_pipeline.LanguagePipeline(
+    language='mal',
+    translation='mal1910',
+    language_name='Malayalam, in Malayalam script only',
+    model="mixtral-8x7b-32768",
+    reference_cls=BibleReference,
+    parse=step2_parse_bible_reference,
+    fetch=step3_fetch_bible_verses_mal,
+    explain=explain_passage
+)
+
+def step5_process_bible_reference_mal(user_input: str, bible_api_key: str, mode: Optional[str] = None,
+                                      use_cache: bool = True) -> Dict[str, str]:
+    print("STEP 5")
+    """
+    5. Main function that orchestrates the entire process:
+       - First uses Groq to interpret the reference
+       - Then fetches the verses
+       - Finally uses Groq again to analyze and explain, in the pipeline mode configured for this language
+    """
+    response = analysis_pipeline.process_reference(PIPELINE, user_input, bible_api_key, mode, use_cache)
+    if "retrieved_passages" in response:
+        response["all_text"] = analysis_pipeline.passage_text(response["retrieved_passages"])
+    return response
 
 # This is the entry point of the script when run directly
 if __name__ == "__main__":
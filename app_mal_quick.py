@@ -1,11 +1,11 @@
-import os
 import re
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import llm_clients
 from typing import Optional, List, Dict
 from dataclasses import dataclass
 from query_mal1920 import query_mal_bible_json  # Import the query_mal_bible_json function
+from reference_parser import parse_reference
+import canon
 from flask import Flask, session, request, redirect, url_for, render_template, jsonify
 
 load_dotenv()
@@ -25,7 +25,8 @@ def step1_create_reference_parser_chain():
     """
     1. Creates the first chain that takes natural language input and returns structured Bible references.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'mal1910.reference_parser',
         input_variables=["user_input"],
         template="""Parse the following Bible reference into a structured format.
 If a chapter is mentioned without verses, assume the entire chapter is requested.
@@ -47,18 +48,25 @@ BOOK: [only the book name in the English version]
 CHAPTER: [number or 'None' if not specified]
 START_VERSE: [number or 'None' if entire chapter]
 END_VERSE: [number or 'None' if single verse or entire chapter]
-"""
+""",
+        model="mixtral-8x7b-32768"
     )
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="mixtral-8x7b-32768")
-    chain = prompt_template | llm
-    return chain
 
 def step2_parse_bible_reference(user_input: str) -> BibleReference:
     print("STEP 2")
     """
-    2. Uses LLM to parse natural language input into structured format.
-    This is where we first use Groq to interpret the user's request.
+    2. Parses natural language input into structured format.
+    Well-formed references are parsed locally; Groq is only used for anything else.
     """
+    parsed = parse_reference(user_input, 'mal1910')
+    if parsed is not None:
+        return BibleReference(
+            book=canon.book_name(parsed.book, 'mal1910'),
+            chapter=parsed.chapter,
+            start_verse=parsed.start_verse,
+            end_verse=parsed.end_verse
+        )
+
     chain = step1_create_reference_parser_chain()
     response = chain.invoke({"user_input": user_input})
 
@@ -1,13 +1,13 @@
 import requests
 import os
 import re
-import csv
-import json
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import llm_clients
+import analysis_pipeline
 from typing import Optional, List, Dict
 from dataclasses import dataclass
 from query_NE_bible import query_ne_bible_json  # Import the query_ne_bible_json function
+from reference_parser import parse_reference
+import canon
 from flask import Flask, session, request, redirect, url_for, render_template, jsonify
 from dotenv import load_dotenv
 
@@ -28,7 +28,8 @@ def step1_create_reference_parser_chain():
     """
     1. Creates the first chain that takes natural language input and returns structured Bible references.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'ne.reference_parser',
         input_variables=["user_input"],
         template="""Parse the following Bible reference into a structured format.
 If a chapter is mentioned without verses, assume the entire chapter is requested.
@@ -50,18 +51,25 @@ BOOK: [only the book name]
 CHAPTER: [number or 'None' if not specified]
 START_VERSE: [number or 'None' if entire chapter]
 END_VERSE: [number or 'None' if single verse or entire chapter]
-"""
+""",
+        model="mixtral-8x7b-32768"
     )
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="mixtral-8x7b-32768")
-    chain = prompt_template | llm
-    return chain
 
 def step2_parse_bible_reference(user_input: str) -> BibleReference:
     print("STEP 2")
     """
-    2. Uses LLM to parse natural language input into structured format.
-    This is where we first use Groq to interpret the user's request.
+    2. Parses natural language input into structured format.
+    Well-formed references are parsed locally; Groq is only used for anything else.
     """
+    parsed = parse_reference(user_input, 'ne')
+    if parsed is not None:
+        return BibleReference(
+            book=canon.book_name(parsed.book, 'ne'),
+            chapter=parsed.chapter,
+            start_verse=parsed.start_verse,
+            end_verse=parsed.end_verse
+        )
+
     chain = step1_create_reference_parser_chain()
     response = chain.invoke({"user_input": user_input})
 
@@ -133,7 +141,8 @@ def step4_create_explanation_chain():
     """
     4. Creates the second chain that explains verses and suggests related passages.
     """
-    prompt_template = PromptTemplate(
+    return llm_clients.get_chain(
+        'ne.explanation',
         input_variables=["verse_reference", "verse_text"],
         template="""Analyze this Bible passage in Nepali:
 Reference: {verse_reference}
@@ -155,134 +164,64 @@ If you are going to reference any specific verses from the bible, use these exac
         "१ यूहन्ना", "२ यूहन्ना", "३ यूहन्ना", "यहूदा", "प्रकाश".
 for यूहन्ना, make it यूहन्ना.
 
-Response:"""
+Response:""",
+        model="mixtral-8x7b-32768"
     )
 
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="mixtral-8x7b-32768")
-    chain = prompt_template | llm
-    return chain
-
-def step5_process_bible_reference_ne(user_input: str, bible_api_key: str) -> Dict[str, str]:
-    print("STEP 5")
+def split_explanation(explanation_text: str):
     """
-    5. Main function that orchestrates the entire process:
-       - First uses Groq to interpret the reference
-       - Then fetches the verses
-       - Finally uses Groq again to analyze and explain
+    Splits the explanation chain output into (analysis, explanation, related verses) at its numbered sections.
     """
-    try:
-        # Step 1: Parse the natural language reference
-        print("STEP 1")
-        reference = step2_parse_bible_reference(user_input)
-    except ValueError as e:
-        return {"error": str(e)}
-    
-    def search_csv(reference, language):
-        print(f"Searching CSV for reference whtin app py : {reference}")  # Debugging statement
-        with open('database/queries.csv', mode='r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row[0] == reference and row[1] == language:
-                    try:
-                        retrieved_passages = json.loads(row[2])
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON: {e}")
-                        continue
-                    print(f"Found reference in CSV: {row[0]}")  # Debugging statement
-                    return {
-                        "requested_reference": row[0],
-                        "language": row[1],
-                        "retrieved_passages": retrieved_passages,
-                        "analysis": row[3],
-                        "explanation": row[4],
-                        "related_verses": row[5]
-                    }
-        print("Reference not found in CSV")  # Debugging statement
-        return None
-
-    requested_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        requested_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            requested_reference += f"-{reference.end_verse}"
-
-    # Search the CSV file for the reference
-    response = search_csv(requested_reference, 'ne')
-    if response:
-        return response
-
-    # Step 2: Fetch the verse(s)
-    print("STEP 2")
-    verses = step3_fetch_bible_verses(reference, bible_api_key)
-    if not verses:
-        return {"error": f"Failed to fetch chapter {reference.chapter} of {reference.book}. It may not exist."}
-
-    # Print fetched verses for debugging
-    print(f"Fetched verses: {verses}")
-
-    # Step 3: Display verses and get explanation
-    print("STEP 3")
-    all_text = ""
-    for verse in verses:
-        all_text += f"{verse['text']}\n"  # Only append the verse text, not the verse number
-    print(all_text)
-
-    # Determine the verse reference for the explanation
-    verse_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        verse_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            verse_reference += f"-{reference.end_verse}"
-    
-
-    # Step 4: Get the explanation and related verses
-    print("STEP 4 started")
-    chain = step4_create_explanation_chain()
-    explanation = chain.invoke({
-        "verse_reference": verse_reference,
-        "verse_text": all_text
-    })
-
-    # Extract the related Bible verses section
-    explanation_text = explanation.content if hasattr(explanation, 'content') else explanation
-    print(f"\nExplanation text after step 4 has processed: {explanation_text}")  # Debugging statement
     related_verses_start_1 = explanation_text.find("३.")
     related_verses_start_2 = explanation_text.find("3.")
-    related_verses_start = max(related_verses_start_1, related_verses_start_2)    
+    related_verses_start = max(related_verses_start_1, related_verses_start_2)
     related_verses = explanation_text[related_verses_start:] if related_verses_start != -1 else ""
 
-
     explanation_start_1 = explanation_text.find("२.")
     explanation_start_2 = explanation_text.find("2.")
     explanation_start = max(explanation_start_1, explanation_start_2)
     explanation = explanation_text[explanation_start:related_verses_start].strip() if explanation_start != -1 and related_verses_start != -1 else ""
+    analysis = explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text
 
     print(f"Explanation: {explanation}")  # Debugging statement
     print(f"Related verses: {related_verses}")  # Debugging statement
+    return analysis, explanation, related_verses
 
-    requested_reference = f"{reference.book} {reference.chapter}"
-    if reference.start_verse is not None:
-        requested_reference += f":{reference.start_verse}"
-        if reference.end_verse is not None and reference.end_verse != reference.start_verse:
-            requested_reference += f"-{reference.end_verse}"
-
-
-    # Write the query and results to a CSV file
-    if explanation:
-        with open('database/queries.csv', mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([requested_reference, "ne", json.dumps(verses), explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text, explanation, related_verses])
-            print(f"Wrote to CSV: {requested_reference}")  # Debugging statement
- 
-
-    return {
-        "interpretation": f"You searched for: {user_input}",
-        "requested_reference": requested_reference,
-        "retrieved_passages": verses,
-        "analysis": explanation_text[:explanation_start].strip() if explanation_start != -1 else explanation_text,
-        "related_verses": related_verses.strip(),
-        "explanation": explanation,
-    }
+def explain_passage(verse_reference: str, verse_text: str):
+    """
+    4. Runs the explanation chain (classic pipeline mode) and splits its output into sections.
+    """
+    chain = step4_create_explanation_chain()
+    explanation = chain.invoke({
+        "verse_reference": verse_reference,
+        "verse_text": verse_text
+    })
+    explanation_text = explanation.content if hasattr(explanation, 'content') else explanation
+    print(f"\nExplanation text after step 4 has processed: {explanation_text}")  # Debugging statement
+    return split_explanation(explanation_text)
+
+PIPELINE = analysis_pipeline.LanguagePipeline(
+    language='ne',
+    translation='ne',
+    language_name='Nepali, in Nepali script only',
+    model="mixtral-8x7b-32768",
+    reference_cls=BibleReference,
+    parse=step2_parse_bible_reference,
+    fetch=step3_fetch_bible_verses,
+    explain=explain_passage
+)
+
+def step5_process_bible_reference_ne(user_input: str, bible_api_key: str, mode: Optional[str] = None,
+                                     use_cache: bool = True) -> Dict[str, str]:
+    print("STEP 5")
+    """
+    5. Main function that orchestrates the entire process:
+       - First uses Groq to interpret the reference
+       - Then fetches the verses
+       - Finally uses Groq again to analyze and explain, in the pipeline mode configured for this language
+    """
+    response = analysis_pipeline.process_reference(PIPELINE, user_input, bible_api_key, mode, use_cache)
+    return response
 
 # This is the entry point of the script when run directly
 if __name__ == "__main__":
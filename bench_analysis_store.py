@@ -0,0 +1,111 @@
+"""
+Compares looking up a stored analysis in the SQLite analysis store against the linear
+queries.csv scan it replaced, at 1k, 100k and 1M stored analyses.
+
+Usage:
+    python bench_analysis_store.py                    # 1000,100000,1000000 analyses
+    python bench_analysis_store.py 1000,100000 2000   # sizes, bytes of text per analysis
+
+Synthetic analyses are written to a CSV in a temporary directory and migrated into a fresh
+store with the same import the app uses, so the migration throughput is reported as well.
+"""
+import csv
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List
+import canon
+from analysis_cache import stored_passage
+from analysis_store import AnalysisStore
+
+LANGUAGES = ('en', 'ko', 'ne', 'mal')
+STORE_LOOKUPS = 2000
+
+
+def _rows(count: int, payload: int):
+    rng = random.Random(count)
+    text = 'x' * (payload // 3)
+    seen = set()
+    while len(seen) < count:
+        book = rng.randint(1, len(canon.BOOKS))
+        chapter = rng.randint(1, 150)
+        start = rng.randint(1, 170)
+        end = start + rng.choice((0, 0, 0, 2, 5, 10))
+        language = rng.choice(LANGUAGES)
+        reference = f"{canon.book_name(book, 'kjv')} {chapter}:{start}" + (f"-{end}" if end != start else '')
+        if (reference, language) in seen:
+            continue
+        seen.add((reference, language))
+        verses = [{"verse_num": verse, "text": "verse text"} for verse in range(start, end + 1)]
+        yield [reference, language, json.dumps(verses), text, text, text]
+
+
+def _csv_search(path: str, reference: str, language: str):
+    # The lookup the store replaced: parse every row until the reference matches
+    with open(path, mode='r') as file:
+        for row in csv.reader(file):
+            if row[0] == reference and row[1] == language:
+                return json.loads(row[2])
+    return None
+
+
+def _time(lookup: Callable[[], object], runs: int) -> List[float]:
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        lookup()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def _report(name: str, durations: List[float]):
+    ordered = sorted(durations)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"  {name:<24} p50 {statistics.median(ordered) * 1000:>10.3f} ms   p95 {p95 * 1000:>10.3f} ms   "
+          f"({len(ordered)} lookups)")
+
+
+def run(count: int, payload: int):
+    print(f"{count} analyses, {payload} bytes of text each")
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'queries.csv')
+        with open(csv_path, mode='w', newline='') as file:
+            rows = list(_rows(count, payload))
+            csv.writer(file).writerows(rows)
+        print(f"  queries.csv              {os.path.getsize(csv_path) / 1e6:.1f} MB")
+
+        store = AnalysisStore(os.path.join(directory, 'analyses.db'))
+        started = time.perf_counter()
+        store.import_csv(csv_path, stored_passage)
+        elapsed = time.perf_counter() - started
+        print(f"  migration                {elapsed:.1f} s ({count / elapsed:,.0f} analyses/s), "
+              f"{os.path.getsize(store.path) / 1e6:.1f} MB")
+
+        rng = random.Random(0)
+        samples = [rng.choice(rows) for _ in range(STORE_LOOKUPS)]
+        passages = [(stored_passage(row[0], row[1]), row[1]) for row in samples]
+        texts = iter(samples)
+        _report('store by text', _time(lambda: store.find_text(*next(texts)[:2]), STORE_LOOKUPS))
+        keys = iter(passages)
+        _report('store by passage', _time(lambda: store.find_passage(*next(keys)), STORE_LOOKUPS))
+        # The first verse of each sample, found through the stored range that contains it
+        covering = iter([((book, chapter, start, start), language)
+                         for (book, chapter, start, _), language in passages])
+        _report('store covering verse', _time(lambda: store.find_covering(*next(covering)), STORE_LOOKUPS))
+        _report('store miss', _time(lambda: store.find_text('Nowhere 1:1', 'en'), STORE_LOOKUPS))
+
+        csv_lookups = max(3, min(200, 200_000 // count))
+        csv_samples = iter(samples)
+        _report('csv scan hit', _time(lambda: _csv_search(csv_path, *next(csv_samples)[:2]), csv_lookups))
+        _report('csv scan miss', _time(lambda: _csv_search(csv_path, 'Nowhere 1:1', 'en'), csv_lookups))
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1000, 100000, 1000000]
+    payload = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    for size in sizes:
+        run(size, payload)
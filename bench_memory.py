@@ -0,0 +1,91 @@
+"""
+Compares the memory used by worker processes that each load a translation from its
+source (SQLite/JSON parsed into the process) against workers that map the .bbin file.
+
+Usage:
+    python bench_memory.py                  # kjv, 4 workers
+    python bench_memory.py korrv 8          # translation, number of workers
+
+Every worker reads every verse so all pages are resident, then all workers report
+their memory at the same time. PSS (proportional set size) splits shared pages between
+the processes mapping them, so summing it gives the real total. Linux only.
+"""
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict
+
+
+def _memory_kib() -> Dict[str, int]:
+    """
+    Reads Rss, Pss and private memory (KiB) of the current process from /proc.
+    """
+    values = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def _worker(translation: str, use_binary: bool, barrier, results):
+    from verse_store import load_store
+    baseline = _memory_kib()
+    started = time.perf_counter()
+    store = load_store(translation, use_binary=use_binary)
+    load_seconds = time.perf_counter() - started
+    # Touch every verse so the whole text is resident
+    for slot in range(len(store)):
+        store.text(slot)
+    barrier.wait()
+    memory = _memory_kib()
+    results.put({
+        'load_seconds': load_seconds,
+        'rss': memory['rss'] - baseline['rss'],
+        'pss': memory['pss'] - baseline['pss'],
+        'private': memory['private'] - baseline['private'],
+    })
+    # Stay alive until every worker has measured, so shared pages are split between all of them
+    barrier.wait()
+
+
+def run(translation: str, workers: int, use_binary: bool) -> Dict[str, float]:
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(translation, use_binary, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        'load_seconds': max(report['load_seconds'] for report in reports),
+        'rss_mib': sum(report['rss'] for report in reports) / 1024,
+        'pss_mib': sum(report['pss'] for report in reports) / 1024,
+        'private_mib': sum(report['private'] for report in reports) / 1024,
+    }
+
+
+if __name__ == "__main__":
+    from verse_store import TRANSLATIONS
+    translation = sys.argv[1] if len(sys.argv) > 1 else 'kjv'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    binary = TRANSLATIONS[translation]['binary']
+    if not os.path.exists(binary):
+        print(f"{binary} not found, run: python bible_binary.py {translation}")
+        sys.exit(1)
+
+    print(f"{translation}, {workers} workers (memory added by loading the store, summed over workers)")
+    print(f"{'source':<8} {'load s':>8} {'RSS MiB':>10} {'PSS MiB':>10} {'private MiB':>12}")
+    for label, use_binary in (('parsed', False), ('mmap', True)):
+        stats = run(translation, workers, use_binary)
+        print(f"{label:<8} {stats['load_seconds']:>8.3f} {stats['rss_mib']:>10.1f} "
+              f"{stats['pss_mib']:>10.1f} {stats['private_mib']:>12.1f}")
@@ -0,0 +1,86 @@
+"""
+Compares the analysis pipeline modes (classic, structured, sections) per language:
+end-to-end latency (p50/p95), LLM calls and tokens per query, against the live Groq API.
+
+Usage:
+    python bench_pipeline.py                # every language, 3 runs of each sample
+    python bench_pipeline.py ko 5           # one language, runs per sample
+    python bench_pipeline.py all 3 sections # only some modes (comma separated)
+
+The analysis cache is neither read nor written, so every run makes its LLM calls.
+Pick a mode per language with PIPELINE_MODE_<LANG> in .env (see analysis_pipeline.py).
+"""
+import math
+import sys
+import time
+from typing import Dict, List
+import llm_clients
+from analysis_pipeline import PIPELINE_MODES
+
+# A mix of well-formed references (parsed locally) and free text (parsed by the LLM)
+SAMPLES = {
+    'en': ['John 3:16', 'Psalm 23', 'Romans 8:28-30', 'the parable of the good samaritan'],
+    'ko': ['요한복음 3:16', '시편 23편', '로마서 8:28-30', '선한 사마리아인 비유'],
+    'ne': ['यूहन्ना ३:१६', 'भजनसंग्रह २३', 'रोमी ८:२८-३०'],
+    'mal': ['യോഹന്നാൻ 3:16', 'സങ്കീർത്തനങ്ങൾ 23', 'റോമർ 8:28-30'],
+}
+
+
+def _step5(language: str):
+    if language == 'en':
+        from app import step5_process_bible_reference
+        return lambda user_input, mode: step5_process_bible_reference(user_input, None, language='en', mode=mode, use_cache=False)
+    if language == 'ko':
+        from app_ko import step5_process_bible_reference_ko as step5
+    elif language == 'ne':
+        from app_ne import step5_process_bible_reference_ne as step5
+    else:
+        from app_mal import step5_process_bible_reference_mal as step5
+    return lambda user_input, mode: step5(user_input, None, mode=mode, use_cache=False)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def run(language: str, mode: str, runs: int) -> Dict[str, float]:
+    step5 = _step5(language)
+    latencies = []
+    errors = 0
+    before = llm_clients.get_stats()
+    for _ in range(runs):
+        for user_input in SAMPLES[language]:
+            started = time.perf_counter()
+            try:
+                response = step5(user_input, mode)
+            except Exception as e:
+                print(f"  {user_input!r}: {e}")
+                response = {"error": str(e)}
+            latencies.append(time.perf_counter() - started)
+            if response.get("error") or not response.get("explanation"):
+                errors += 1
+    after = llm_clients.get_stats()
+    queries = len(latencies)
+    return {
+        'p50': _percentile(latencies, 50),
+        'p95': _percentile(latencies, 95),
+        'calls': (after['llm_calls'] - before['llm_calls']) / queries,
+        'input_tokens': (after['input_tokens'] - before['input_tokens']) / queries,
+        'output_tokens': (after['output_tokens'] - before['output_tokens']) / queries,
+        'errors': errors,
+    }
+
+
+if __name__ == "__main__":
+    languages = list(SAMPLES) if len(sys.argv) < 2 or sys.argv[1] == 'all' else [sys.argv[1]]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    modes = sys.argv[3].split(',') if len(sys.argv) > 3 else list(PIPELINE_MODES)
+
+    print(f"{'lang':<5} {'mode':<11} {'p50 s':>7} {'p95 s':>7} {'calls':>6} {'in tok':>8} {'out tok':>8} {'failed':>7}")
+    for language in languages:
+        for mode in modes:
+            stats = run(language, mode, runs)
+            print(f"{language:<5} {mode:<11} {stats['p50']:>7.2f} {stats['p95']:>7.2f} {stats['calls']:>6.1f} "
+                  f"{stats['input_tokens']:>8.0f} {stats['output_tokens']:>8.0f} {stats['errors']:>7}")
@@ -0,0 +1,160 @@
+"""
+Compact, memory-mappable binary format for a translation (.bbin).
+
+Layout (little-endian):
+    header   magic b'BBIN', format version (u32), section count (u32)
+    sections one (offset u64, length u64) entry per section, in SECTIONS order
+    data     each section starts on an 8-byte boundary
+
+Sections are the flat arrays of a VerseStore plus the book names:
+    book_chapter_start   u32 x (books + 1)
+    chapter_numbers      u16 x chapters
+    chapter_verse_start  u32 x (chapters + 1)
+    verse_numbers        u16 x verses
+    text_offsets         u32 x (verses + 1)
+    book_name_offsets    u32 x (books + 1)
+    book_names           UTF-8 bytes
+    text_pool            UTF-8 bytes
+
+The file is opened with mmap and the arrays are memoryviews over the mapping, so
+reading a verse never copies the file into the Python heap and every worker process
+shares the same page-cache pages.
+
+Build the files with:
+    python bible_binary.py            # every translation
+    python bible_binary.py kjv ne     # selected translations
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Tuple
+
+MAGIC = b'BBIN'
+FORMAT_VERSION = 1
+
+# (section name, array typecode); 'B' sections are raw bytes
+SECTIONS = (
+    ('book_chapter_start', 'I'),
+    ('chapter_numbers', 'H'),
+    ('chapter_verse_start', 'I'),
+    ('verse_numbers', 'H'),
+    ('text_offsets', 'I'),
+    ('book_name_offsets', 'I'),
+    ('book_names', 'B'),
+    ('text_pool', 'B'),
+)
+
+_HEADER = struct.Struct('<4sII')
+_SECTION_ENTRY = struct.Struct('<QQ')
+_ALIGNMENT = 8
+_ITEM_SIZES = {'I': 4, 'H': 2, 'B': 1}
+
+# memoryview.cast uses native byte order and item sizes, which the format must match to be read in place
+_ZERO_COPY = sys.byteorder == 'little' and all(array(code).itemsize == size for code, size in _ITEM_SIZES.items())
+
+
+def _align(position: int) -> int:
+    return (position + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _section_bytes(values, typecode: str) -> bytes:
+    if typecode == 'B':
+        return bytes(values)
+    packed = array(typecode, values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def write_binary(store, path: str) -> int:
+    """
+    Writes a VerseStore to path in the .bbin format and returns the file size in bytes.
+    The file is written next to its destination and moved into place when complete.
+    """
+    name_bytes = bytearray()
+    name_offsets = [0]
+    for name in store.book_names:
+        name_bytes += name.encode('utf-8')
+        name_offsets.append(len(name_bytes))
+    values = {
+        'book_chapter_start': store.book_chapter_start,
+        'chapter_numbers': store.chapter_numbers,
+        'chapter_verse_start': store.chapter_verse_start,
+        'verse_numbers': store.verse_numbers,
+        'text_offsets': store.text_offsets,
+        'book_name_offsets': name_offsets,
+        'book_names': name_bytes,
+        'text_pool': store.text_pool,
+    }
+
+    payloads = [_section_bytes(values[name], typecode) for name, typecode in SECTIONS]
+    entries = []
+    position = _align(_HEADER.size + _SECTION_ENTRY.size * len(SECTIONS))
+    for payload in payloads:
+        entries.append((position, len(payload)))
+        position = _align(position + len(payload))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS)))
+        for entry in entries:
+            file.write(_SECTION_ENTRY.pack(*entry))
+        for (offset, _), payload in zip(entries, payloads):
+            file.write(b'\0' * (offset - file.tell()))
+            file.write(payload)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _read_section(buffer, offset: int, length: int, typecode: str):
+    view = memoryview(buffer)[offset:offset + length]
+    if typecode == 'B':
+        return view
+    if _ZERO_COPY:
+        return view.cast(typecode)
+    # Big-endian or unusual platforms get a private copy instead of a view
+    values = array(typecode)
+    values.frombytes(view)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def open_binary(path: str) -> Tuple[List[str], Dict[str, object], mmap.mmap]:
+    """
+    Maps a .bbin file read-only and returns (book names, {section name: array view}, mapping).
+    The mapping must stay referenced for as long as the views are used.
+    """
+    with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, section_count = _HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or section_count != len(SECTIONS):
+        mapping.close()
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} bible binary file")
+
+    sections = {}
+    for i, (name, typecode) in enumerate(SECTIONS):
+        offset, length = _SECTION_ENTRY.unpack_from(mapping, _HEADER.size + i * _SECTION_ENTRY.size)
+        if offset + length > len(mapping):
+            mapping.close()
+            raise ValueError(f"{path} is truncated")
+        sections[name] = _read_section(mapping, offset, length, typecode)
+
+    name_offsets = sections.pop('book_name_offsets')
+    names = sections.pop('book_names')
+    book_names = [str(names[name_offsets[i]:name_offsets[i + 1]], 'utf-8') for i in range(len(name_offsets) - 1)]
+    return book_names, sections, mapping
+
+
+if __name__ == "__main__":
+    from verse_store import TRANSLATIONS, load_store
+    for translation in sys.argv[1:] or list(TRANSLATIONS):
+        if translation not in TRANSLATIONS:
+            print(f"Unknown translation: {translation} (expected one of {', '.join(TRANSLATIONS)})")
+            sys.exit(1)
+        store = load_store(translation, use_binary=False)
+        target = TRANSLATIONS[translation]['binary']
+        size = write_binary(store, target)
+        print(f"{translation}: {len(store)} verses -> {target} ({size / (1024 * 1024):.1f} MB)")
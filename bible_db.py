@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Sequence
+
+# Connection tuning for the read-only translation databases
+MMAP_SIZE = 256 * 1024 * 1024          # bytes of each database file mapped into memory
+CACHE_SIZE_KIB = 16 * 1024              # page cache per connection (negative PRAGMA value = KiB)
+STATEMENT_CACHE_SIZE = 64               # prepared statements kept per connection
+MAX_CONNECTIONS_PER_THREAD = 4          # one per translation is enough for the app
+
+# Thread-local pool of connections, keyed by database path
+_thread_local = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'connections_opened': 0,
+    'connections_reused': 0,
+    'connections_evicted': 0,
+    'queries': 0,
+    'query_seconds': 0.0,
+}
+
+
+def _bump(name: str, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _thread_pool() -> OrderedDict:
+    """
+    Returns this thread's connection pool, discarding connections inherited across a fork.
+    """
+    pid = os.getpid()
+    if getattr(_thread_local, 'pid', None) != pid:
+        # SQLite connections must not be used in a forked child; drop the parent's handles
+        _thread_local.pool = OrderedDict()
+        _thread_local.pid = pid
+    return _thread_local.pool
+
+
+def _open(path: str) -> sqlite3.Connection:
+    """
+    Opens a translation database in read-only, immutable URI mode.
+    immutable=1 skips file locking and change detection, so the file must not be
+    modified while the app is running (run optimize_database offline).
+    """
+    if not os.path.exists(path):
+        raise sqlite3.OperationalError(f"unable to open database file: {path}")
+    uri = f"file:{os.path.abspath(path)}?mode=ro&immutable=1"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+    conn.execute('PRAGMA query_only=ON')
+    return conn
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """
+    Get a pooled, read-only connection to a translation database for the current thread.
+    Each thread keeps at most MAX_CONNECTIONS_PER_THREAD connections, least recently used first out.
+    """
+    pool = _thread_pool()
+    conn = pool.get(path)
+    if conn is not None:
+        pool.move_to_end(path)
+        _bump('connections_reused')
+        return conn
+
+    conn = _open(path)
+    pool[path] = conn
+    _bump('connections_opened')
+    while len(pool) > MAX_CONNECTIONS_PER_THREAD:
+        _, evicted = pool.popitem(last=False)
+        evicted.close()
+        _bump('connections_evicted')
+    return conn
+
+
+@contextmanager
+def get_cursor(path: str):
+    """
+    Context manager for getting a cursor on a pooled connection.
+    """
+    cursor = get_connection(path).cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def execute(path: str, query: str, params: Sequence = ()) -> List[tuple]:
+    """
+    Runs a read query on a pooled connection and returns all rows, recording query time.
+    """
+    started = time.perf_counter()
+    with get_cursor(path) as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    with _stats_lock:
+        _stats['queries'] += 1
+        _stats['query_seconds'] += time.perf_counter() - started
+    return rows
+
+
+def close_connections():
+    """
+    Close every pooled connection held by the current thread.
+    """
+    pool = _thread_pool()
+    while pool:
+        _, conn = pool.popitem()
+        conn.close()
+
+
+def get_stats() -> Dict[str, float]:
+    """
+    Returns pool and query-time counters for this process.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['open_connections_this_thread'] = len(_thread_pool())
+    stats['avg_query_ms'] = (stats['query_seconds'] / stats['queries'] * 1000) if stats['queries'] else 0.0
+    return stats
+
+
+def optimize_database(path: str, prefix: str):
+    """
+    Adds covering indexes for verse and book lookups and refreshes the planner statistics.
+    Opens the database read-write, so run it offline (not while the app has it open).
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS {prefix}_verses_covering
+        ON {prefix}_verses (book_id, chapter, verse, text)
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {prefix}_books_name_id ON {prefix}_books (name, id)")
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # python bible_db.py optimize  -> add covering indexes and ANALYZE every translation database
+    if len(sys.argv) > 1 and sys.argv[1] == 'optimize':
+        from verse_store import TRANSLATIONS
+        for translation, source in TRANSLATIONS.items():
+            source = source.get('compiled', source)
+            if source['kind'] == 'sqlite' and os.path.exists(source['path']) and os.path.getsize(source['path']) > 0:
+                optimize_database(source['path'], source['prefix'])
+                print(f"Optimized {source['path']}")
+    else:
+        print("Usage: python bible_db.py optimize")
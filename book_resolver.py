@@ -0,0 +1,302 @@
+"""
+Multilingual book-name resolver.
+
+Every known name of a book (English, OSIS id, common abbreviations, Korean, Nepali
+and Malayalam names and short forms) is normalized once at import and indexed in:
+- a dict of exact keys,
+- a prefix trie, so an unambiguous prefix ("deuter", "고린도전") resolves,
+- a symmetric-deletion index for names within a small edit distance ("Revelatoins", "Phillipians"):
+  none below MIN_FUZZY_LENGTH characters, one edit up to 6 characters and two for longer names, so
+  common short words ("love", "hope") are not taken for books.
+
+resolve_book() returns the canonical book number from canon.py.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+import canon
+
+MAX_EDIT_DISTANCE = 2
+MIN_FUZZY_LENGTH = 4   # shorter inputs and aliases are only matched exactly or by prefix
+MAX_ONE_EDIT_LENGTH = 6  # inputs up to this long may be one edit away from a name, longer ones two
+MIN_PREFIX_LENGTH = 2
+
+# Common English spellings and abbreviations, by canonical book number.
+# Numbered books are listed with an Arabic prefix; Roman and written-out forms are normalized to it.
+ENGLISH_ALIASES = {
+    1: ['Gen', 'Ge', 'Gn'],
+    2: ['Ex', 'Exo'],
+    3: ['Le', 'Lv'],
+    4: ['Nu', 'Nm', 'Nb'],
+    5: ['Dt', 'De'],
+    6: ['Jos', 'Jsh'],
+    7: ['Jdg', 'Jg', 'Jdgs'],
+    8: ['Rth', 'Ru'],
+    9: ['1 Sam', '1 Sa', '1 Sm', '1 Samuel'],
+    10: ['2 Sam', '2 Sa', '2 Sm', '2 Samuel'],
+    11: ['1 Kgs', '1 Ki', '1 Kin', '1 Kings'],
+    12: ['2 Kgs', '2 Ki', '2 Kin', '2 Kings'],
+    13: ['1 Chr', '1 Chron', '1 Ch', '1 Chronicles'],
+    14: ['2 Chr', '2 Chron', '2 Ch', '2 Chronicles'],
+    15: ['Ezr'],
+    16: ['Ne'],
+    17: ['Est', 'Es'],
+    18: ['Jb'],
+    19: ['Ps', 'Psa', 'Pss', 'Psm', 'Psalm'],
+    20: ['Pr', 'Prv', 'Pro'],
+    21: ['Ecc', 'Eccles', 'Qoh'],
+    22: ['Song of Songs', 'SOS', 'So', 'Cant', 'Canticles'],
+    23: ['Is'],
+    24: ['Je', 'Jr'],
+    25: ['La'],
+    26: ['Eze', 'Ezk'],
+    27: ['Da', 'Dn'],
+    28: ['Ho'],
+    29: ['Jl'],
+    30: ['Am'],
+    31: ['Ob'],
+    32: ['Jnh'],
+    33: ['Mc'],
+    34: ['Na'],
+    35: ['Hb'],
+    36: ['Zep', 'Zp'],
+    37: ['Hg'],
+    38: ['Zec', 'Zc'],
+    39: ['Ml'],
+    40: ['Mt'],
+    41: ['Mrk', 'Mk', 'Mr'],
+    42: ['Luk', 'Lk'],
+    43: ['Jn', 'Jhn', 'Joh'],
+    44: ['Ac', 'Act'],
+    45: ['Ro', 'Rm'],
+    46: ['1 Co', '1 Corinthians'],
+    47: ['2 Co', '2 Corinthians'],
+    48: ['Ga'],
+    49: ['Ephes'],
+    50: ['Php', 'Pp'],
+    51: ['Col'],
+    52: ['1 Th', '1 Thes', '1 Thessalonians'],
+    53: ['2 Th', '2 Thes', '2 Thessalonians'],
+    54: ['1 Ti', '1 Timothy'],
+    55: ['2 Ti', '2 Timothy'],
+    56: ['Tit'],
+    57: ['Philem', 'Phm'],
+    59: ['Jm'],
+    60: ['1 Pe', '1 Pt', '1 Peter'],
+    61: ['2 Pe', '2 Pt', '2 Peter'],
+    62: ['1 Jn', '1 Jhn', '1 Jo', '1 John'],
+    63: ['2 Jn', '2 Jhn', '2 Jo', '2 John'],
+    64: ['3 Jn', '3 Jhn', '3 Jo', '3 John'],
+    65: ['Jd'],
+    66: ['Re', 'Rv', 'Revelation', 'Revelations', 'Apocalypse'],
+}
+
+# Standard Korean one- and two-syllable abbreviations, in canonical order
+KOREAN_ABBREVIATIONS = [
+    '창', '출', '레', '민', '신', '수', '삿', '룻', '삼상', '삼하', '왕상', '왕하', '대상', '대하', '스', '느',
+    '에', '욥', '시', '잠', '전', '아', '사', '렘', '애', '겔', '단', '호', '욜', '암', '옵', '욘', '미',
+    '나', '합', '습', '학', '슥', '말', '마', '막', '눅', '요', '행', '롬', '고전', '고후', '갈', '엡', '빌',
+    '골', '살전', '살후', '딤전', '딤후', '딛', '몬', '히', '약', '벧전', '벧후', '요일', '요이', '요삼', '유', '계',
+]
+
+# ERV-NE names that readers usually shorten ("मत्तीले लेखेको सुसमाचार" -> "मत्ती")
+NEPALI_SUFFIXES = ['ले लेखेको सुसमाचार', 'को पुस्तक']
+
+_ORDINAL_RE = re.compile(r'^(iii|ii|i|first|second|third|1st|2nd|3rd)(?=\s)')
+_ORDINALS = {'i': '1', 'ii': '2', 'iii': '3', 'first': '1', 'second': '2', 'third': '3',
+             '1st': '1', '2nd': '2', '3rd': '3'}
+_DROP_RE = re.compile(r"[\s.'\u2019_\-\u200c\u200d]+")
+
+
+def _ascii_digits(text: str) -> str:
+    # Devanagari, Malayalam and other decimal digits -> 0-9
+    return ''.join(str(unicodedata.decimal(char)) if char.isdecimal() and not char.isascii() else char
+                   for char in text)
+
+
+def normalize(name: str) -> str:
+    """
+    Normalizes a book name for lookup: NFC, case-folded, native digits and leading Roman
+    or written ordinals turned into Arabic digits, and spaces, dots and joiners removed.
+    """
+    text = _ascii_digits(unicodedata.normalize('NFC', name).casefold().strip())
+    text = _ORDINAL_RE.sub(lambda m: _ORDINALS[m.group(1)], text)
+    return _DROP_RE.sub('', text)
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (adjacent transpositions count as one edit),
+    returning limit + 1 as soon as the distance is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def max_edit_distance(key: str) -> int:
+    """
+    Edits allowed between a normalized input and a book name, by input length.
+    """
+    if len(key) < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if len(key) <= MAX_ONE_EDIT_LENGTH else MAX_EDIT_DISTANCE
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """
+    Returns every string obtained by deleting up to distance characters from word.
+    """
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        results |= frontier
+    return results
+
+
+class _TrieNode:
+    __slots__ = ('children', 'books')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.books: Set[int] = set()
+
+
+class BookResolver:
+    """
+    Resolves book names to canonical book numbers through exact, prefix and fuzzy indexes.
+    """
+
+    def __init__(self, aliases: Dict[str, Set[int]]):
+        # Keys shared by different books (e.g. a short form used by two languages) are ambiguous
+        self.exact = {key: next(iter(books)) for key, books in aliases.items() if len(books) == 1}
+        self.trie = _TrieNode()
+        self.deletes: Dict[str, Set[str]] = {}
+        for key, books in aliases.items():
+            node = self.trie
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+                node.books |= books
+            if len(key) >= MIN_FUZZY_LENGTH and key in self.exact:
+                for variant in _deletes(key, MAX_EDIT_DISTANCE):
+                    self.deletes.setdefault(variant, set()).add(key)
+
+    def _prefix_books(self, key: str) -> Set[int]:
+        node = self.trie
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.books
+
+    def _fuzzy(self, key: str) -> Optional[int]:
+        """
+        Returns the book with a name within max_edit_distance of key, if it is strictly closer
+        than every other book's names.
+        """
+        limit = max_edit_distance(key)
+        if limit == 0:
+            return None
+        candidates = set()
+        for variant in _deletes(key, limit):
+            candidates |= self.deletes.get(variant, set())
+        distances: Dict[int, int] = {}  # book -> distance of its closest name
+        for candidate in candidates:
+            distance = _edit_distance(key, candidate, limit)
+            if distance <= limit:
+                book = self.exact[candidate]
+                distances[book] = min(distance, distances.get(book, distance))
+        ranked = sorted(distances.items(), key=lambda item: item[1])
+        if not ranked or (len(ranked) > 1 and ranked[1][1] <= ranked[0][1]):
+            return None
+        return ranked[0][0]
+
+    def resolve(self, name: str, fuzzy: bool = True) -> Optional[int]:
+        """
+        Returns the canonical book number for a name, or None if it is unknown or ambiguous.
+        Without fuzzy, only exact names and unambiguous prefixes are matched.
+        """
+        key = normalize(name)
+        if not key:
+            return None
+        book = self.exact.get(key)
+        if book is not None:
+            return book
+        if len(key) >= MIN_PREFIX_LENGTH:
+            books = self._prefix_books(key)
+            if len(books) == 1:
+                return next(iter(books))
+            if books:
+                return None
+        return self._fuzzy(key) if fuzzy else None
+
+    def complete(self, prefix: str, limit: int = 10) -> List[int]:
+        """
+        Returns up to limit book numbers, in canonical order, with a name starting with prefix.
+        """
+        key = normalize(prefix)
+        if not key:
+            return []
+        return sorted(self._prefix_books(key))[:limit]
+
+
+def _build_aliases() -> Dict[str, Set[int]]:
+    aliases: Dict[str, Set[int]] = {}
+
+    def add(name: str, book: int):
+        key = normalize(name)
+        if key:
+            aliases.setdefault(key, set()).add(book)
+
+    for book, names in enumerate(canon.BOOKS, start=1):
+        for name in names:
+            add(name, book)
+        for alias in ENGLISH_ALIASES.get(book, []):
+            add(alias, book)
+        add(KOREAN_ABBREVIATIONS[book - 1], book)
+        nepali = names[3]
+        for suffix in NEPALI_SUFFIXES:
+            if nepali.endswith(suffix):
+                add(nepali[:-len(suffix)], book)
+    return aliases
+
+
+_resolver = BookResolver(_build_aliases())
+
+
+@lru_cache(maxsize=4096)
+def resolve_book(name: str, fuzzy: bool = True) -> Optional[int]:
+    """
+    Returns the canonical book number (1-66) for a book name in any supported language.
+    fuzzy=False leaves out misspellings, for callers that must not mistake a word for a book.
+    """
+    return _resolver.resolve(name, fuzzy)
+
+
+def resolve_book_name(name: str, translation: str) -> Optional[str]:
+    """
+    Returns the name a translation's verse store uses for a book, or None if it cannot be resolved.
+    """
+    book = resolve_book(name) if name else None
+    return canon.book_name(book, translation) if book else None
+
+
+def complete_books(prefix: str, translation: str = 'kjv', limit: int = 10) -> List[str]:
+    """
+    Returns the names (in a translation) of the books matching a typed prefix, for autocomplete.
+    """
+    return [canon.book_name(book, translation) for book in _resolver.complete(prefix, limit)]
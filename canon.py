@@ -0,0 +1,215 @@
+"""
+Canonical book and verse identifiers shared by every translation.
+
+Books are numbered 1-66 in Protestant canonical order. A verse is identified by
+an integer BBCCCVVV (book * 1000000 + chapter * 1000 + verse), numbered with KJV
+versification. Translations whose verse numbering differs list their differences
+in VERSIFICATION, so the same verse id finds the same passage in every translation.
+
+Only one difference has been checked by hand (ERV-NE splits 3 John 1:14). ingest_bibles.py
+compares every translation's per-chapter verse counts with KJV and writes the chapters that
+differ to VERSIFICATION_FILE; those without a rule are not aligned (is_aligned), so verse
+numbers there may name different verses in different translations.
+"""
+import json
+from typing import Dict, Optional, Set, Tuple
+
+# Session language -> translation used for it
+LANGUAGE_TRANSLATIONS = {
+    'en': 'kjv',
+    'ko': 'korrv',
+    'ne': 'ne',
+    'mal': 'mal1910',
+}
+
+# (OSIS id, English/KJV name, Korean (KorRV), Nepali (ERV-NE), Malayalam) in canonical order
+BOOKS = [
+    ("Gen", "Genesis", "창세기", "उत्पत्तिको पुस्तक", "ഉല്പത്തി"),
+    ("Exod", "Exodus", "출애굽기", "प्रस्थानको पुस्तक", "പുറപ്പാട്"),
+    ("Lev", "Leviticus", "레위기", "लेवीहरूको पुस्तक", "ലേവ്യപുസ്തകം"),
+    ("Num", "Numbers", "민수기", "गन्तीको पुस्तक", "സംഖ്യാപുസ്തകം"),
+    ("Deut", "Deuteronomy", "신명기", "व्यवस्थाको पुस्तक", "ആവർത്തനം"),
+    ("Josh", "Joshua", "여호수아", "यहोशूको पुस्तक", "യോശുവ"),
+    ("Judg", "Judges", "사사기", "न्यायकर्त्ताहरूको पुस्तक", "ന്യായാധിപന്മാർ"),
+    ("Ruth", "Ruth", "룻기", "रूथको पुस्तक", "രൂത്ത്"),
+    ("1Sam", "I Samuel", "사무엘상", "1 शमूएलको पुस्तक", "1 ശമൂവേൽ"),
+    ("2Sam", "II Samuel", "사무엘하", "2 शमूएलको पुस्तक", "2 ശമൂവേൽ"),
+    ("1Kgs", "I Kings", "열왕기상", "1 राजाहरूको पुस्तक", "1 രാജാക്കന്മാർ"),
+    ("2Kgs", "II Kings", "열왕기하", "2 राजाहरूको पुस्तक", "2 രാജാക്കന്മാർ"),
+    ("1Chr", "I Chronicles", "역대상", "1 इतिहासको पुस्तक", "1 ദിനവൃത്താന്തം"),
+    ("2Chr", "II Chronicles", "역대하", "2 इतिहासको पुस्तक", "2 ദിനവൃത്താന്തം"),
+    ("Ezra", "Ezra", "에스라", "एज्राको", "എസ്രാ"),
+    ("Neh", "Nehemiah", "느헤미야", "नहेम्याहको पुस्तक", "നെഹെമ്യാവു"),
+    ("Esth", "Esther", "에스더", "एस्तरको पुस्तक", "എസ്ഥേർ"),
+    ("Job", "Job", "욥기", "अय्यूबको पुस्तक", "ഇയ്യോബ്"),
+    ("Ps", "Psalms", "시편", "भजनसंग्रह", "സങ്കീർത്തനങ്ങൾ"),
+    ("Prov", "Proverbs", "잠언", "हितोपदेशको पुस्तक", "സദൃശ്യവാക്യങ്ങൾ"),
+    ("Eccl", "Ecclesiastes", "전도서", "उपदेशकको पुस्तक", "സഭാപ്രസംഗി"),
+    ("Song", "Song of Solomon", "아가", "सुलेमानको श्रेष्ठगीत", "ഉത്തമഗീതം"),
+    ("Isa", "Isaiah", "이사야", "यशैयाको पुस्तक", "യേശയ്യാവു"),
+    ("Jer", "Jeremiah", "예레미야", "यर्मियाको पुस्तक", "യിരെമ്യാവു"),
+    ("Lam", "Lamentations", "예레미야 애가", "यर्मियाको विलाप", "വിലാപങ്ങൾ"),
+    ("Ezek", "Ezekiel", "에스겔", "इजकिएलको पुस्तक", "യേഹേസ്കേൽ"),
+    ("Dan", "Daniel", "다니엘", "दानियलको पुस्तक", "ദാനിയേൽ"),
+    ("Hos", "Hosea", "호세아", "होशे", "ഹോശേയ"),
+    ("Joel", "Joel", "요엘", "योएल", "യോവേൽ"),
+    ("Amos", "Amos", "아모스", "आमोस", "ആമോസ്"),
+    ("Obad", "Obadiah", "오바댜", "ओबदिया", "ഓബദ്യാവു"),
+    ("Jonah", "Jonah", "요나", "योना", "യോനാ"),
+    ("Mic", "Micah", "미가", "मीका", "മീഖാ"),
+    ("Nah", "Nahum", "나훔", "नहूम", "നാഹൂം"),
+    ("Hab", "Habakkuk", "하박국", "हबकूक", "ഹബക്കൂക്ക്"),
+    ("Zeph", "Zephaniah", "스바냐", "सपन्याह", "സെഫന്യാവു"),
+    ("Hag", "Haggai", "학개", "हाग्गै", "ഹഗ്ഗായി"),
+    ("Zech", "Zechariah", "스가랴", "जकरिया", "സെഖർയ്യാവു"),
+    ("Mal", "Malachi", "말라기", "मलाकी", "മലാഖി"),
+    ("Matt", "Matthew", "마태복음", "मत्तीले लेखेको सुसमाचार", "മത്തായി"),
+    ("Mark", "Mark", "마가복음", "मर्कूसले लेखेको सुसमाचार", "മർക്കോസ്"),
+    ("Luke", "Luke", "누가복음", "लूकाले लेखेको सुसमाचार", "ലൂക്കോസ്"),
+    ("John", "John", "요한복음", "यूहन्नाले लेखेको सुसमाचार", "യോഹന്നാൻ"),
+    ("Acts", "Acts", "사도행전", "प्रेरितहरूका काम", "പ്രവൃത്തികൾ"),
+    ("Rom", "Romans", "로마서", "रोमीहरूलाई पत्र", "റോമർ"),
+    ("1Cor", "I Corinthians", "고린도전서", "कोरिन्थीहरूलाई पहिलो पत्र", "1 കൊരിന്ത്യർ"),
+    ("2Cor", "II Corinthians", "고린도후서", "कोरिन्थीहरूलाई दोस्त्रो पत्र", "2 കൊരിന്ത്യർ"),
+    ("Gal", "Galatians", "갈라디아서", "गलातीहरूलाई पत्र", "ഗലാത്യർ"),
+    ("Eph", "Ephesians", "에베소서", "एफिसीहरूलाई पत्र", "എഫേസ്യർ"),
+    ("Phil", "Philippians", "빌립보서", "फिलिप्पीहरूलाई पत्र", "ഫിലിപ്പിയർ"),
+    ("Col", "Colossians", "골로새서", "कलस्सीहरूलाई पत्र", "കൊലോസ്യർ"),
+    ("1Thess", "I Thessalonians", "데살로니가전서", "थिस्सलोनिकीहरूलाई पहिलो पत्र", "1 തെസ്സലോനിക്ക്യർ"),
+    ("2Thess", "II Thessalonians", "데살로니가후서", "थिस्सलोनिकीहरूलाई दोस्त्रो पत्र", "2 തെസ്സലോനിക്ക്യർ"),
+    ("1Tim", "I Timothy", "디모데전서", "तिमोथीलाई पहिलो पत्र", "1 തിമോത്തെയോസ്"),
+    ("2Tim", "II Timothy", "디모데후서", "तिमोथीलाई दोस्त्रो पत्र", "2 തിമോത്തെയോസ്"),
+    ("Titus", "Titus", "디도서", "तीतसलाई पत्र", "തീത്തൊസ്"),
+    ("Phlm", "Philemon", "빌레몬서", "फिलेमोनलाई पत्र", "ഫിലേമോൻ"),
+    ("Heb", "Hebrews", "히브리서", "हिब्रूहरूको निम्ति पत्र", "എബ്രായർ"),
+    ("Jas", "James", "야고보서", "याकूबको पत्र", "യാക്കോബ്"),
+    ("1Pet", "I Peter", "베드로전서", "पत्रुसको पहिलो पत्र", "1 പത്രോസ്"),
+    ("2Pet", "II Peter", "베드로후서", "पत्रुसको दोस्त्रो पत्र", "2 പത്രോസ്"),
+    ("1John", "I John", "요한일서", "यूहन्नाको पहिलो पत्र", "1 യോഹന്നാൻ"),
+    ("2John", "II John", "요한이서", "यूहन्नाको दोस्त्रो पत्र", "2 യോഹന്നാൻ"),
+    ("3John", "III John", "요한삼서", "यूहन्नाको तेस्त्रो पत्र", "3 യോഹന്നാൻ"),
+    ("Jude", "Jude", "유다서", "यहूदाको पत्र", "യൂദാ"),
+    ("Rev", "Revelation of John", "요한계시록", "यूहन्नालाई भएको प्रकाश", "വെളിപ്പാട്"),
+]
+
+OLD_TESTAMENT_BOOKS = 39
+
+# Which BOOKS column holds the book names used by each translation's verse store
+TRANSLATION_NAME_COLUMNS = {
+    'kjv': 1,
+    'korrv': 2,
+    'ne': 3,
+    'mal1910': 1,  # Mal1910 stores English book names
+}
+
+# Verse numbering differences from KJV, per translation:
+# (book number, chapter, KJV verse) -> (chapter, first verse, last verse) in the translation
+VERSIFICATION: Dict[str, Dict[Tuple[int, int, int], Tuple[int, int, int]]] = {
+    'ne': {
+        (64, 1, 14): (1, 14, 15),  # ERV splits 3 John 1:14 in two
+    },
+}
+
+# Written by ingest_bibles.py: translation -> [[book number, chapter, KJV verses, verses], ...]
+VERSIFICATION_FILE = 'database/versification.json'
+
+# Any known book name (every language, OSIS id, case-insensitive) -> book number
+_BOOK_NUMBERS: Dict[str, int] = {}
+for _number, _names in enumerate(BOOKS, start=1):
+    for _name in _names:
+        _BOOK_NUMBERS[_name.casefold()] = _number
+
+# (translation, book number, chapter, translation verse) -> KJV verse, for verses that differ
+_REVERSE_VERSIFICATION: Dict[Tuple[str, int, int, int], Tuple[int, int]] = {}
+for _translation, _rules in VERSIFICATION.items():
+    for (_book, _chapter, _verse), (_target_chapter, _first, _last) in _rules.items():
+        for _target_verse in range(_first, _last + 1):
+            _REVERSE_VERSIFICATION[(_translation, _book, _target_chapter, _target_verse)] = (_chapter, _verse)
+
+
+def _load_unaligned_chapters(path: str) -> Dict[str, Set[Tuple[int, int]]]:
+    """
+    Chapters whose verse count differs from KJV and that have no VERSIFICATION rule, per translation.
+    Without the file every chapter is taken to be aligned.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            differing = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    unaligned = {}
+    for translation, chapters in differing.items():
+        ruled = {(book, chapter) for book, chapter, _ in VERSIFICATION.get(translation, {})}
+        unaligned[translation] = {(book, chapter) for book, chapter, _, _ in chapters} - ruled
+    return unaligned
+
+
+_UNALIGNED_CHAPTERS = _load_unaligned_chapters(VERSIFICATION_FILE)
+
+
+def book_number(name: str) -> Optional[int]:
+    """
+    Returns the canonical book number (1-66) for a book name in any supported language, or None.
+    """
+    return _BOOK_NUMBERS.get(name.strip().casefold())
+
+
+def book_name(number: int, translation: str) -> str:
+    """
+    Returns the name a translation's verse store uses for a canonical book number.
+    """
+    return BOOKS[number - 1][TRANSLATION_NAME_COLUMNS[translation]]
+
+
+def osis_id(number: int) -> str:
+    return BOOKS[number - 1][0]
+
+
+def name_map(from_column: int, to_column: int) -> Dict[str, str]:
+    """
+    Returns {name in one BOOKS column: name in another} for every book.
+    """
+    return {names[from_column]: names[to_column] for names in BOOKS}
+
+
+def verse_id(book: int, chapter: int, verse: int) -> int:
+    return book * 1000000 + chapter * 1000 + verse
+
+
+def split_verse_id(value: int) -> Tuple[int, int, int]:
+    """
+    Returns (book number, chapter, verse) for a BBCCCVVV verse id.
+    """
+    return value // 1000000, value // 1000 % 1000, value % 1000
+
+
+def to_translation(translation: str, book: int, chapter: int, start_verse: Optional[int],
+                   end_verse: Optional[int]) -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    Maps a KJV-numbered chapter or verse range to (chapter, start verse, end verse)
+    in a translation's own numbering.
+    """
+    rules = VERSIFICATION.get(translation)
+    if not rules or start_verse is None:
+        return chapter, start_verse, end_verse
+    start = rules.get((book, chapter, start_verse))
+    target_chapter, first = (start[0], start[1]) if start else (chapter, start_verse)
+    if end_verse is None:
+        return target_chapter, first, None
+    end = rules.get((book, chapter, end_verse))
+    return target_chapter, first, end[2] if end else end_verse
+
+
+def is_aligned(translation: str, book: int, chapter: int) -> bool:
+    """
+    Whether a chapter's verses are known to be numbered as in KJV (or mapped by VERSIFICATION).
+    """
+    return (book, chapter) not in _UNALIGNED_CHAPTERS.get(translation, ())
+
+
+def to_canonical(translation: str, book: int, chapter: int, verse: int) -> int:
+    """
+    Returns the KJV-numbered verse id of a verse given in a translation's own numbering.
+    """
+    chapter, verse = _REVERSE_VERSIFICATION.get((translation, book, chapter, verse), (chapter, verse))
+    return verse_id(book, chapter, verse)
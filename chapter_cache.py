@@ -0,0 +1,117 @@
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List
+from verse_store import get_store
+
+# Upper bound on the memory held by rendered chapters across every translation
+CHAPTER_CACHE_BYTES = 16 * 1024 * 1024
+
+
+def _sizeof_verses(verses: List[str]) -> int:
+    return sys.getsizeof(verses) + sum(sys.getsizeof(verse) for verse in verses)
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its values in bytes rather than by entry count.
+    Entries larger than the whole budget are returned to the caller but never stored.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[object], int] = sys.getsizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value):
+        size = self.sizeof(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by every translation, keyed by (translation, book, chapter)
+_chapter_cache = ByteLRUCache(CHAPTER_CACHE_BYTES, _sizeof_verses)
+
+
+def get_chapter(translation: str, book_name: str, chapter: int) -> List[str]:
+    """
+    Returns the rendered verses of a single chapter, or [] if it does not exist.
+    Only the requested chapter is materialized; rendered chapters are kept in the shared LRU.
+    """
+    key = (translation, book_name, chapter)
+    verses = _chapter_cache.get(key)
+    if verses is not None:
+        return verses
+    try:
+        store = get_store(translation)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return []
+    verses = [f'<span class="verse-num">{verse_num}</span> {text}'
+              for verse_num, text in store.get_verses(book_name, chapter)]
+    if verses:
+        _chapter_cache.put(key, verses)
+    return verses
+
+
+def get_chapter_numbers(translation: str, book_name: str) -> List[int]:
+    """
+    Returns the chapter numbers of a book without reading any verse text.
+    """
+    try:
+        return get_store(translation).chapter_list(book_name)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return []
+
+
+def get_stats() -> Dict[str, float]:
+    return _chapter_cache.get_stats()
+
+
+def clear_cache():
+    _chapter_cache.clear()
@@ -0,0 +1,139 @@
+"""
+Pre-rendered /fetch_chapter payloads.
+
+Every chapter is rendered once into the exact JSON body served by /fetch_chapter and
+stored next to gzip and brotli variants under database/chapter_payloads, so serving a
+chapter is a file read. Payloads missing on disk are rendered on demand and written.
+
+Build everything ahead of time with:
+    python chapter_payloads.py            # all translations
+    python chapter_payloads.py kjv ne     # selected translations
+"""
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from typing import List, Optional, Tuple
+from verse_store import TRANSLATIONS, get_store
+
+try:
+    import brotli
+except ImportError:  # Only gzip variants are produced without the brotli package
+    brotli = None
+
+PAYLOAD_DIR = 'database/chapter_payloads'
+EMPTY_PAYLOAD = b'{"verses":[]}'
+
+# Content-Encoding -> file suffix
+ENCODING_SUFFIXES = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+
+def available_encodings() -> List[str]:
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding != 'br' or brotli is not None]
+
+
+def render_chapter(translation: str, book_name: str, chapter: int) -> Optional[bytes]:
+    """
+    Renders a chapter into the /fetch_chapter JSON body, or returns None if it does not exist.
+    """
+    verses = get_store(translation).get_verses(book_name, chapter)
+    if not verses:
+        return None
+    rendered = [f'<span class="verse-num">{verse_num}</span> {text}' for verse_num, text in verses]
+    return json.dumps({'verses': rendered}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def _payload_path(translation: str, book_name: str, chapter: int) -> Optional[str]:
+    # Books are stored by their position in the translation, so file names stay ASCII
+    book = get_store(translation).book_index.get(book_name)
+    if book is None:
+        return None
+    return os.path.join(PAYLOAD_DIR, translation, str(book + 1), f'{chapter}.json')
+
+
+def _write_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_chapter(translation: str, book_name: str, chapter: int) -> Optional[bytes]:
+    """
+    Renders a chapter and writes the plain and compressed variants. Returns the plain body.
+    """
+    path = _payload_path(translation, book_name, chapter)
+    body = render_chapter(translation, book_name, chapter)
+    if path is None or body is None:
+        return None
+    for encoding in available_encodings():
+        _write_atomic(path + ENCODING_SUFFIXES[encoding], compress(body, encoding))
+    # The plain file is written last, so its presence means every variant is complete
+    _write_atomic(path, body)
+    return body
+
+
+def get_chapter_payload(translation: str, book_name: str, chapter: int,
+                        accepted_encodings: List[str]) -> Tuple[bytes, Optional[str]]:
+    """
+    Returns (body, content encoding) for a chapter, preferring the first accepted encoding
+    that has a stored variant. Missing payloads are rendered and stored on demand.
+    """
+    try:
+        path = _payload_path(translation, book_name, chapter)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return EMPTY_PAYLOAD, None
+    if path is None:
+        return EMPTY_PAYLOAD, None
+
+    if not os.path.exists(path):
+        try:
+            body = write_chapter(translation, book_name, chapter)
+        except OSError as e:
+            # Still serve the chapter if the payload directory is not writable
+            print(f"Error writing chapter payload: {e}")
+            body = render_chapter(translation, book_name, chapter)
+            return body or EMPTY_PAYLOAD, None
+        if body is None:
+            return EMPTY_PAYLOAD, None
+
+    for encoding in accepted_encodings:
+        suffix = ENCODING_SUFFIXES.get(encoding)
+        if suffix and os.path.exists(path + suffix):
+            with open(path + suffix, 'rb') as file:
+                return file.read(), encoding
+    with open(path, 'rb') as file:
+        return file.read(), None
+
+
+def build_all(translation: str) -> int:
+    """
+    Renders and stores every chapter of a translation. Returns the number of chapters written.
+    """
+    store = get_store(translation)
+    written = 0
+    for book_name in store.book_names:
+        for chapter, _ in store.iter_chapters(book_name):
+            if write_chapter(translation, book_name, chapter) is not None:
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    for translation in sys.argv[1:] or list(TRANSLATIONS):
+        count = build_all(translation)
+        print(f"{translation}: wrote {count} chapters ({', '.join(['json'] + available_encodings())})")
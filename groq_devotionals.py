@@ -2,8 +2,7 @@
 
 import os
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import llm_clients
 
 load_dotenv()  # Load environment variables from .env file
 
@@ -25,7 +24,8 @@ def get_bible_verse(name, connected_theme):
             print("ERROR: GROQ_API_KEY not found in environment variables")
             raise ValueError("GROQ_API_KEY is not configured")
 
-        prompt = PromptTemplate(
+        chain = llm_clients.get_chain(
+            'devotional',
             input_variables=["name", "connected_theme"],
             template="""
             Find an appropriate Bible verse for the following devotional:
@@ -37,13 +37,12 @@ def get_bible_verse(name, connected_theme):
             Verse Reference: [only the verse reference]
             Short Story: [only the short story]
             Short Prayer: [a short prayer inspired by the verse]
-            """
+            """,
+            model="llama-3.3-70b-versatile"
         )
 
         print(f"Generating devotional for: {name} with theme: {connected_theme}")
 
-        llm = ChatGroq(api_key=api_key, model="llama-3.3-70b-versatile")
-        chain = prompt | llm
         response = chain.invoke({"name": name, "connected_theme": connected_theme})
 
         print(f"Received response from LLM")
@@ -1,14 +1,13 @@
 # FILE: groq_devotionals_ko.py
 
-import os
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import llm_clients
 
 load_dotenv()  # Load environment variables from .env file
 
 def get_bible_verse_ko(name, connected_theme):
-    prompt = PromptTemplate(
+    chain = llm_clients.get_chain(
+        'devotional_ko',
         input_variables=["name", "connected_theme"],
         template="""
         다음 묵상을 위한 적절한 성경 구절을 찾으세요:
@@ -20,12 +19,11 @@ def get_bible_verse_ko(name, connected_theme):
         구절 참조: [구절 참조만]
         짧은 이야기: [짧은 이야기만]
         짧은 기도: [구절에서 영감을 받은 짧은 기도]
-        """
+        """,
+        model="mixtral-8x7b-32768"
     )
     # print(name, connected_theme)
     # print("inside groq devotional")
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="mixtral-8x7b-32768")
-    chain = prompt | llm
     response = chain.invoke({"name": name, "connected_theme": connected_theme})
     print(response)
 
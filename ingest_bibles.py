@@ -0,0 +1,258 @@
+"""
+Compiles the JSON bibles (Mal1910.json, ERV-NE-SimpleJSON) into SQLite databases
+that use the same *_books / *_verses schema as KJV.db and KorRV.db.
+
+Usage:
+    python ingest_bibles.py                  # ingest every JSON translation
+    python ingest_bibles.py mal1910          # ingest a single translation
+    python ingest_bibles.py versification    # only compare verse numbering with KJV
+
+After ingesting, every translation's per-chapter verse counts are compared with KJV and the
+chapters that differ are written to canon.VERSIFICATION_FILE (see canon.is_aligned).
+
+The JSON is streamed book by book with ijson when it is installed, so the whole
+parse tree is never held in memory while ingesting. The output is written to a
+temporary file and moved into place only after its per-chapter verse counts
+match the ones verse_store.py reads from the same JSON in a separate pass, so
+the tool can be rerun at any time.
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, List, Tuple
+import canon
+import verse_store
+
+try:
+    import ijson
+except ImportError:  # Fall back to a full json.load when ijson is not installed
+    ijson = None
+
+# translation -> source JSON layout and target database
+INGEST_SOURCES = {
+    'mal1910': {
+        'kind': 'mal_json',
+        'source': 'database/Mal1910.json',
+        'target': 'database/Mal1910.db',
+        'prefix': 'Mal1910',
+    },
+    'ne': {
+        'kind': 'ne_json',
+        'source': 'database/ERV-NE-SimpleJSON',
+        'target': 'database/NE_bible.db',
+        'prefix': 'NE',
+    },
+}
+
+# Number of Old Testament books; book ids above this are New Testament
+OLD_TESTAMENT_BOOKS = 39
+
+
+def _iter_json_books(path: str, items_path: str, fallback) -> Iterator[dict]:
+    """
+    Yields one book object at a time from a JSON file.
+    """
+    with open(path, 'rb') as file:
+        if ijson is not None:
+            yield from ijson.items(file, items_path, use_float=True)
+        else:
+            print("ijson is not installed, loading the whole file into memory")
+            yield from fallback(json.load(file))
+
+
+def iter_mal_verses(path: str) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    Yields (book name, chapter, verse, text) from the Mal1910.json layout (books/chapters/verses).
+    """
+    for book in _iter_json_books(path, 'books.item', lambda data: data['books']):
+        for chap in book.get('chapters', []):
+            for verse in chap.get('verses', []):
+                yield book['name'], int(chap['chapter']), int(verse['verse']), verse['text']
+
+
+def iter_ne_verses(path: str) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    Yields (book name, chapter, verse, text) from the ERV-NE-SimpleJSON layout
+    (osis/osisText/div/chapter/verse with cnumber/vnumber).
+    """
+    books = _iter_json_books(path, 'osis.item.osisText.item.div.item',
+                             lambda data: data['osis'][0]['osisText'][0]['div'])
+    for book in books:
+        for chap in book['chapter']:
+            for verse in chap['verse']:
+                yield book['name']['_value'], int(chap['cnumber']), int(verse['vnumber']), verse['_text']
+
+
+_VERSE_ITERATORS = {
+    'mal_json': iter_mal_verses,
+    'ne_json': iter_ne_verses,
+}
+
+
+def create_schema(conn: sqlite3.Connection, prefix: str):
+    """
+    Creates the *_books / *_verses tables used by the KJV path.
+    """
+    conn.execute(f"""
+    CREATE TABLE {prefix}_books (
+        id INTEGER PRIMARY KEY,
+        book_reference_id INTEGER,
+        testament_reference_id INTEGER,
+        name TEXT
+    )""")
+    conn.execute(f"""
+    CREATE TABLE {prefix}_verses (
+        id INTEGER PRIMARY KEY,
+        book_id INTEGER,
+        chapter INTEGER,
+        verse INTEGER,
+        text TEXT
+    )""")
+
+
+def create_indexes(conn: sqlite3.Connection, prefix: str):
+    """
+    Adds the composite (book_id, chapter, verse) index used for verse lookups.
+    """
+    conn.execute(f"CREATE INDEX {prefix}_verses_book_chapter_verse ON {prefix}_verses (book_id, chapter, verse)")
+    conn.execute(f"CREATE INDEX {prefix}_books_name ON {prefix}_books (name)")
+
+
+def source_counts(translation: str) -> Dict[Tuple[str, int], int]:
+    """
+    Returns {(book name, chapter): verse count} read from a translation's JSON by verse_store.py,
+    independently of the streaming parsers above.
+    """
+    store = verse_store.load_store(translation, use_binary=False, use_compiled=False)
+    return {(book_name, chapter): store.verse_count(book_name, chapter)
+            for book_name in store.book_names for chapter in store.chapter_list(book_name)}
+
+
+def verify_counts(conn: sqlite3.Connection, prefix: str, expected: Dict[Tuple[str, int], int]):
+    """
+    Checks that the database holds exactly the expected number of verses in every chapter.
+    """
+    query = f"""
+    SELECT {prefix}_books.name, {prefix}_verses.chapter, COUNT(*)
+    FROM {prefix}_verses
+    JOIN {prefix}_books ON {prefix}_verses.book_id = {prefix}_books.id
+    GROUP BY {prefix}_verses.book_id, {prefix}_verses.chapter
+    """
+    actual = {(name, chapter): count for name, chapter, count in conn.execute(query)}
+    if actual != expected:
+        mismatched = [f"{name} {chapter}" for name, chapter in sorted(set(actual) | set(expected))
+                      if actual.get((name, chapter)) != expected.get((name, chapter))]
+        raise ValueError(f"Verse count mismatch for {prefix} in {', '.join(mismatched)}")
+
+
+def ingest(translation: str) -> Dict[str, float]:
+    """
+    Streams one JSON translation into its SQLite database and returns ingest statistics.
+    """
+    config = INGEST_SOURCES[translation]
+    prefix = config['prefix']
+    target = config['target']
+    tmp_path = target + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The temporary file is thrown away on failure, so durability is not needed while building
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        create_schema(conn, prefix)
+
+        book_ids = {}
+        verses = 0
+        batch = []
+        for book_name, chapter, verse, text in _VERSE_ITERATORS[config['kind']](config['source']):
+            book_id = book_ids.get(book_name)
+            if book_id is None:
+                book_id = len(book_ids) + 1
+                book_ids[book_name] = book_id
+                testament = 1 if book_id <= OLD_TESTAMENT_BOOKS else 2
+                conn.execute(f"INSERT INTO {prefix}_books VALUES (?, ?, ?, ?)",
+                             (book_id, book_id, testament, book_name))
+            verses += 1
+            batch.append((book_id, chapter, verse, text))
+            if len(batch) >= 5000:
+                conn.executemany(f"INSERT INTO {prefix}_verses (book_id, chapter, verse, text) VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany(f"INSERT INTO {prefix}_verses (book_id, chapter, verse, text) VALUES (?, ?, ?, ?)", batch)
+
+        create_indexes(conn, prefix)
+        conn.commit()
+        verify_counts(conn, prefix, source_counts(translation))
+        conn.execute('ANALYZE')
+        conn.commit()
+    except Exception:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, target)
+
+    elapsed = time.perf_counter() - started
+    source_mb = os.path.getsize(config['source']) / (1024 * 1024)
+    return {
+        'books': len(book_ids),
+        'verses': verses,
+        'seconds': elapsed,
+        'verses_per_second': verses / elapsed if elapsed else 0.0,
+        'mb_per_second': source_mb / elapsed if elapsed else 0.0,
+    }
+
+
+def chapter_verse_counts(translation: str) -> Dict[Tuple[int, int], int]:
+    """
+    Returns {(book number, chapter): verse count} read from a translation's sources, not its .bbin.
+    """
+    store = verse_store.load_store(translation, use_binary=False)
+    counts = {}
+    for book in range(1, len(canon.BOOKS) + 1):
+        book_name = canon.book_name(book, translation)
+        for chapter in store.chapter_list(book_name):
+            counts[(book, chapter)] = store.verse_count(book_name, chapter)
+    return counts
+
+
+def write_versification(path: str = canon.VERSIFICATION_FILE) -> Dict[str, List[List[int]]]:
+    """
+    Writes the chapters whose verse count differs from KJV, per translation, and returns them.
+    """
+    kjv = chapter_verse_counts('kjv')
+    differing = {}
+    for translation in canon.TRANSLATION_NAME_COLUMNS:
+        if translation == 'kjv':
+            continue
+        counts = chapter_verse_counts(translation)
+        differing[translation] = [[book, chapter, kjv.get((book, chapter), 0), counts.get((book, chapter), 0)]
+                                  for book, chapter in sorted(set(kjv) | set(counts))
+                                  if kjv.get((book, chapter), 0) != counts.get((book, chapter), 0)]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(differing, file, indent=1)
+    os.replace(tmp_path, path)
+    return differing
+
+
+if __name__ == "__main__":
+    translations = [] if sys.argv[1:] == ['versification'] else sys.argv[1:] or list(INGEST_SOURCES)
+    for translation in translations:
+        if translation not in INGEST_SOURCES:
+            print(f"Unknown translation: {translation} (expected one of {', '.join(INGEST_SOURCES)}, or versification)")
+            sys.exit(1)
+        stats = ingest(translation)
+        print(f"{translation}: {stats['verses']} verses in {stats['books']} books -> "
+              f"{INGEST_SOURCES[translation]['target']} in {stats['seconds']:.2f}s "
+              f"({stats['verses_per_second']:.0f} verses/s, {stats['mb_per_second']:.1f} MB/s)")
+    for translation, chapters in write_versification().items():
+        ruled = {(book, chapter) for book, chapter, _ in canon.VERSIFICATION.get(translation, {})}
+        unruled = [chapter for chapter in chapters if tuple(chapter[:2]) not in ruled]
+        print(f"{translation}: {len(chapters)} chapters numbered differently from KJV, "
+              f"{len(unruled)} without a VERSIFICATION rule -> {canon.VERSIFICATION_FILE}")
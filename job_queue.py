@@ -0,0 +1,185 @@
+"""
+Bounded background worker pool for analysis generation.
+
+An uncached analysis (parse + fetch + explain + translate) takes several LLM round trips.
+Running it as a job frees the Flask request thread immediately; the browser polls the job
+status instead. The pool size (ANALYSIS_WORKERS) caps how many analyses run at once,
+independently of how many HTTP requests the server handles, and at most ANALYSIS_QUEUE_SIZE
+jobs wait for a worker. Interactive jobs are picked before background ones.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "100"))
+JOB_RETENTION_SECONDS = 600  # finished jobs are kept this long for polling
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+PRIORITIES = {'interactive': PRIORITY_INTERACTIVE, 'background': PRIORITY_BACKGROUND}
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted while ANALYSIS_QUEUE_SIZE jobs are already waiting.
+    """
+
+
+@dataclass
+class Job:
+    id: str
+    priority: int
+    fn: Callable = field(repr=False)
+    args: tuple = field(repr=False)
+    meta: Dict[str, Any] = field(default_factory=dict)
+    status: str = 'queued'  # queued, running, done or failed
+    result: Any = field(default=None, repr=False)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Priority queue served by a fixed number of daemon worker threads, started on first use.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue = queue.PriorityQueue()
+        self._jobs: Dict[str, Job] = {}
+        self._sequence = itertools.count()  # keeps FIFO order within a priority
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pending = 0
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f'analysis-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, meta: Optional[Dict] = None) -> Job:
+        """
+        Queues fn(*args) and returns its Job. Raises QueueFull if too many jobs are waiting.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"{self._pending} jobs are already waiting")
+            self._prune()
+            self._start_workers()
+            job = Job(uuid.uuid4().hex, priority, fn, args, meta or {})
+            self._jobs[job.id] = job
+            self._pending += 1
+            self.submitted += 1
+        self._queue.put((priority, next(self._sequence), job.id))
+        return job
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs[job_id]
+                job.status = 'running'
+                job.started_at = time.time()
+                self._pending -= 1
+                self._running += 1
+            try:
+                result = job.fn(*job.args)
+                status, error = 'done', None
+            except Exception as e:
+                print(f"Error in job {job.id}: {e}")
+                result, status, error = None, 'failed', str(e)
+            with self._lock:
+                job.result, job.status, job.error = result, status, error
+                job.finished_at = time.time()
+                self._running -= 1
+                if status == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queued_ahead(self, job: Job) -> int:
+        """
+        Returns how many queued jobs will be picked before this one.
+        """
+        with self._lock:
+            return sum(1 for other in self._jobs.values()
+                       if other.status == 'queued' and other is not job
+                       and (other.priority, other.created_at) <= (job.priority, job.created_at))
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queued': self._pending,
+                'running': self._running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+
+_analysis_jobs = JobQueue(ANALYSIS_WORKERS, ANALYSIS_QUEUE_SIZE)
+
+
+def submit(fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, meta: Optional[Dict] = None) -> Job:
+    """
+    Queues an analysis job on the shared pool.
+    """
+    return _analysis_jobs.submit(fn, *args, priority=priority, meta=meta)
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    return _analysis_jobs.get(job_id)
+
+
+def queued_ahead(job: Job) -> int:
+    return _analysis_jobs.queued_ahead(job)
+
+
+def get_stats() -> Dict[str, int]:
+    return _analysis_jobs.get_stats()
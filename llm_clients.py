@@ -0,0 +1,271 @@
+"""
+Process-wide registry of Groq clients and LangChain chains.
+
+Every chain is built once (prompt template | ChatGroq) and reused by all requests and threads.
+All ChatGroq instances share one httpx client, so keep-alive connections to the Groq API are
+reused instead of paying a TCP + TLS handshake for every LLM call.
+
+Timeouts and pool sizes come from the environment (.env):
+    GROQ_TIMEOUT            seconds to wait for a response (default 60)
+    GROQ_CONNECT_TIMEOUT    seconds to wait for a connection (default 5)
+    GROQ_MAX_CONNECTIONS    connections open at once (default 20)
+    GROQ_MAX_KEEPALIVE      idle connections kept for reuse (default 10)
+    GROQ_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 30)
+    GROQ_MAX_RETRIES        retries on connection errors and rate limits (default 2)
+    LLM_DEADLINE            seconds a concurrent LLM call may run (default 45)
+    LLM_QUEUE_TIMEOUT       seconds a concurrent LLM call may wait for a free thread (default LLM_DEADLINE)
+    LLM_WORKERS             threads running concurrent LLM calls (default: enough for every analysis
+                            worker's widest fan-out at once, ANALYSIS_WORKERS x LLM_MAX_FANOUT, at least 8)
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import httpx
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.prompts import PromptTemplate
+from langchain_groq import ChatGroq
+import pipeline_metrics
+
+load_dotenv()  # Load environment variables from .env file
+
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "10"))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", str(LLM_DEADLINE)))
+LLM_MAX_FANOUT = 5  # calls per analysis in sections mode (analysis_pipeline.ALL_SECTIONS)
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", str(max(8, int(os.getenv("ANALYSIS_WORKERS", "4")) * LLM_MAX_FANOUT))))
+
+_lock = threading.Lock()
+_http_client = None
+_llms: Dict[Tuple[str, float, bool], ChatGroq] = {}
+_chains: Dict[Tuple[str, str], object] = {}
+_stats = {'requests': 0, 'connections_opened': 0, 'chain_builds': 0, 'chain_hits': 0,
+          'concurrent_calls': 0, 'concurrent_failures': 0, 'concurrent_timeouts': 0, 'concurrent_queue_timeouts': 0,
+          'llm_calls': 0, 'input_tokens': 0, 'output_tokens': 0}
+_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix='llm')
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def _trace(event_name: str, info):
+    # httpcore reports a new TCP connection only when no pooled connection could be reused
+    if event_name.endswith('connect_tcp.complete'):
+        _count('connections_opened')
+
+
+def _on_request(request: httpx.Request):
+    _count('requests')
+    previous = request.extensions.get('trace')
+    if previous is None:
+        request.extensions['trace'] = _trace
+    else:
+        def trace(event_name, info):
+            _trace(event_name, info)
+            previous(event_name, info)
+        request.extensions['trace'] = trace
+
+
+class _UsageCallback(BaseCallbackHandler):
+    """
+    Adds the token usage Groq reports for every completed call to the registry counters
+    and to the pipeline step it ran in (see pipeline_metrics.py).
+    """
+
+    def on_llm_end(self, response, **kwargs):
+        llm_output = response.llm_output or {}
+        usage = llm_output.get('token_usage') or {}
+        model = llm_output.get('model_name')
+        input_tokens = usage.get('prompt_tokens', 0)
+        output_tokens = usage.get('completion_tokens', 0)
+        if not usage:
+            # Streamed calls report usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, 'message', None)
+                    metadata = getattr(message, 'usage_metadata', None) or {}
+                    input_tokens += metadata.get('input_tokens', 0)
+                    output_tokens += metadata.get('output_tokens', 0)
+                    model = model or (getattr(message, 'response_metadata', None) or {}).get('model_name')
+        pipeline_metrics.record_llm(model, input_tokens, output_tokens)
+        with _lock:
+            _stats['llm_calls'] += 1
+            _stats['input_tokens'] += input_tokens
+            _stats['output_tokens'] += output_tokens
+
+
+_usage_callback = _UsageCallback()
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Returns the shared, thread-safe httpx client used by every ChatGroq instance.
+    """
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    timeout=httpx.Timeout(GROQ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS,
+                                        max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+                                        keepalive_expiry=GROQ_KEEPALIVE_EXPIRY),
+                    event_hooks={'request': [_on_request]},
+                )
+    return _http_client
+
+
+def get_llm(model: str, temperature: float = 0.7, json_mode: bool = False) -> ChatGroq:
+    """
+    Returns the shared ChatGroq instance for a model.
+    json_mode asks Groq to constrain the output to a single JSON object.
+    """
+    key = (model, temperature, json_mode)
+    llm = _llms.get(key)
+    if llm is not None:
+        return llm
+    http_client = get_http_client()
+    with _lock:
+        llm = _llms.get(key)
+        if llm is None:
+            model_kwargs = {'response_format': {'type': 'json_object'}} if json_mode else {}
+            llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model=model, temperature=temperature,
+                           http_client=http_client, timeout=GROQ_TIMEOUT, max_retries=GROQ_MAX_RETRIES,
+                           model_kwargs=model_kwargs, callbacks=[_usage_callback])
+            _llms[key] = llm
+    return llm
+
+
+def get_chain(name: str, template: str, input_variables: List[str], model: str, json_mode: bool = False):
+    """
+    Returns the chain registered under name for a model, building it on first use.
+    name identifies the prompt (e.g. 'kjv.reference_parser'); template is only read the first time.
+    """
+    key = (name, model)
+    chain = _chains.get(key)
+    if chain is not None:
+        _count('chain_hits')
+        return chain
+    llm = get_llm(model, json_mode=json_mode)
+    with _lock:
+        chain = _chains.get(key)
+        if chain is None:
+            chain = PromptTemplate(input_variables=input_variables, template=template) | llm
+            _chains[key] = chain
+            _stats['chain_builds'] += 1
+        else:
+            _stats['chain_hits'] += 1
+    return chain
+
+
+def run_concurrently(calls: Dict[str, Callable[[], object]], deadline: float = LLM_DEADLINE,
+                     default: object = '', queue_timeout: float = LLM_QUEUE_TIMEOUT) -> Tuple[Dict[str, object], Dict[str, str]]:
+    """
+    Runs independent LLM calls at the same time. Each call may run for deadline seconds from the
+    moment a worker thread starts it, after waiting at most queue_timeout seconds for one.
+    Returns (results, errors): a call that raised, missed its deadline or never started gets
+    default as its result and a message in errors, so the caller can still use the calls that finished.
+    Calls run on worker threads, so they must not touch the Flask request or session; they do
+    see the caller's pipeline_metrics trace.
+    """
+    started: Dict[str, float] = {}
+    changed = threading.Condition()  # notified when a call starts or finishes
+
+    def run(name, call):
+        with changed:
+            started[name] = time.monotonic()
+            changed.notify_all()
+        return call()
+
+    def finished(_):
+        with changed:
+            changed.notify_all()
+
+    submitted = time.monotonic()
+    futures = {}
+    for name, call in calls.items():
+        futures[name] = _executor.submit(contextvars.copy_context().run, run, name, call)
+        futures[name].add_done_callback(finished)
+    timed_out, never_started = set(), set()
+    with changed:
+        pending = set(futures)
+        while True:
+            now = time.monotonic()
+            limits = []
+            for name in list(pending):
+                if futures[name].done():
+                    pending.discard(name)
+                elif name not in started and submitted + queue_timeout <= now:
+                    if futures[name].cancel():
+                        pending.discard(name)
+                        never_started.add(name)
+                    else:
+                        started.setdefault(name, now)  # a worker just picked it up
+                        limits.append(started[name] + deadline)
+                elif name in started and started[name] + deadline <= now:
+                    pending.discard(name)
+                    timed_out.add(name)
+                else:
+                    limits.append(started[name] + deadline if name in started else submitted + queue_timeout)
+            if not pending:
+                break
+            changed.wait(min(limits) - now)
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        _count('concurrent_calls')
+        if name in never_started:
+            _count('concurrent_queue_timeouts')
+            results[name] = default
+            errors[name] = f"not started after {queue_timeout:g}s, every LLM worker was busy"
+            continue
+        if name in timed_out:
+            _count('concurrent_timeouts')
+            results[name] = default
+            errors[name] = f"timed out after {deadline:g}s"
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"Error in {name}: {e}")
+            _count('concurrent_failures')
+            results[name] = default
+            errors[name] = str(e)
+    return results, errors
+
+
+def get_stats() -> Dict[str, object]:
+    """
+    Returns registry, connection reuse and token usage counters.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['chains'] = len(_chains)
+        stats['clients'] = len(_llms)
+    stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+    stats['reuse_rate'] = stats['connections_reused'] / stats['requests'] if stats['requests'] else 0.0
+    return stats
+
+
+def clear():
+    """
+    Drops every cached chain and client and closes the pooled connections.
+    """
+    global _http_client
+    with _lock:
+        _chains.clear()
+        _llms.clear()
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
@@ -0,0 +1,249 @@
+"""
+Per-step timing, token and cost instrumentation for the analysis pipeline.
+
+Each request (or background job, or stream) runs inside a trace; the pipeline marks its steps
+with spans:
+
+    with pipeline_metrics.span('fetch'):
+        verses = pipeline.fetch(reference, bible_api_key)
+
+Steps recorded: parse, cache_lookup, fetch, explain (explain.<section> in sections mode),
+translate.<field>, cache_write and wait (for an identical analysis already in flight).
+The LLM usage callback in llm_clients.py adds the model, prompt and completion tokens and the
+cost of each call to the span it ran in, so a slow request can be pinned on one call.
+
+Finished traces feed per-route, per-step latency histograms and per-route, per-model token
+and cost counters, served in the Prometheus text format at /metrics. With
+PIPELINE_DEBUG_HEADER=1 each response also carries a Server-Timing header listing its spans,
+which browser developer tools show in the request's timing tab.
+
+Spans are kept in a context variable, so worker threads only see the trace when they run in a
+copy of the caller's context (llm_clients.run_concurrently does this).
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PIPELINE_DEBUG_HEADER = os.getenv("PIPELINE_DEBUG_HEADER", "") == "1"
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, float('inf'))
+
+# Groq list prices in USD per million (prompt, completion) tokens
+MODEL_PRICES = {
+    'llama-3.3-70b-versatile': (0.59, 0.79),
+    'mixtral-8x7b-32768': (0.24, 0.24),
+}
+
+
+def cost(model: Optional[str], input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class Span:
+    name: str
+    start: float                 # seconds since the trace started
+    duration: float = 0.0
+    model: Optional[str] = None
+    llm_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def cost(self) -> float:
+        return cost(self.model, self.input_tokens, self.output_tokens)
+
+    def to_dict(self) -> Dict:
+        data = {'name': self.name, 'start_ms': round(self.start * 1000, 1),
+                'duration_ms': round(self.duration * 1000, 1)}
+        if self.llm_calls:
+            data.update(model=self.model, llm_calls=self.llm_calls, input_tokens=self.input_tokens,
+                        output_tokens=self.output_tokens, cost_usd=round(self.cost, 6))
+        return data
+
+
+@dataclass
+class Trace:
+    route: str
+    started: float = field(default_factory=time.perf_counter)
+    duration: float = 0.0
+    spans: List[Span] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """
+        Formats the spans as a Server-Timing header value, e.g. explain;dur=2315.2;desc="…".
+        """
+        entries = []
+        with self._lock:
+            spans = list(self.spans)
+        for index, span in enumerate(spans):
+            entry = f'{index}-{span.name};dur={span.duration * 1000:.1f}'
+            if span.llm_calls:
+                entry += f';desc="{span.model} {span.input_tokens}+{span.output_tokens} tok ${span.cost:.5f}"'
+            entries.append(entry)
+        duration = self.duration or time.perf_counter() - self.started  # still running in after_request
+        entries.append(f'total;dur={duration * 1000:.1f}')
+        return ', '.join(entries)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {'route': self.route, 'duration_ms': round(self.duration * 1000, 1), 'spans': spans}
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('pipeline_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('pipeline_span', default=None)
+
+
+def begin(route: str) -> Tuple[Trace, contextvars.Token]:
+    """
+    Starts a trace in the current context. Pass both values to end().
+    """
+    trace = Trace(route)
+    return trace, _current_trace.set(trace)
+
+
+def end(trace: Trace, token: contextvars.Token):
+    """
+    Closes a trace started with begin() and adds it to the histograms.
+    """
+    trace.duration = time.perf_counter() - trace.started
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        _current_trace.set(None)  # ended from another context, e.g. after a streamed response
+    _registry.observe(trace)
+
+
+@contextmanager
+def trace(route: str) -> Iterator[Trace]:
+    """
+    Runs a block (a background job, a stream) as its own trace.
+    """
+    current, token = begin(route)
+    try:
+        yield current
+    finally:
+        end(current, token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[Optional[Span]]:
+    """
+    Times a step of the current trace; does nothing outside a trace.
+    """
+    current = _current_trace.get()
+    if current is None:
+        yield None
+        return
+    started = time.perf_counter()
+    step = Span(name, started - current.started)
+    token = _current_span.set(step)
+    try:
+        yield step
+    finally:
+        step.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        current.add(step)
+
+
+def record_llm(model: Optional[str], input_tokens: int, output_tokens: int):
+    """
+    Attributes one LLM call to the innermost open span (or to an 'llm' span of its own).
+    """
+    step = _current_span.get()
+    if step is None:
+        current = _current_trace.get()
+        if current is None:
+            return
+        step = Span('llm', time.perf_counter() - current.started)
+        current.add(step)
+    step.model = model or step.model
+    step.llm_calls += 1
+    step.input_tokens += input_tokens
+    step.output_tokens += output_tokens
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, str], _Histogram] = {}
+        self._usage: Dict[Tuple[str, str], List[float]] = {}  # (route, model) -> calls, input, output, cost
+
+    def observe(self, trace: Trace):
+        with self._lock:
+            self._latency.setdefault((trace.route, 'total'), _Histogram()).observe(trace.duration)
+            for step in trace.spans:
+                self._latency.setdefault((trace.route, step.name), _Histogram()).observe(step.duration)
+                if step.llm_calls:
+                    usage = self._usage.setdefault((trace.route, step.model or 'unknown'), [0, 0, 0, 0.0])
+                    usage[0] += step.llm_calls
+                    usage[1] += step.input_tokens
+                    usage[2] += step.output_tokens
+                    usage[3] += step.cost
+
+    def render(self) -> str:
+        lines = ['# HELP pipeline_step_seconds Duration of each pipeline step, per route.',
+                 '# TYPE pipeline_step_seconds histogram']
+        with self._lock:
+            for (route, step), histogram in sorted(self._latency.items()):
+                labels = f'route="{route}",step="{step}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'pipeline_step_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'pipeline_step_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'pipeline_step_seconds_count{{{labels}}} {histogram.count}')
+            usage = sorted(self._usage.items())
+        for metric, index, help_text in (
+                ('pipeline_llm_calls_total', 0, 'LLM calls'),
+                ('pipeline_llm_input_tokens_total', 1, 'Prompt tokens sent'),
+                ('pipeline_llm_output_tokens_total', 2, 'Completion tokens received'),
+                ('pipeline_llm_cost_usd_total', 3, 'Estimated cost at MODEL_PRICES')):
+            lines.append(f'# HELP {metric} {help_text}, per route and model.')
+            lines.append(f'# TYPE {metric} counter')
+            for (route, model), values in usage:
+                value = f'{values[index]:.6f}' if index == 3 else f'{values[index]}'
+                lines.append(f'{metric}{{route="{route}",model="{model}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry = _Registry()
+
+
+def render() -> str:
+    """
+    Returns every histogram and counter in the Prometheus text exposition format.
+    """
+    return _registry.render()
@@ -0,0 +1,243 @@
+"""
+Pre-generates analyses into the analysis store (see analysis_store.py) so daytime users find
+the most-read passages already explained.
+
+Usage:
+    python pregenerate.py --books John,Psalms                 # every chapter of some books
+    python pregenerate.py --top 200 --languages ko,ne         # the most queried passages
+    python pregenerate.py --file lectionary.txt --workers 4   # one reference per line (# comments)
+    python pregenerate.py "Psalm 23" "John 3:16-21" --rate 20
+
+Passages can be written with any language's book names; each is generated for every language
+in --languages (default: all) with the same step 5 the site uses. Passages already in the cache
+are skipped.
+
+Progress is appended to a checkpoint file (--checkpoint), so an interrupted run started again
+with the same arguments carries on where it stopped; failed passages are retried.
+--rate caps how many passages are started per minute. When Groq answers with a rate-limit
+error every worker pauses, with a longer pause each time, and the passage is retried.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import analysis_cache
+import canon
+from book_resolver import resolve_book
+from reference_parser import parse_reference
+from verse_store import get_store
+
+CHECKPOINT = 'database/pregenerate.checkpoint'
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_PAUSE = 30  # seconds; doubled for every consecutive rate-limit error
+
+Passage = Tuple[int, int, Optional[int], Optional[int]]  # canonical book, chapter, start, end
+
+
+def _step5(language: str):
+    if language == 'en':
+        from app import step5_process_bible_reference
+        # No session here: English analyses are stored untranslated
+        return lambda user_input: step5_process_bible_reference(user_input, None, language='en')
+    if language == 'ko':
+        from app_ko import step5_process_bible_reference_ko as step5
+    elif language == 'ne':
+        from app_ne import step5_process_bible_reference_ne as step5
+    else:
+        from app_mal import step5_process_bible_reference_mal as step5
+    return lambda user_input: step5(user_input, None)
+
+
+def book_passages(books: List[str]) -> List[Passage]:
+    """
+    Every chapter of the given books, as numbered in the KJV.
+    """
+    store = get_store('kjv')
+    passages = []
+    for name in books:
+        book = resolve_book(name)
+        if book is None:
+            raise SystemExit(f"Unknown book: {name}")
+        for chapter in range(1, store.chapter_count(canon.book_name(book, 'kjv')) + 1):
+            passages.append((book, chapter, None, None))
+    return passages
+
+
+def top_passages(count: int) -> List[Passage]:
+    """
+    The passages stored in the most languages.
+    """
+    return analysis_cache.get_store().passage_counts(count)
+
+
+def reference_passages(references: List[str]) -> List[Passage]:
+    passages = []
+    for reference in references:
+        for translation in canon.LANGUAGE_TRANSLATIONS.values():
+            parsed = parse_reference(reference, translation)
+            if parsed is not None:
+                passages.append(tuple(parsed))
+                break
+        else:
+            print(f"Skipping {reference!r}: not a reference")
+    return passages
+
+
+def file_passages(path: str) -> List[Passage]:
+    with open(path, encoding='utf-8') as file:
+        return reference_passages([line.split('#')[0].strip() for line in file if line.split('#')[0].strip()])
+
+
+def passage_input(passage: Passage, language: str) -> str:
+    """
+    The reference as a user of that language would type it, in the translation's numbering.
+    """
+    book, chapter, start_verse, end_verse = passage
+    translation = canon.LANGUAGE_TRANSLATIONS[language]
+    chapter, start_verse, end_verse = canon.to_translation(translation, book, chapter, start_verse, end_verse)
+    return analysis_cache.format_key((book, chapter, start_verse, end_verse, language))
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+class Runner:
+    """
+    Runs step 5 for each (passage, language) on a thread pool, paced and checkpointed.
+    """
+
+    def __init__(self, workers: int, rate: float, checkpoint: str):
+        self.workers = workers
+        self.interval = 60 / rate if rate else 0
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+        self._paused_until = 0.0
+        self._pause = RATE_LIMIT_PAUSE
+        self._step5 = {}
+        self.total = self.done = self.failed = self.skipped = 0
+        self.started = time.time()
+
+    def completed(self) -> set:
+        if not os.path.exists(self.checkpoint):
+            return set()
+        with open(self.checkpoint, encoding='utf-8') as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        return {(entry['language'], entry['reference']) for entry in entries if entry['status'] == 'done'}
+
+    def _record(self, language: str, reference: str, status: str, seconds: float, error: str = ''):
+        with self._lock:
+            with open(self.checkpoint, 'a', encoding='utf-8') as file:
+                file.write(json.dumps({'language': language, 'reference': reference, 'status': status,
+                                       'seconds': round(seconds, 2), 'error': error, 'at': time.time()},
+                                      ensure_ascii=False) + '\n')
+            if status == 'done':
+                self.done += 1
+            else:
+                self.failed += 1
+            finished = self.done + self.failed
+            elapsed = time.time() - self.started
+            per_minute = finished / elapsed * 60 if elapsed else 0
+            remaining = (self.total - finished) / per_minute if per_minute else 0
+            print(f"[{finished}/{self.total}] {language} {reference}: {status} in {seconds:.1f}s"
+                  f"{' (' + error + ')' if error else ''} | {per_minute:.1f}/min, {remaining:.0f} min left")
+
+    def _wait_turn(self):
+        """
+        Blocks until this worker may start a passage under --rate and any rate-limit pause.
+        """
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_start, self._paused_until)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def _rate_limited(self, error: Exception):
+        with self._lock:
+            print(f"Rate limited ({error}), pausing every worker for {self._pause}s")
+            self._paused_until = max(self._paused_until, time.time() + self._pause)
+            self._pause *= 2
+
+    def _get_step5(self, language: str):
+        with self._lock:
+            if language not in self._step5:
+                self._step5[language] = _step5(language)
+            return self._step5[language]
+
+    def run_one(self, language: str, reference: str):
+        step5 = self._get_step5(language)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self._wait_turn()
+            started = time.time()
+            try:
+                response = step5(reference)
+            except Exception as e:
+                if _is_rate_limit(e) and attempt < RATE_LIMIT_RETRIES:
+                    self._rate_limited(e)
+                    continue
+                self._record(language, reference, 'failed', time.time() - started, str(e))
+                return
+            with self._lock:
+                self._pause = RATE_LIMIT_PAUSE
+            if response.get("error") or not response.get("explanation"):
+                self._record(language, reference, 'failed', time.time() - started,
+                             response.get("error") or "no explanation")
+            else:
+                self._record(language, reference, 'done', time.time() - started)
+            return
+
+    def run(self, passages: List[Passage], languages: List[str]):
+        completed = self.completed()
+        work = []
+        for passage in dict.fromkeys(passages):
+            for language in languages:
+                reference = passage_input(passage, language)
+                key = analysis_cache.stored_key(reference, language)
+                if (language, reference) in completed or (key and analysis_cache.find_key(key, contained=False)):
+                    self.skipped += 1
+                    continue
+                work.append((language, reference))
+        self.total = len(work)
+        print(f"{self.total} analyses to generate, {self.skipped} already cached or done, "
+              f"{self.workers} workers")
+        self.started = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pregenerate') as executor:
+            for language, reference in work:
+                executor.submit(self.run_one, language, reference)
+        elapsed = time.time() - self.started
+        print(f"Generated {self.done}, failed {self.failed}, skipped {self.skipped} in {elapsed / 60:.1f} min")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate analyses into the analysis cache.")
+    parser.add_argument('references', nargs='*', help="references such as 'Psalm 23' or 'John 3:16-21'")
+    parser.add_argument('--books', help="comma separated books; every chapter is generated")
+    parser.add_argument('--top', type=int, help="the N passages stored in the most languages")
+    parser.add_argument('--file', help="file with one reference per line")
+    parser.add_argument('--languages', default=','.join(canon.LANGUAGE_TRANSLATIONS),
+                        help="comma separated languages (default: all)")
+    parser.add_argument('--workers', type=int, default=2, help="passages generated at once (default 2)")
+    parser.add_argument('--rate', type=float, default=30, help="passages started per minute, 0 for no limit (default 30)")
+    parser.add_argument('--checkpoint', default=CHECKPOINT, help=f"progress file (default {CHECKPOINT})")
+    args = parser.parse_args()
+
+    passages = reference_passages(args.references)
+    if args.books:
+        passages += book_passages(args.books.split(','))
+    if args.top:
+        passages += top_passages(args.top)
+    if args.file:
+        passages += file_passages(args.file)
+    if not passages:
+        parser.error("give references, --books, --top or --file")
+    languages = args.languages.split(',')
+    unknown = [language for language in languages if language not in canon.LANGUAGE_TRANSLATIONS]
+    if unknown:
+        parser.error(f"unknown languages: {', '.join(unknown)}")
+
+    Runner(args.workers, args.rate, args.checkpoint).run(passages, languages)
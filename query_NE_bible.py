@@ -1,27 +1,35 @@
-import json
-from typing import List, Dict, Optional
-
-def load_json_data(file_path: str) -> Dict:
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    return data
+import sqlite3
+from typing import List, Dict, Optional, Tuple
+from verse_store import get_store
+import chapter_cache
+from book_resolver import resolve_book_name
 
 def query_ne_bible_json(book_name: str, chapter: int, start_verse: Optional[int] = None, end_verse: Optional[int] = None) -> List[Dict[str, str]]:
     """
-    Fetches verses from the ERV-NE-SimpleJSON file.
+    Fetches verses from the ERV-NE verse store (the ERV-NE-SimpleJSON file is parsed once per process).
     """
-    data = load_json_data('database/ERV-NE-SimpleJSON')
-    verses = []
-    
-    for book in data['osis'][0]['osisText'][0]['div']:
-        if book['name']['_value'] == book_name:
-            for chap in book['chapter']:
-                if chap['cnumber'] == chapter:
-                    for verse in chap['verse']:
-                        verse_num = int(verse['vnumber'])
-                        if (start_verse is None or verse_num >= start_verse) and (end_verse is None or verse_num <= end_verse):
-                            verses.append({'verse_num': verse_num, 'text': verse['_text']})
-    return verses
+    book_name = resolve_book_name(book_name, 'ne') or book_name
+    try:
+        store = get_store('ne')
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return []
+    return [{'verse_num': verse_num, 'text': text}
+            for verse_num, text in store.get_verses(book_name, chapter, start_verse, end_verse)]
+
+def query_ne_bible_batch(references: List[Tuple[str, int, Optional[int], Optional[int]]]) -> List[List[Dict[str, str]]]:
+    """
+    Fetches many (book, chapter, start_verse, end_verse) references from the ERV-NE verse store in one pass.
+    """
+    try:
+        store = get_store('ne')
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return [[] for _ in references]
+    references = [(resolve_book_name(book_name, 'ne') or book_name, chapter, start_verse, end_verse)
+                  for book_name, chapter, start_verse, end_verse in references]
+    return [[{'verse_num': verse_num, 'text': text} for verse_num, text in verses]
+            for verses in store.get_verses_batch(references)]
 
 def get_books() -> Dict[str, List[str]]:
     """
@@ -47,22 +55,32 @@ def get_books() -> Dict[str, List[str]]:
 
 def get_chapters(book_name: str) -> Dict[int, List[str]]:
     """
-    Fetches all chapters and their verses for a given book from the ERV-NE-SimpleJSON file.
+    Fetches all chapters and their verses for a given book from the ERV-NE verse store.
     """
-    data = load_json_data('database/ERV-NE-SimpleJSON')
+    try:
+        store = get_store('ne')
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return {}
+
     chapters = {}
-    
-    for book in data['osis'][0]['osisText'][0]['div']:
-        if book['name']['_value'] == book_name:
-            for chap in book['chapter']:
-                chapter_num = chap['cnumber']
-                verses = []
-                for verse in chap['verse']:
-                    verse_text = f'<span class="verse-num">{verse["vnumber"]}</span> {verse["_text"]}'
-                    verses.append(verse_text)
-                chapters[chapter_num] = verses
+    for chapter_num, verses in store.iter_chapters(book_name):
+        chapters[chapter_num] = [f'<span class="verse-num">{verse_num}</span> {text}' for verse_num, text in verses]
     return chapters
 
+def get_chapter(book_name: str, chapter: int) -> List[str]:
+    """
+    Fetches the rendered verses of a single chapter from the ERV-NE verse store.
+    Chapters are kept in the shared, size-bounded chapter cache.
+    """
+    return chapter_cache.get_chapter('ne', book_name, chapter)
+
+def get_chapter_numbers(book_name: str) -> List[int]:
+    """
+    Returns the chapter numbers of a book without loading its verses.
+    """
+    return chapter_cache.get_chapter_numbers('ne', book_name)
+
 if __name__ == "__main__":
     # Sample query to test the function
     verses = query_ne_bible_json('उत्पत्तिको पुस्तक', 1, 1, 10)
@@ -1,36 +1,24 @@
 import sqlite3
-from typing import List, Dict, Optional
-from contextlib import contextmanager
-import threading
+from typing import List, Dict, Optional, Tuple
+import bible_db
+from verse_store import get_store
+import chapter_cache
+from book_resolver import resolve_book_name
 
-# Thread-local storage for database connections
-_thread_local = threading.local()
+KJV_DB_PATH = 'database/KJV.db'
 
 def get_connection():
     """
-    Get a thread-local database connection.
-    This ensures each thread has its own connection and reuses it.
+    Get the pooled, read-only KJV database connection for the current thread.
     """
-    if not hasattr(_thread_local, 'conn') or _thread_local.conn is None:
-        _thread_local.conn = sqlite3.connect('database/KJV.db', check_same_thread=False)
-        # Enable WAL mode for better concurrent read performance
-        _thread_local.conn.execute('PRAGMA journal_mode=WAL')
-        # Enable read-only mode for safety (optional)
-        # _thread_local.conn.execute('PRAGMA query_only=ON')
-    return _thread_local.conn
+    return bible_db.get_connection(KJV_DB_PATH)
 
-@contextmanager
 def get_cursor():
     """
     Context manager for getting a database cursor.
     Automatically handles connection management.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        yield cursor
-    finally:
-        cursor.close()
+    return bible_db.get_cursor(KJV_DB_PATH)
 
 def list_tables(conn):
     """
@@ -46,37 +34,30 @@ def list_tables(conn):
 
 def query_kjv_db(book_name: str, chapter: int, start_verse: Optional[int] = None, end_verse: Optional[int] = None) -> List[Dict[str, str]]:
     """
-    Fetches verses from the KJV.db SQLite database using a persistent connection.
-    """
-    # Build the query based on the provided parameters
-    query = """
-    SELECT KJV_books.name, KJV_verses.chapter, KJV_verses.verse, KJV_verses.text
-    FROM KJV_verses
-    JOIN KJV_books ON KJV_verses.book_id = KJV_books.id
-    WHERE KJV_books.name = ? AND KJV_verses.chapter = ?
+    Fetches verses from the in-memory KJV verse store (loaded once from KJV.db).
     """
-    params = [book_name, chapter]
-
-    if start_verse is not None:
-        query += " AND KJV_verses.verse >= ?"
-        params.append(start_verse)
-
-    if end_verse is not None:
-        query += " AND KJV_verses.verse <= ?"
-        params.append(end_verse)
-
-    query += " ORDER BY KJV_verses.verse"
-
+    book_name = resolve_book_name(book_name, 'kjv') or book_name
     try:
-        with get_cursor() as cursor:
-            cursor.execute(query, params)
-            # Fetch and return the results
-            results = cursor.fetchall()
-            verses = [{'verse_num': row[2], 'text': row[3]} for row in results]
-            return verses
-    except sqlite3.OperationalError as e:
+        store = get_store('kjv')
+    except (sqlite3.Error, OSError) as e:
         print(f"Error: {e}")
         return []
+    return [{'verse_num': verse_num, 'text': text}
+            for verse_num, text in store.get_verses(book_name, chapter, start_verse, end_verse)]
+
+def query_kjv_batch(references: List[Tuple[str, int, Optional[int], Optional[int]]]) -> List[List[Dict[str, str]]]:
+    """
+    Fetches many (book, chapter, start_verse, end_verse) references from the KJV verse store in one pass.
+    """
+    try:
+        store = get_store('kjv')
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error: {e}")
+        return [[] for _ in references]
+    references = [(resolve_book_name(book_name, 'kjv') or book_name, chapter, start_verse, end_verse)
+                  for book_name, chapter, start_verse, end_verse in references]
+    return [[{'verse_num': verse_num, 'text': text} for verse_num, text in verses]
+            for verses in store.get_verses_batch(references)]
 
 # Cache for books list (since it never changes)
 _books_cache = None
@@ -114,22 +95,19 @@ def get_books() -> Dict[str, List[str]]:
     ]
 
     try:
-        with get_cursor() as cursor:
-            cursor.execute(query)
-
-            # Fetch and categorize the results
-            results = cursor.fetchall()
-            books = {'Old Testament': [], 'New Testament': []}
-            for row in results:
-                book_name = row[0]
-                if book_name in old_testament_books:
-                    books['Old Testament'].append(book_name)
-                elif book_name in new_testament_books:
-                    books['New Testament'].append(book_name)
-
-            # Cache the result
-            _books_cache = books
-            return books
+        # Fetch and categorize the results
+        results = bible_db.execute(KJV_DB_PATH, query)
+        books = {'Old Testament': [], 'New Testament': []}
+        for row in results:
+            book_name = row[0]
+            if book_name in old_testament_books:
+                books['Old Testament'].append(book_name)
+            elif book_name in new_testament_books:
+                books['New Testament'].append(book_name)
+
+        # Cache the result
+        _books_cache = books
+        return books
     except sqlite3.OperationalError as e:
         print(f"Error: {e}")
         return {'Old Testament': [], 'New Testament': []}
@@ -153,60 +131,49 @@ def get_books() -> Dict[str, List[str]]:
 #     finally:
 #         conn.close()
         
-# Cache for chapters (since Bible content never changes)
-_chapters_cache = {}
-
 def get_chapters(book_name: str) -> Dict[int, List[str]]:
     """
-    Fetches all chapters and their verses for a given book from the KJV.db SQLite database.
-    Uses caching since Bible content never changes.
-    """
-    # Return cached result if available
-    if book_name in _chapters_cache:
-        return _chapters_cache[book_name]
-
-    query = """
-    SELECT chapter, verse, text
-    FROM KJV_verses
-    JOIN KJV_books ON KJV_verses.book_id = KJV_books.id
-    WHERE KJV_books.name = ?
-    ORDER BY chapter, verse
+    Fetches all chapters and their verses for a given book from the KJV verse store.
+    Prefer get_chapter, which materializes (and caches) only the chapter being read.
     """
     try:
-        with get_cursor() as cursor:
-            cursor.execute(query, (book_name,))
-            results = cursor.fetchall()
-            chapters = {}
-            for row in results:
-                chapter = row[0]
-                verse_text = f'<span class="verse-num">{row[1]}</span> {row[2]}'
-                if chapter not in chapters:
-                    chapters[chapter] = []
-                chapters[chapter].append(verse_text)
-
-            # Cache the result
-            _chapters_cache[book_name] = chapters
-            return chapters
-    except sqlite3.OperationalError as e:
+        store = get_store('kjv')
+    except (sqlite3.Error, OSError) as e:
         print(f"Error: {e}")
         return {}
 
+    chapters = {}
+    for chapter, verses in store.iter_chapters(book_name):
+        chapters[chapter] = [f'<span class="verse-num">{verse_num}</span> {text}' for verse_num, text in verses]
+    return chapters
+
+def get_chapter(book_name: str, chapter: int) -> List[str]:
+    """
+    Fetches the rendered verses of a single chapter from the KJV verse store.
+    Chapters are kept in the shared, size-bounded chapter cache.
+    """
+    return chapter_cache.get_chapter('kjv', book_name, chapter)
+
+def get_chapter_numbers(book_name: str) -> List[int]:
+    """
+    Returns the chapter numbers of a book without loading its verses.
+    """
+    return chapter_cache.get_chapter_numbers('kjv', book_name)
+
 def close_connection():
     """
-    Close the thread-local database connection.
+    Close the database connections held by the current thread.
     Call this when shutting down the application or at the end of a request.
     """
-    if hasattr(_thread_local, 'conn') and _thread_local.conn is not None:
-        _thread_local.conn.close()
-        _thread_local.conn = None
+    bible_db.close_connections()
 
 def clear_cache():
     """
     Clear all cached data. Useful for testing or if the database is updated.
     """
-    global _books_cache, _chapters_cache
+    global _books_cache
     _books_cache = None
-    _chapters_cache = {}
+    chapter_cache.clear_cache()
 
 if __name__ == "__main__":
     # Sample query to test the function
@@ -1,5 +1,8 @@
 import sqlite3
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from verse_store import get_store
+import chapter_cache
+from book_resolver import resolve_book_name
 
 def list_tables(conn):
     cursor = conn.cursor()
@@ -11,47 +14,30 @@ def list_tables(conn):
 
 def query_korrv_db(book_name: str, chapter: int, start_verse: Optional[int] = None, end_verse: Optional[int] = None) -> List[Dict[str, str]]:
     """
-    Fetches verses from the KorRV.db SQLite database.
+    Fetches verses from the in-memory KorRV verse store (loaded once from KorRV.db).
     """
-    # Connect to the SQLite database
-    conn = sqlite3.connect('database/KorRV.db')
-    
-    # List all tables in the database
-    list_tables(conn)
-    
-    # Build the query based on the provided parameters
-    query = """
-    SELECT KorRV_books.name, KorRV_verses.chapter, KorRV_verses.verse, KorRV_verses.text
-    FROM KorRV_verses
-    JOIN KorRV_books ON KorRV_verses.book_id = KorRV_books.id
-    WHERE KorRV_books.name = ? AND KorRV_verses.chapter = ?
-    """
-    params = [book_name, chapter]
-    
-    if start_verse is not None:
-        query += " AND KorRV_verses.verse >= ?"
-        params.append(start_verse)
-    
-    if end_verse is not None:
-        query += " AND KorRV_verses.verse <= ?"
-        params.append(end_verse)
-    
-    query += " ORDER BY KorRV_verses.verse"
-    
+    book_name = resolve_book_name(book_name, 'korrv') or book_name
     try:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-
-        # Fetch and return the results
-        results = cursor.fetchall()
-        verses = [{'verse_num': row[2], 'text': row[3]} for row in results]
-        return verses
-    except sqlite3.OperationalError as e:
+        store = get_store('korrv')
+    except (sqlite3.Error, OSError) as e:
         print(f"Error: {e}")
         return []
-    finally:
-        # Close the connection
-        conn.close()
+    return [{'verse_num': verse_num, 'text': text}
+            for verse_num, text in store.get_verses(book_name, chapter, start_verse, end_verse)]
+
+def query_korrv_batch(references: List[Tuple[str, int, Optional[int], Optional[int]]]) -> List[List[Dict[str, str]]]:
+    """
+    Fetches many (book, chapter, start_verse, end_verse) references from the KorRV verse store in one pass.
+    """
+    try:
+        store = get_store('korrv')
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error: {e}")
+        return [[] for _ in references]
+    references = [(resolve_book_name(book_name, 'korrv') or book_name, chapter, start_verse, end_verse)
+                  for book_name, chapter, start_verse, end_verse in references]
+    return [[{'verse_num': verse_num, 'text': text} for verse_num, text in verses]
+            for verses in store.get_verses_batch(references)]
 
 def get_books() -> Dict[str, List[str]]:
     """
@@ -78,34 +64,31 @@ def get_books() -> Dict[str, List[str]]:
 
 def get_chapters(book_name: str) -> Dict[int, List[str]]:
     """
-    Fetches all chapters and their verses for a given book from the KorRV.db SQLite database.
-    """
-
-    conn = sqlite3.connect('database/KorRV.db')
-    query = """
-    SELECT chapter, verse, text
-    FROM KorRV_verses
-    JOIN KorRV_books ON KorRV_verses.book_id = KorRV_books.id
-    WHERE KorRV_books.name = ?
-    ORDER BY chapter, verse
+    Fetches all chapters and their verses for a given book from the KorRV verse store.
     """
     try:
-        cursor = conn.cursor()
-        cursor.execute(query, (book_name,))
-        results = cursor.fetchall()
-        chapters = {}
-        for row in results:
-            chapter = row[0]
-            verse_text = f'<span class="verse-num">{row[1]}</span> {row[2]}'
-            if chapter not in chapters:
-                chapters[chapter] = []
-            chapters[chapter].append(verse_text)
-        return chapters
-    except sqlite3.OperationalError as e:
+        store = get_store('korrv')
+    except (sqlite3.Error, OSError) as e:
         print(f"Error: {e}")
         return {}
-    finally:
-        conn.close()
+
+    chapters = {}
+    for chapter, verses in store.iter_chapters(book_name):
+        chapters[chapter] = [f'<span class="verse-num">{verse_num}</span> {text}' for verse_num, text in verses]
+    return chapters
+
+def get_chapter(book_name: str, chapter: int) -> List[str]:
+    """
+    Fetches the rendered verses of a single chapter from the KorRV verse store.
+    Chapters are kept in the shared, size-bounded chapter cache.
+    """
+    return chapter_cache.get_chapter('korrv', book_name, chapter)
+
+def get_chapter_numbers(book_name: str) -> List[int]:
+    """
+    Returns the chapter numbers of a book without loading its verses.
+    """
+    return chapter_cache.get_chapter_numbers('korrv', book_name)
 
 if __name__ == "__main__":
     # Sample query to test the function
@@ -1,14 +1,13 @@
-import json
-from typing import List, Dict, Optional
-
-def load_json_data(file_path: str) -> Dict:
-    with open(file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    return data
+import sqlite3
+from typing import List, Dict, Optional, Tuple
+from verse_store import get_store
+import chapter_cache
+from book_resolver import resolve_book_name
 
 def query_mal_bible_json(book_name: str, chapter: int, start_verse: Optional[int] = None, end_verse: Optional[int] = None) -> List[Dict[str, str]]:
     """
-    Fetches verses from the Mal1910.json file based on the book name, chapter, and optional verse range.
+    Fetches verses from the Mal1910 verse store based on the book name, chapter, and optional verse range.
+    The Mal1910.json file is parsed once per process, not on every lookup.
     
     Args:
         book_name (str): Name of the book (e.g., "Genesis").
@@ -19,62 +18,18 @@ def query_mal_bible_json(book_name: str, chapter: int, start_verse: Optional[int
     Returns:
         List[Dict[str, str]]: A list of dictionaries containing 'verse' and 'text' for each verse.
     """
-    # Load the JSON data
-    data = load_json_data('database/Mal1910.json')
-    verses = []
-    
-    # Debug: Print the structure of the loaded data
-    print("Loaded JSON data structure:", type(data))
-    if isinstance(data, dict):
-        print("Keys in the dictionary:", data.keys())
-    
-    # Dictionary to map Malayalam book names to their English equivalents
-    malayalam_to_english = {
-        "ഉല്പത്തി": "Genesis", "പുറപ്പാട്": "Exodus", "ലേവ്യപുസ്തകം": "Leviticus", "സംಖ್ಯാപുസ്തകം": "Numbers", 
-        "ആവർത്തനം": "Deuteronomy", "യോശുവ": "Joshua", "ന്യായാധിപന്മാർ": "Judges", "രൂത്ത്": "Ruth",
-        "1 ശമൂവേൽ": "I Samuel", "2 ശമൂവേൽ": "II Samuel", "1 രാജാക്കന്മാർ": "I Kings", "2 രാജാക്കന്മാർ": "II Kings",
-        "1 ദിനവൃത്താന്തം": "I Chronicles", "2 ദിനവൃത്താന്തം": "II Chronicles", "എസ്രാ": "Ezra", "നെഹെമ്യാവു": "Nehemiah",
-        "എസ്ഥേർ": "Esther", "ഇയ്യോബ്": "Job", "സങ്കീർത്തനങ്ങൾ": "Psalms", "സദൃശ്യവാക്യങ്ങൾ": "Proverbs",
-        "സഭാപ്രസംഗി": "Ecclesiastes", "ഉത്തമഗീതം": "Song of Solomon", "യേശയ്യാവു": "Isaiah", "യിരെമ്യാവു": "Jeremiah",
-        "വിലാപങ്ങൾ": "Lamentations", "യേഹേസ്കേൽ": "Ezekiel", "ദാനിയേൽ": "Daniel", "ഹോശേയ": "Hosea", "യോവേൽ": "Joel",
-        "ആമോസ്": "Amos", "ഓബദ്യാവു": "Obadiah", "യോനാ": "Jonah", "മീഖാ": "Micah", "നാഹൂം": "Nahum",
-        "ഹബക്കൂക്ക്": "Habakkuk", "സെഫന്യാവു": "Zephaniah", "ഹഗ്ഗായി": "Haggai", "സെഖർയ്യാവു": "Zechariah",
-        "മലാഖി": "Malachi", "മത്തായി": "Matthew", "മർക്കോസ്": "Mark", "ലൂക്കോസ്": "Luke", "യോഹന്നാൻ": "John",
-        "പ്രവൃത്തികൾ": "Acts", "റോമർ": "Romans", "1 കൊരിന്ത്യർ": "I Corinthians", "2 കൊരിന്ത്യർ": "II Corinthians",
-        "ഗലാത്യർ": "Galatians", "എഫേസ്യർ": "Ephesians", "ഫിലിപ്പിയർ": "Philippians", "കൊലോസ്യർ": "Colossians",
-        "1 തെസ്സലോനിക്ക്യർ": "I Thessalonians", "2 തെസ്സലോനിക്ക്യർ": "II Thessalonians", "1 തിമോത്തെയോസ്": "I Timothy",
-        "2 തിമോത്തെയോസ്": "II Timothy", "തീത്തൊസ്": "Titus", "ഫിലേമോൻ": "Philemon", "എബ്രായർ": "Hebrews",
-        "യാക്കോബ്": "James", "1 പത്രോസ്": "I Peter", "2 പത്രോസ്": "II Peter", "1 യോഹന്നാൻ": "I John",
-        "2 യോഹന്നാൻ": "II John", "3 യോഹന്നാൻ": "III John", "യൂദാ": "Jude", "വെളിപ്പാട്": "Revelation of John"
-    }
+    # Malayalam names, abbreviations and misspellings resolve to the English name used by the store
+    book_name = resolve_book_name(book_name, 'mal1910') or book_name
 
-    # Check if the book name is in Malayalam and find its English equivalent
-    if book_name in malayalam_to_english:
-        book_name = malayalam_to_english[book_name]
+    try:
+        store = get_store('mal1910')
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return []
+
+    verses = [{'verse': verse_num, 'text': text}
+              for verse_num, text in store.get_verses(book_name, chapter, start_verse, end_verse)]
 
-    # Access the 'books' key
-    if 'books' not in data:
-        print("Error: 'books' key not found in JSON data.")
-        return verses
-    
-    # Iterate through the books
-    for book in data['books']:
-        if book['name'] == book_name:
-            print(f"Book found: {book['name']}")  # Debug print
-            # Iterate through the chapters
-            for chap in book.get('chapters', []):
-                if chap['chapter'] == chapter:
-                    # print(f"Chapter found: {chap['chapter']}")  # Debug print
-                    # Iterate through the verses
-                    for verse in chap.get('verses', []):
-                        verse_num = verse['verse']
-                        # Check if the verse is within the specified range
-                        if (start_verse is None or verse_num >= start_verse) and (end_verse is None or verse_num <= end_verse):
-                            verses.append({'verse': verse_num, 'text': verse['text']})
-                            # print(f"Added verse: {verse_num} - {verse['text']}")  # Debug print
-                    break  # Exit after finding the correct chapter
-            break  # Exit after finding the correct book
-    
     # Debugging output
     if not verses:
         print(f"No verses found for {book_name} Chapter {chapter}.")
@@ -83,6 +38,21 @@ def query_mal_bible_json(book_name: str, chapter: int, start_verse: Optional[int
     
     return verses
 
+def query_mal_bible_batch(references: List[Tuple[str, int, Optional[int], Optional[int]]]) -> List[List[Dict[str, str]]]:
+    """
+    Fetches many (book, chapter, start_verse, end_verse) references from the Mal1910 verse store in one pass.
+    Book names may be given in any language the book resolver knows.
+    """
+    try:
+        store = get_store('mal1910')
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return [[] for _ in references]
+    references = [(resolve_book_name(book_name, 'mal1910') or book_name, chapter, start_verse, end_verse)
+                  for book_name, chapter, start_verse, end_verse in references]
+    return [[{'verse': verse_num, 'text': text} for verse_num, text in verses]
+            for verses in store.get_verses_batch(references)]
+
 def get_books() -> Dict[str, List[str]]:
     """
     Displays Old Testament and New Testament books without fetching from the Mal1910.json file.
@@ -107,22 +77,32 @@ def get_books() -> Dict[str, List[str]]:
 
 def get_chapters(book_name: str) -> Dict[int, List[str]]:
     """
-    Fetches all chapters and their verses for a given book from the Mal1910.json file.
+    Fetches all chapters and their verses for a given book from the Mal1910 verse store.
     """
-    data = load_json_data('database/Mal1910.json')
+    try:
+        store = get_store('mal1910')
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return {}
+
     chapters = {}
-    
-    for book in data['books']:
-        if book['name'] == book_name:
-            for chap in book['chapters']:
-                chapter_num = chap['chapter']
-                verses = []
-                for verse in chap['verses']:
-                    verse_text = f'<span class="verse-num">{verse["verse"]}</span> {verse["text"]}'
-                    verses.append(verse_text)
-                chapters[chapter_num] = verses
+    for chapter_num, verses in store.iter_chapters(book_name):
+        chapters[chapter_num] = [f'<span class="verse-num">{verse_num}</span> {text}' for verse_num, text in verses]
     return chapters
 
+def get_chapter(book_name: str, chapter: int) -> List[str]:
+    """
+    Fetches the rendered verses of a single chapter from the Mal1910 verse store.
+    Chapters are kept in the shared, size-bounded chapter cache.
+    """
+    return chapter_cache.get_chapter('mal1910', book_name, chapter)
+
+def get_chapter_numbers(book_name: str) -> List[int]:
+    """
+    Returns the chapter numbers of a book without loading its verses.
+    """
+    return chapter_cache.get_chapter_numbers('mal1910', book_name)
+
 if __name__ == "__main__":
     # Sample query to test the function
     verses = query_mal_bible_json('Genesis', 1, 1, 10)
@@ -0,0 +1,100 @@
+"""
+Recent-queries lists kept in memory, backed by the analysis store.
+
+    per language  the last RECENT_QUERIES_SIZE analyses stored for the language. A ring buffer
+                  filled from the store on first use and pushed to whenever this process stores an
+                  analysis; every RECENT_QUERIES_REFRESH seconds it is reloaded (one index seek)
+                  to pick up analyses stored by other worker processes.
+    per user      the last USER_QUERIES_SIZE references a visitor looked up, in the user_queries
+                  table. The session only holds the user id; the lists of the USER_CACHE_SIZE
+                  most recent visitors stay in memory.
+
+Reading either list is a memory read in the common case.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List
+import analysis_cache
+from analysis_store import WriterBusy
+
+RECENT_QUERIES_SIZE = int(os.getenv("RECENT_QUERIES_SIZE", "8"))
+USER_QUERIES_SIZE = int(os.getenv("USER_QUERIES_SIZE", "5"))
+RECENT_QUERIES_REFRESH = float(os.getenv("RECENT_QUERIES_REFRESH", "30"))
+USER_CACHE_SIZE = 10000
+
+_lock = threading.Lock()
+_feeds: Dict[str, Deque[str]] = {}       # language -> references, newest first
+_loaded_at: Dict[str, float] = {}
+_users: OrderedDict = OrderedDict()      # user id -> references, newest first; least recent user first
+
+
+def _push(items: Deque[str], reference: str):
+    if reference in items:
+        items.remove(reference)
+    items.appendleft(reference)
+
+
+def record_analysis(reference: str, language: str):
+    """
+    Adds a newly stored analysis to its language's list.
+    """
+    with _lock:
+        feed = _feeds.get(language)
+        if feed is not None:
+            _push(feed, reference)
+
+
+def recent(language: str) -> List[str]:
+    """
+    References of the analyses stored last for a language, newest first.
+    """
+    now = time.time()
+    with _lock:
+        feed = _feeds.get(language)
+        if feed is not None and now - _loaded_at[language] < RECENT_QUERIES_REFRESH:
+            return list(feed)
+    references = analysis_cache.get_store().recent(language, RECENT_QUERIES_SIZE)
+    with _lock:
+        _feeds[language] = deque(references, maxlen=RECENT_QUERIES_SIZE)
+        _loaded_at[language] = now
+    return references
+
+
+def _user_list(user_id: str) -> Deque[str]:
+    with _lock:
+        items = _users.get(user_id)
+        if items is not None:
+            _users.move_to_end(user_id)
+            return items
+    items = deque(analysis_cache.get_store().user_recent(user_id, USER_QUERIES_SIZE), maxlen=USER_QUERIES_SIZE)
+    with _lock:
+        items = _users.setdefault(user_id, items)
+        _users.move_to_end(user_id)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return items
+
+
+def for_user(user_id: str) -> List[str]:
+    """
+    References a user looked up last, newest first.
+    """
+    items = _user_list(user_id)
+    with _lock:
+        return list(items)
+
+
+def add_for_user(user_id: str, reference: str):
+    """
+    Records a user's lookup; the store is updated in the background, or not at all when the
+    writer is overloaded (the in-memory list is still updated).
+    """
+    items = _user_list(user_id)
+    with _lock:
+        _push(items, reference)
+    try:
+        analysis_cache.get_store().add_user_query(user_id, reference, USER_QUERIES_SIZE)
+    except WriterBusy as e:
+        print(f"Recent query not stored: {e}")
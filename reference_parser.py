@@ -0,0 +1,135 @@
+"""
+Deterministic parser for well-formed Bible references in English, Korean, Nepali and Malayalam.
+
+Handles book names in any form the book resolver knows, native digits, ranges and whole chapters:
+    John 3:16-18, 1 Cor 13, II Kings 2.11, John chapter 3 verse 16
+    요한복음 3:16, 요 3장 16-18절, 시편 23편, 요한복음 3장 16절부터 18절까지
+    यूहन्ना ३:१६, यूहन्ना ३ अध्याय १६ पद
+    യോഹന്നാൻ 3:16, യോഹന്നാൻ 3 അധ്യായം 16 വാക്യം
+
+parse_reference() returns None for anything it cannot parse with certainty (free text,
+misspelled book names, multi-chapter ranges, verse lists) or that does not exist in the
+translation, so callers can fall back to the LLM parser. Book names are matched exactly or
+by prefix only: with fuzzy matching "love 1" would be read as Luke 1.
+"""
+import re
+import sqlite3
+import unicodedata
+from typing import NamedTuple, Optional
+import canon
+from book_resolver import resolve_book
+from verse_store import get_store
+
+
+class ParsedReference(NamedTuple):
+    book: int                   # canonical book number
+    chapter: int
+    start_verse: Optional[int]  # None for a whole chapter
+    end_verse: Optional[int]
+
+
+# Words that introduce a chapter or verse number, or follow it (3장, 16절, 23편)
+_LATIN_MARKERS_RE = re.compile(r'(?<![a-z])(?:chapters?|chap|ch|verses?|ver|vv|vs|v)(?![a-z])')
+_NATIVE_MARKERS_RE = re.compile(r'장|절|편|अध्याय|पदहरू|पद|അധ്യായം|വാക്യങ്ങൾ|വാക്യം')
+# Words and symbols that mark a verse range ("from" words are dropped, "until" words become the dash)
+_RANGE_RE = re.compile(r'(?<![a-z])(?:to|through|thru|until)(?![a-z])|[~\u2013\u2014]|부터|देखि|മുതൽ')
+_RANGE_END_RE = re.compile(r'까지|सम्म|വരെ')
+_SEPARATORS_RE = re.compile(r'[:.,;]')
+_TOKEN_RE = re.compile(r'\d+|[-:]')
+_LEFTOVER_RE = re.compile(r'[\d\s:\-]*')
+
+_BOOK_PREFIX_RE = re.compile(r'\s*(?:[1-3]\s*)?')
+_BOOK_TRAILER_RE = re.compile(r'(?:[\s,.:]|(?<![a-z])(?:chapter|chap|ch)(?![a-z])|अध्याय|അധ്യായം)+$')
+
+
+def _ascii_digits(text: str) -> str:
+    return ''.join(str(unicodedata.decimal(char)) if char.isdecimal() and not char.isascii() else char
+                   for char in text)
+
+
+def _split_book(text: str):
+    """
+    Splits "1 John 3:16" into ("1 John", "3:16"): the book is everything before the first
+    number that is not a numeric book prefix.
+    """
+    start = _BOOK_PREFIX_RE.match(text).end()
+    match = re.search(r'\d', text[start:])
+    if match is None:
+        return text, ''
+    split = start + match.start()
+    return _BOOK_TRAILER_RE.sub('', text[:split]), text[split:]
+
+
+def _tokens(numbers: str):
+    """
+    Reduces the chapter/verse part to a list of numbers, ':' separators and '-' range marks,
+    or returns None if it contains anything else.
+    """
+    numbers = _RANGE_END_RE.sub(' ', numbers)
+    numbers = _RANGE_RE.sub(' - ', numbers)
+    numbers = _LATIN_MARKERS_RE.sub(' : ', numbers)
+    numbers = _NATIVE_MARKERS_RE.sub(' : ', numbers)
+    numbers = _SEPARATORS_RE.sub(' : ', numbers)
+    if not _LEFTOVER_RE.fullmatch(numbers):
+        return None
+    tokens = []
+    for token in _TOKEN_RE.findall(numbers):
+        if token == ':' and (not tokens or tokens[-1] in (':', '-')):
+            continue
+        if token == '-' and tokens and tokens[-1] == ':':
+            tokens.pop()
+        tokens.append(token)
+    while tokens and tokens[-1] == ':':
+        tokens.pop()
+    return tokens
+
+
+def _chapter_and_verses(tokens):
+    numbers = [int(token) for token in tokens if token.isdigit()]
+    shape = ''.join('n' if token.isdigit() else token for token in tokens)
+    if shape == 'n':
+        return numbers[0], None, None
+    if shape in ('n:n', 'nn'):
+        return numbers[0], numbers[1], numbers[1]
+    if shape in ('n:n-n', 'nn-n'):
+        return numbers[0], numbers[1], numbers[2]
+    # Chapter ranges, cross-chapter ranges and verse lists are left to the LLM
+    return None
+
+
+def parse_reference(text: str, translation: str) -> Optional[ParsedReference]:
+    """
+    Parses a reference and checks it against the translation's chapter and verse counts.
+    """
+    text = _ascii_digits(unicodedata.normalize('NFC', text).casefold()).strip()
+    if not text:
+        return None
+    book_text, numbers = _split_book(text)
+    if not numbers:
+        return None
+    book = resolve_book(book_text, fuzzy=False)
+    if book is None:
+        return None
+    tokens = _tokens(numbers)
+    if not tokens:
+        return None
+    parsed = _chapter_and_verses(tokens)
+    if parsed is None:
+        return None
+    chapter, start_verse, end_verse = parsed
+    if start_verse is not None and not 1 <= start_verse <= end_verse:
+        return None
+
+    try:
+        store = get_store(translation)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return None
+    book_name = canon.book_name(book, translation)
+    if start_verse is None and chapter > 1 and store.chapter_count(book_name) == 1:
+        # "Jude 5", "3 John 4": single-chapter books are cited by verse alone
+        chapter, start_verse, end_verse = 1, chapter, chapter
+    verse_count = store.verse_count(book_name, chapter)
+    if verse_count == 0 or (end_verse is not None and end_verse > verse_count):
+        return None
+    return ParsedReference(book, chapter, start_verse, end_verse)
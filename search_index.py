@@ -0,0 +1,197 @@
+import html
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Dict, List, Tuple
+from canon import LANGUAGE_TRANSLATIONS
+from verse_store import VerseStore, get_store
+
+# BM25 ranking parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+MAX_PAGE_SIZE = 50
+SNIPPET_CHARS = 240
+
+# A word is a run of letters/digits plus the combining marks of Devanagari and Malayalam,
+# which \w alone would split on (vowel signs and viramas are not alphanumeric).
+_WORD_RE = re.compile(r'[\w\u0900-\u0963\u0966-\u097f\u0d00-\u0d7f\u200c\u200d]+')
+_HANGUL_RE = re.compile(r'[\uac00-\ud7a3]')
+_JOINERS_RE = re.compile(r'[\u200c\u200d]')
+
+
+def _normalize(word: str) -> str:
+    """
+    NFC-normalizes and case-folds a word and drops zero-width joiners, so Malayalam
+    chillu spellings and Devanagari variants with or without joiners match each other.
+    """
+    return _JOINERS_RE.sub('', unicodedata.normalize('NFC', word).casefold())
+
+
+def _word_terms(word: str, query: bool = False) -> List[str]:
+    """
+    Returns the index terms for one normalized word.
+    Hangul words carry attached particles (하나님이, 하나님을), so they are indexed as
+    character bigrams, and each syllable also as a unigram so a one-syllable query (빛)
+    finds the words that contain it (빛이). A query word of two or more syllables is looked up
+    by its bigrams only. Every other script is indexed as whole words.
+    """
+    if not word:
+        return []
+    if _HANGUL_RE.search(word):
+        if len(word) == 1:
+            return [word]
+        bigrams = [word[i:i + 2] for i in range(len(word) - 1)]
+        return bigrams if query else list(word) + bigrams
+    return [word]
+
+
+def tokenize(text: str, query: bool = False) -> List[str]:
+    """
+    Splits text into index terms (or, with query, search terms) using language-appropriate rules.
+    """
+    terms = []
+    for match in _WORD_RE.finditer(text):
+        terms.extend(_word_terms(_normalize(match.group()), query))
+    return terms
+
+
+class SearchIndex:
+    """
+    In-process inverted index over one translation's verse store, ranked with BM25.
+    Postings are flat arrays of verse slots and term frequencies.
+    """
+
+    def __init__(self, store: VerseStore):
+        self.store = store
+        postings: Dict[str, Tuple[array, array]] = {}
+        doc_lengths = array('H')
+        for slot in range(len(store)):
+            terms = tokenize(store.text(slot))
+            doc_lengths.append(min(len(terms), 65535))
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = (array('I'), array('H'))
+                    postings[term] = entry
+                entry[0].append(slot)
+                entry[1].append(count)
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    def _idf(self, term: str) -> float:
+        n = len(self.doc_lengths)
+        df = len(self.postings[term][0])
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, page: int = 1, page_size: int = 20) -> Dict:
+        """
+        Returns verses containing every query term, best BM25 score first.
+        """
+        page = max(page, 1)
+        page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+        terms = list(dict.fromkeys(tokenize(query, query=True)))
+        response = {'query': query, 'translation': self.store.translation, 'page': page,
+                    'page_size': page_size, 'total': 0, 'results': []}
+        if not terms or any(term not in self.postings for term in terms):
+            return response
+
+        # Intersect starting from the rarest term
+        terms.sort(key=lambda term: len(self.postings[term][0]))
+        scores: Dict[int, float] = {}
+        for i, term in enumerate(terms):
+            slots, freqs = self.postings[term]
+            idf = self._idf(term)
+            next_scores = {}
+            for slot, tf in zip(slots, freqs):
+                if i and slot not in scores:
+                    continue
+                norm = 1 - BM25_B + BM25_B * self.doc_lengths[slot] / self.avg_doc_length
+                next_scores[slot] = scores.get(slot, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+            scores = next_scores
+            if not scores:
+                return response
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        response['total'] = len(ranked)
+        query_terms = set(terms)
+        for slot, score in ranked[(page - 1) * page_size:page * page_size]:
+            book, chapter, verse = self.store.locate(slot)
+            text = self.store.text(slot)
+            response['results'].append({
+                'book': book,
+                'chapter': chapter,
+                'verse': verse,
+                'text': text,
+                'snippet': highlight(text, query_terms),
+                'score': round(score, 4),
+            })
+        return response
+
+
+def highlight(text: str, query_terms: set) -> str:
+    """
+    Returns HTML-escaped text with matching words wrapped in <mark>, trimmed around the first match.
+    """
+    spans = [(m.start(), m.end()) for m in _WORD_RE.finditer(text)
+             if query_terms.intersection(_word_terms(_normalize(m.group())))]
+    start = 0
+    end = len(text)
+    if len(text) > SNIPPET_CHARS:
+        first = spans[0][0] if spans else 0
+        start = max(0, first - SNIPPET_CHARS // 3)
+        end = min(len(text), start + SNIPPET_CHARS)
+
+    parts = ['\u2026'] if start > 0 else []
+    position = start
+    for span_start, span_end in spans:
+        if span_start < start or span_end > end:
+            continue
+        parts.append(html.escape(text[position:span_start]))
+        parts.append(f'<mark>{html.escape(text[span_start:span_end])}</mark>')
+        position = span_end
+    parts.append(html.escape(text[position:end]))
+    if end < len(text):
+        parts.append('\u2026')
+    return ''.join(parts)
+
+
+_indexes: Dict[str, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(translation: str) -> SearchIndex:
+    """
+    Returns the search index for a translation, building it on first use.
+    """
+    index = _indexes.get(translation)
+    if index is not None:
+        return index
+    with _indexes_lock:
+        index = _indexes.get(translation)
+        if index is None:
+            index = SearchIndex(get_store(translation))
+            _indexes[translation] = index
+            print(f"Built search index for {translation}: {len(index.postings)} terms")
+    return index
+
+
+def search_verses(query: str, language: str = 'en', page: int = 1, page_size: int = 20) -> Dict:
+    """
+    Full-text search over the translation used for a session language.
+    """
+    translation = LANGUAGE_TRANSLATIONS.get(language, 'kjv')
+    try:
+        index = get_index(translation)
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return {'query': query, 'translation': translation, 'page': page, 'page_size': page_size,
+                'total': 0, 'results': []}
+    return index.search(query, page, page_size)
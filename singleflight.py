@@ -0,0 +1,126 @@
+"""
+Coalescing of identical in-flight work.
+
+When many users ask for the same passage before its first analysis is stored (a shared link
+to Psalm 23), each request would make its own LLM calls and store its own copy of the analysis.
+A Group runs one computation per key at a time: requests for a key that is already being
+computed wait for that computation and share its result (or its exception).
+
+    PARSES = singleflight.Group('parse')
+    reference = PARSES.do(('kjv', 'psalm 23'), lambda: step2_parse_bible_reference('psalm 23'))
+
+Followers get a shallow copy of the leader's result, so they can add fields to a response
+dict without changing anyone else's. A follower that waits longer than SINGLEFLIGHT_WAIT
+seconds (default 120) stops waiting and runs the computation itself.
+"""
+import copy
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+import pipeline_metrics
+
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", "120"))
+
+_groups: Dict[str, 'Group'] = {}
+
+
+class Flight:
+    """
+    One in-flight computation and the requests waiting for it.
+    """
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    """
+    Runs at most one computation per key at a time and counts the calls it saved.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Flight] = {}
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'failures': 0, 'wait_timeouts': 0}
+        _groups[name] = self
+
+    def start(self, key: Hashable) -> Tuple[Flight, bool]:
+        """
+        Joins the flight for key, starting one if none is in progress. Returns (flight, leader):
+        the leader must call finish(); the others call wait(). do() covers the common case, this
+        is for callers such as generators that produce the result over time.
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._stats['coalesced'] += 1
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            self._stats['executions'] += 1
+            return flight, True
+
+    def finish(self, key: Hashable, flight: Flight, result: Any = None, error: BaseException = None):
+        """
+        Publishes the leader's result (or exception) and releases the waiters.
+        """
+        flight.result, flight.error = result, error
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is not None:
+                self._stats['failures'] += 1
+        flight.finished.set()
+
+    def wait(self, flight: Flight, timeout: float = SINGLEFLIGHT_WAIT) -> Any:
+        """
+        Waits for a flight and returns a copy of its result, or re-raises the leader's exception.
+        Raises TimeoutError if the leader has not finished in time.
+        """
+        with pipeline_metrics.span('wait'):
+            finished = flight.finished.wait(timeout)
+        if not finished:
+            with self._lock:
+                self._stats['wait_timeouts'] += 1
+            raise TimeoutError(f"{self.name} still running after {timeout:g}s")
+        if flight.error is not None:
+            raise flight.error
+        return copy.copy(flight.result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Returns fn(), or the result of the identical call already in flight.
+        """
+        flight, leader = self.start(key)
+        if not leader:
+            try:
+                return self.wait(flight)
+            except TimeoutError as e:
+                print(f"{e}, running it again")
+                return fn()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Returns the counters of every group; coalesced is the number of calls saved.
+    """
+    return {name: group.get_stats() for name, group in _groups.items()}
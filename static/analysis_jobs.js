@@ -0,0 +1,45 @@
+// Runs a reference search as a background job (see job_queue.py) and polls for the result,
+// so no server thread is held while the analysis is generated. Stored analyses open at once.
+function submitAnalysisJob(event, lang) {
+    if (!window.fetch) return;  // Post the form as before
+    event.preventDefault();
+    const form = event.target;
+    const reference = form.querySelector('[name="reference"]').value;
+    const loader = document.getElementById('lineLoader');
+    if (loader) loader.style.width = '100%';
+
+    fetch('/jobs/analysis', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ reference: reference, lang: lang, priority: 'interactive' })
+    })
+        .then(response => response.json().then(data => ({ ok: response.ok, data: data })))
+        .then(({ ok, data }) => {
+            if (!ok) {
+                if (loader) loader.style.width = '0';
+                alert(data.error);
+            } else if (data.redirect) {
+                window.location.href = data.redirect;
+            } else {
+                pollAnalysisJob(data.status_url, 1000);
+            }
+        })
+        .catch(() => form.submit());
+}
+
+function pollAnalysisJob(statusUrl, delay) {
+    setTimeout(() => {
+        fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (data.redirect) {
+                    window.location.href = data.redirect;
+                } else if (data.status === 'queued' || data.status === 'running') {
+                    pollAnalysisJob(statusUrl, Math.min(delay * 1.5, 3000));
+                } else {
+                    alert(data.error);
+                }
+            })
+            .catch(() => pollAnalysisJob(statusUrl, 3000));
+    }, delay);
+}
@@ -0,0 +1,19 @@
+from book_resolver import resolve_book
+from reference_parser import parse_reference
+
+
+def test_common_words_are_not_references():
+    # Fuzzy book matching would read these as Luke 1 and Hosea 2
+    for text in ("love 1", "hope 2", "Love 1", "hope 2:3"):
+        assert parse_reference(text, 'kjv') is None
+
+
+def test_misspelled_books_are_left_to_the_llm_parser():
+    assert resolve_book("Phillipians") == 50
+    assert parse_reference("Phillipians 4:13", 'kjv') is None
+
+
+def test_short_words_do_not_resolve_fuzzily():
+    assert resolve_book("love") is None
+    assert resolve_book("hope") is None
+    assert resolve_book("Revelatoins") == 66
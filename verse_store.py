@@ -0,0 +1,302 @@
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+import bible_binary
+import bible_db
+
+# Source description for every translation served by the app.
+# kind is one of 'sqlite' (a *_books / *_verses database), 'mal_json' or 'ne_json'.
+# JSON translations list the database written by ingest_bibles.py under 'compiled';
+# it is used instead of the raw JSON whenever it exists.
+# 'binary' is the memory-mapped file written by bible_binary.py, preferred over every other source.
+TRANSLATIONS = {
+    'kjv': {'kind': 'sqlite', 'path': 'database/KJV.db', 'prefix': 'KJV', 'binary': 'database/KJV.bbin'},
+    'korrv': {'kind': 'sqlite', 'path': 'database/KorRV.db', 'prefix': 'KorRV', 'binary': 'database/KorRV.bbin'},
+    'mal1910': {'kind': 'mal_json', 'path': 'database/Mal1910.json', 'binary': 'database/Mal1910.bbin',
+                'compiled': {'kind': 'sqlite', 'path': 'database/Mal1910.db', 'prefix': 'Mal1910'}},
+    'ne': {'kind': 'ne_json', 'path': 'database/ERV-NE-SimpleJSON', 'binary': 'database/NE_bible.bbin',
+           'compiled': {'kind': 'sqlite', 'path': 'database/NE_bible.db', 'prefix': 'NE'}},
+}
+
+
+class VerseStore:
+    """
+    Read-only, array-backed verse store for a single translation.
+
+    Verses are kept in canonical order in a handful of flat arrays:
+    - book_chapter_start[b] .. book_chapter_start[b + 1] are the chapter slots of book b
+    - chapter_verse_start[c] .. chapter_verse_start[c + 1] are the verse slots of chapter slot c
+    - text_offsets[v] .. text_offsets[v + 1] is the UTF-8 text of verse slot v in text_pool
+    Looking up a verse or a range is a couple of array reads instead of a walk over the parsed source.
+    The arrays may be memoryviews over a memory-mapped .bbin file, in which case mapping is that file.
+    """
+
+    def __init__(self, translation: str, book_names: List[str], book_chapter_start, chapter_numbers,
+                 chapter_verse_start, verse_numbers, text_offsets, text_pool, mapping=None):
+        self.translation = translation
+        self.mapping = mapping
+        self.book_names = book_names
+        self.book_index = {name: i for i, name in enumerate(book_names)}
+        self.book_chapter_start = book_chapter_start
+        self.chapter_numbers = chapter_numbers
+        self.chapter_verse_start = chapter_verse_start
+        self.verse_numbers = verse_numbers
+        self.text_offsets = text_offsets
+        self.text_pool = text_pool
+
+    def __len__(self) -> int:
+        return len(self.verse_numbers)
+
+    def has_book(self, book_name: str) -> bool:
+        return book_name in self.book_index
+
+    def _chapter_slot(self, book_name: str, chapter: int) -> Optional[int]:
+        """
+        Returns the chapter slot for (book, chapter), or None if it does not exist.
+        Chapters are almost always numbered 1..n, so the direct position is tried first.
+        """
+        book = self.book_index.get(book_name)
+        if book is None:
+            return None
+        lo = self.book_chapter_start[book]
+        hi = self.book_chapter_start[book + 1]
+        slot = lo + chapter - 1
+        if lo <= slot < hi and self.chapter_numbers[slot] == chapter:
+            return slot
+        slot = bisect_left(self.chapter_numbers, chapter, lo, hi)
+        if slot < hi and self.chapter_numbers[slot] == chapter:
+            return slot
+        return None
+
+    def _text(self, slot: int) -> str:
+        return str(self.text_pool[self.text_offsets[slot]:self.text_offsets[slot + 1]], 'utf-8')
+
+    def _verse_slots(self, chapter_slot: int, start_verse: Optional[int], end_verse: Optional[int]) -> range:
+        lo = self.chapter_verse_start[chapter_slot]
+        hi = self.chapter_verse_start[chapter_slot + 1]
+        if start_verse is not None:
+            first = lo + start_verse - 1
+            if not (lo <= first < hi and self.verse_numbers[first] == start_verse):
+                first = bisect_left(self.verse_numbers, start_verse, lo, hi)
+            lo = max(lo, first)
+        if end_verse is not None:
+            last = lo + end_verse - self.verse_numbers[lo] if lo < hi else lo
+            if lo <= last < hi and self.verse_numbers[last] == end_verse:
+                hi = last + 1
+            else:
+                hi = bisect_right(self.verse_numbers, end_verse, lo, hi)
+        return range(lo, hi)
+
+    def get_verses(self, book_name: str, chapter: int, start_verse: Optional[int] = None,
+                   end_verse: Optional[int] = None) -> List[Tuple[int, str]]:
+        """
+        Returns (verse number, text) pairs for a chapter or an inclusive verse range.
+        """
+        chapter_slot = self._chapter_slot(book_name, chapter)
+        if chapter_slot is None:
+            return []
+        return [(self.verse_numbers[v], self._text(v))
+                for v in self._verse_slots(chapter_slot, start_verse, end_verse)]
+
+    def get_verses_batch(self, references: List[Tuple[str, int, Optional[int], Optional[int]]]) -> List[List[Tuple[int, str]]]:
+        """
+        Resolves many (book, chapter, start_verse, end_verse) references in one sorted sweep.
+        Results are returned in the same order as the references.
+        """
+        results = [[] for _ in references]
+        order = sorted(range(len(references)),
+                       key=lambda i: (self.book_index.get(references[i][0], -1), references[i][1]))
+        last_key = None
+        chapter_slot = None
+        for i in order:
+            book_name, chapter, start_verse, end_verse = references[i]
+            # References to the same chapter share one chapter-slot lookup
+            if (book_name, chapter) != last_key:
+                last_key = (book_name, chapter)
+                chapter_slot = self._chapter_slot(book_name, chapter)
+            if chapter_slot is not None:
+                results[i] = [(self.verse_numbers[v], self._text(v))
+                              for v in self._verse_slots(chapter_slot, start_verse, end_verse)]
+        return results
+
+    def iter_chapters(self, book_name: str) -> Iterator[Tuple[int, List[Tuple[int, str]]]]:
+        """
+        Yields (chapter number, [(verse number, text), ...]) for every chapter of a book.
+        """
+        book = self.book_index.get(book_name)
+        if book is None:
+            return
+        for slot in range(self.book_chapter_start[book], self.book_chapter_start[book + 1]):
+            verses = [(self.verse_numbers[v], self._text(v))
+                      for v in self._verse_slots(slot, None, None)]
+            yield self.chapter_numbers[slot], verses
+
+    def locate(self, slot: int) -> Tuple[str, int, int]:
+        """
+        Returns (book name, chapter, verse) for a verse slot.
+        """
+        chapter_slot = bisect_right(self.chapter_verse_start, slot) - 1
+        book = bisect_right(self.book_chapter_start, chapter_slot) - 1
+        return self.book_names[book], self.chapter_numbers[chapter_slot], self.verse_numbers[slot]
+
+    def text(self, slot: int) -> str:
+        return self._text(slot)
+
+    def chapter_list(self, book_name: str) -> List[int]:
+        """
+        Returns the chapter numbers of a book in order.
+        """
+        book = self.book_index.get(book_name)
+        if book is None:
+            return []
+        return list(self.chapter_numbers[self.book_chapter_start[book]:self.book_chapter_start[book + 1]])
+
+    def verse_count(self, book_name: str, chapter: int) -> int:
+        """
+        Returns the number of verses in a chapter, or 0 if it does not exist.
+        """
+        chapter_slot = self._chapter_slot(book_name, chapter)
+        if chapter_slot is None:
+            return 0
+        return self.chapter_verse_start[chapter_slot + 1] - self.chapter_verse_start[chapter_slot]
+
+    def chapter_count(self, book_name: str) -> int:
+        book = self.book_index.get(book_name)
+        if book is None:
+            return 0
+        return self.book_chapter_start[book + 1] - self.book_chapter_start[book]
+
+
+class _StoreBuilder:
+    """
+    Accumulates verses (in canonical order) into the flat arrays used by VerseStore.
+    """
+
+    def __init__(self, translation: str):
+        self.translation = translation
+        self.book_names = []
+        self.book_chapter_start = array('I', [0])
+        self.chapter_numbers = array('H')
+        self.chapter_verse_start = array('I', [0])
+        self.verse_numbers = array('H')
+        self.text_offsets = array('I', [0])
+        self.text_pool = bytearray()
+        self._current_book = None
+        self._current_chapter = None
+
+    def add_verse(self, book_name: str, chapter: int, verse: int, text: str):
+        if book_name != self._current_book:
+            self._close_chapter()
+            self._close_book()
+            self.book_names.append(book_name)
+            self._current_book = book_name
+        if chapter != self._current_chapter:
+            self._close_chapter()
+            self.chapter_numbers.append(chapter)
+            self._current_chapter = chapter
+        self.verse_numbers.append(verse)
+        self.text_pool += text.encode('utf-8')
+        self.text_offsets.append(len(self.text_pool))
+
+    def _close_chapter(self):
+        if self._current_chapter is not None:
+            self.chapter_verse_start.append(len(self.verse_numbers))
+            self._current_chapter = None
+
+    def _close_book(self):
+        if self._current_book is not None:
+            self.book_chapter_start.append(len(self.chapter_numbers))
+            self._current_book = None
+
+    def build(self) -> VerseStore:
+        self._close_chapter()
+        self._close_book()
+        return VerseStore(self.translation, self.book_names, self.book_chapter_start, self.chapter_numbers,
+                          self.chapter_verse_start, self.verse_numbers, self.text_offsets, bytes(self.text_pool))
+
+
+def _load_sqlite(builder: _StoreBuilder, path: str, prefix: str):
+    query = f"""
+    SELECT {prefix}_books.name, {prefix}_verses.chapter, {prefix}_verses.verse, {prefix}_verses.text
+    FROM {prefix}_verses
+    JOIN {prefix}_books ON {prefix}_verses.book_id = {prefix}_books.id
+    ORDER BY {prefix}_books.id, {prefix}_verses.chapter, {prefix}_verses.verse
+    """
+    with bible_db.get_cursor(path) as cursor:
+        cursor.execute(query)
+        for name, chapter, verse, text in cursor:
+            builder.add_verse(name, int(chapter), int(verse), text or '')
+
+
+def _load_mal_json(builder: _StoreBuilder, path: str):
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    for book in data['books']:
+        for chap in book.get('chapters', []):
+            for verse in chap.get('verses', []):
+                builder.add_verse(book['name'], int(chap['chapter']), int(verse['verse']), verse['text'])
+
+
+def _load_ne_json(builder: _StoreBuilder, path: str):
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    for book in data['osis'][0]['osisText'][0]['div']:
+        for chap in book['chapter']:
+            for verse in chap['verse']:
+                builder.add_verse(book['name']['_value'], int(chap['cnumber']), int(verse['vnumber']), verse['_text'])
+
+
+_LOADERS = {
+    'sqlite': lambda builder, source: _load_sqlite(builder, source['path'], source['prefix']),
+    'mal_json': lambda builder, source: _load_mal_json(builder, source['path']),
+    'ne_json': lambda builder, source: _load_ne_json(builder, source['path']),
+}
+
+_stores: Dict[str, VerseStore] = {}
+_stores_lock = threading.Lock()
+
+
+def load_store(translation: str, use_binary: bool = True, use_compiled: bool = True) -> VerseStore:
+    """
+    Builds a VerseStore for a translation from its source file.
+    A .bbin file is mapped in place when present, so worker processes share its pages.
+    Without use_compiled a JSON translation is read from its JSON even when it has been compiled.
+    """
+    source = TRANSLATIONS[translation]
+    binary = source.get('binary')
+    if use_binary and binary and os.path.exists(binary) and os.path.getsize(binary) > 0:
+        book_names, sections, mapping = bible_binary.open_binary(binary)
+        return VerseStore(translation, book_names, mapping=mapping, **sections)
+    compiled = source.get('compiled')
+    if use_compiled and compiled and os.path.exists(compiled['path']) and os.path.getsize(compiled['path']) > 0:
+        source = compiled
+    builder = _StoreBuilder(translation)
+    _LOADERS[source['kind']](builder, source)
+    return builder.build()
+
+
+def get_store(translation: str) -> VerseStore:
+    """
+    Returns the process-wide VerseStore for a translation, loading it on first use.
+    """
+    store = _stores.get(translation)
+    if store is not None:
+        return store
+    with _stores_lock:
+        store = _stores.get(translation)
+        if store is None:
+            store = load_store(translation)
+            _stores[translation] = store
+            print(f"Loaded {len(store)} verses for {translation}")
+    return store
+
+
+def clear_stores():
+    """
+    Drops every loaded store. Useful for testing or if a source file is updated.
+    """
+    with _stores_lock:
+        _stores.clear()